@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+批量接收模块
+请求体为 NDJSON（application/x-ndjson）或顶层 JSON 数组时按批量消息处理：边读取请求体边解析出单条消息，
+已解析的部分立即释放，每批占用的内存只与单条消息的大小和并发处理的条数有关，与请求体大小无关
+"""
+
+import re
+import json
+import codecs
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+# 批量接收默认参数，可通过 ingest.batch 配置覆盖
+DEFAULT_BATCH_SETTINGS = {
+    "max_items": 10000,          # 每批最多处理的消息数，超出部分不再读取
+    "max_item_bytes": 1048576,   # 单条消息的最大字节数
+    "concurrency": 32            # 同步投递时并发处理的消息数
+}
+
+# NDJSON 的 Content-Type
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+# 解析结果：(消息, 错误)，解析失败的消息为 None 并带有错误描述
+BatchItem = Tuple[Any, Optional[str]]
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class BatchFormatError(ValueError):
+    """批量请求体格式错误，之后的内容无法继续解析"""
+
+
+def is_ndjson(content_type: str) -> bool:
+    """判断 Content-Type 是否为 NDJSON"""
+    return any(ndjson_type in content_type for ndjson_type in NDJSON_TYPES)
+
+
+async def peek_stream(stream: AsyncIterator[bytes]) -> Tuple[bytes, AsyncIterator[bytes]]:
+    """读取到请求体的第一个非空白字节
+
+    Args:
+        stream: 请求体分块
+
+    Returns:
+        (第一个非空白字节，请求体为空时为 b""；包含已读取部分的完整请求体分块)
+    """
+    consumed: List[bytes] = []
+    first = b""
+    async for chunk in stream:
+        consumed.append(chunk)
+        stripped = chunk.lstrip()
+        if stripped:
+            first = stripped[:1]
+            break
+
+    async def replay() -> AsyncIterator[bytes]:
+        for chunk in consumed:
+            yield chunk
+        async for chunk in stream:
+            yield chunk
+
+    return first, replay()
+
+
+async def iter_ndjson(stream: AsyncIterator[bytes], loads: Callable[[bytes], Any],
+                      max_item_bytes: int) -> AsyncIterator[BatchItem]:
+    """逐行解析 NDJSON，空行被忽略，单行格式错误或过长只影响该行
+
+    Args:
+        stream: 请求体分块
+        loads: JSON解码函数
+        max_item_bytes: 单行的最大字节数
+
+    Yields:
+        (消息, 错误)
+    """
+    buffer = bytearray()
+    discarding = False
+
+    def decode(line: bytes) -> BatchItem:
+        # 完整落在一个分块内的行同样要检查长度
+        if len(line) > max_item_bytes:
+            return None, f"单条消息超过 {max_item_bytes} 字节"
+        try:
+            return loads(line), None
+        except ValueError as e:
+            return None, f"JSON格式错误: {e}"
+
+    async for chunk in stream:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if discarding:
+                # 过长的行已经报告，丢弃到行尾
+                discarding = False
+            elif line.strip():
+                yield decode(line)
+        del buffer[:start]
+
+        if not discarding and len(buffer) > max_item_bytes:
+            yield None, f"单条消息超过 {max_item_bytes} 字节"
+            discarding = True
+        if discarding:
+            buffer.clear()
+
+    if not discarding and bytes(buffer).strip():
+        yield decode(bytes(buffer))
+
+
+async def iter_json_array(stream: AsyncIterator[bytes], max_item_bytes: int) -> AsyncIterator[BatchItem]:
+    """逐个解析顶层 JSON 数组的元素
+
+    Args:
+        stream: 请求体分块
+        max_item_bytes: 单个元素的最大字符数
+
+    Yields:
+        (消息, None)
+
+    Raises:
+        BatchFormatError: 数组格式错误或元素过长时，之后的元素无法继续解析
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="strict")
+    parser = json.JSONDecoder()
+    chunks = stream.__aiter__()
+    text = ""
+    pos = 0
+    eof = False
+
+    async def fill():
+        """读取下一块，丢弃已解析的部分"""
+        nonlocal text, pos, eof
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            chunk, eof = b"", True
+        try:
+            text = text[pos:] + decoder.decode(chunk, final=eof)
+        except UnicodeDecodeError as e:
+            raise BatchFormatError(f"请求体不是有效的UTF-8: {e}")
+        pos = 0
+
+    async def next_char() -> str:
+        """跳过空白，返回下一个字符，请求体结束时返回空字符串"""
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(text, pos).end()
+            if pos < len(text) or eof:
+                return text[pos:pos + 1]
+            await fill()
+
+    if await next_char() != "[":
+        raise BatchFormatError("请求体不是JSON数组")
+    pos += 1
+
+    first = True
+    while True:
+        char = await next_char()
+        if char == "]":
+            pos += 1
+            break
+        if not first:
+            if char != ",":
+                raise BatchFormatError(f"JSON数组格式错误，期望 ',' 或 ']'，实际为 {char or '请求体结束'}")
+            pos += 1
+            await next_char()
+        first = False
+
+        while True:
+            try:
+                item, end = parser.raw_decode(text, pos)
+                # 数字可能在分块边界被截断，之后的字符不能再是数字的一部分
+                if eof or (end < len(text) and text[end] not in _NUMBER_CHARS):
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise BatchFormatError(f"JSON格式错误: {e}")
+            if len(text) - pos > max_item_bytes:
+                raise BatchFormatError(f"单条消息超过 {max_item_bytes} 个字符")
+            await fill()
+        pos = end
+        yield item, None
+
+    if await next_char():
+        raise BatchFormatError("JSON数组之后存在多余的内容")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+webhook 接收基准
+对比经过 FastAPI（中间件、路由匹配、依赖解析）的接收路径与原生 ASGI 快速通道的吞吐量和延迟。
+两个路径使用相同的路由配置（无转发目标、关闭去重），只测量接收和处理本身的开销
+
+用法:
+    python bench_ingest.py [-n 请求数] [-c 并发数]          # 进程内直接调用 ASGI 应用
+    python bench_ingest.py --http [-n 请求数] [-c 并发数]   # 启动 uvicorn，通过 HTTP 请求
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from typing import List, Tuple
+
+from loguru import logger
+
+MESSAGE = {
+    "event_type": "trade",
+    "symbol": "BTCUSDT",
+    "operation": "BUY",
+    "price": 64250.5,
+    "amount": 0.015,
+    "description": "交易信号: BTCUSDT BUY 价格: 64250.5 数量: 0.015"
+}
+
+LANES = (("fastapi", False), ("fast_lane", True))
+
+
+def write_config(directory: str, fast_lane: bool) -> str:
+    """写入基准使用的配置文件"""
+    path = os.path.join(directory, f"bench_{'fast' if fast_lane else 'fastapi'}.json")
+    config = {
+        "targets": [],
+        "routes": {"/bench": {"methods": ["POST"], "dedup": {"enabled": False}}},
+        "templates": {},
+        "ingest": {"fast_lane": fast_lane},
+        "config_reload": {"enabled": False}
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return path
+
+
+def summarize(name: str, latencies: List[float], elapsed: float):
+    """输出吞吐量和延迟分位数"""
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<12}{len(latencies) / elapsed:>12.0f}{statistics.median(latencies) * 1e3:>12.3f}{p99 * 1e3:>12.3f}")
+
+
+async def run_workers(send, requests: int, concurrency: int) -> Tuple[List[float], float]:
+    """并发发送请求，返回每个请求的延迟和总耗时"""
+    latencies: List[float] = []
+    per_worker = requests // concurrency
+
+    async def worker():
+        for _ in range(per_worker):
+            start = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def bench_asgi(config_path: str, requests: int, concurrency: int) -> Tuple[List[float], float]:
+    """进程内直接调用 ASGI 应用"""
+    from webhook_server import WebhookForwarder
+
+    forwarder = WebhookForwarder(config_path)
+    app = forwarder.asgi_app
+    body = json.dumps(MESSAGE).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/bench", "raw_path": b"/bench", "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8080)
+    }
+
+    async def send():
+        sent = False
+        status = []
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def respond(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await app(dict(scope), receive, respond)
+        assert status and status[0] == 200, status
+
+    async with forwarder.app.router.lifespan_context(forwarder.app):
+        await run_workers(send, min(requests, 1000), concurrency)  # 预热
+        return await run_workers(send, requests, concurrency)
+
+
+def serve(config_path: str, port: int):
+    """在子进程中运行 uvicorn"""
+    import uvicorn
+    from webhook_server import create_app
+
+    logger.remove()
+    uvicorn.run(create_app(config_path), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+async def bench_http(port: int, requests: int, concurrency: int) -> Tuple[List[float], float]:
+    """通过 HTTP 请求运行中的服务"""
+    import aiohttp
+
+    url = f"http://127.0.0.1:{port}/bench"
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for _ in range(100):
+            try:
+                async with session.post(url, json=MESSAGE) as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+
+        async def send():
+            async with session.post(url, json=MESSAGE) as response:
+                await response.read()
+                assert response.status == 200, response.status
+
+        await run_workers(send, min(requests, 1000), concurrency)  # 预热
+        return await run_workers(send, requests, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webhook 接收基准")
+    parser.add_argument("-n", "--requests", type=int, default=20000, help="每个路径的请求数")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="并发数")
+    parser.add_argument("--http", action="store_true", help="启动 uvicorn 并通过 HTTP 请求")
+    parser.add_argument("--port", type=int, default=18080, help="--http 模式使用的起始端口")
+    args = parser.parse_args()
+
+    logger.remove()
+    directory = tempfile.mkdtemp(prefix="bench_ingest_")
+    print(f"{'路径':<12}{'请求/秒':>12}{'p50(ms)':>12}{'p99(ms)':>12}")
+    for index, (name, fast_lane) in enumerate(LANES):
+        config_path = write_config(directory, fast_lane)
+        if not args.http:
+            latencies, elapsed = asyncio.run(bench_asgi(config_path, args.requests, args.concurrency))
+        else:
+            port = args.port + index
+            process = multiprocessing.Process(target=serve, args=(config_path, port), daemon=True)
+            process.start()
+            try:
+                latencies, elapsed = asyncio.run(bench_http(port, args.requests, args.concurrency))
+            finally:
+                process.terminate()
+                process.join()
+        summarize(name, latencies, elapsed)
+
+
+if __name__ == "__main__":
+    main()
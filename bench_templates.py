@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+消息模板微基准
+对比逐条扁平化消息并 str.format 的旧实现与编译后的模板，使用典型的交易和持仓消息
+
+用法: python bench_templates.py [-n 次数]
+"""
+
+import time
+import argparse
+
+from template_engine import CompiledTemplate
+
+TEMPLATES = {
+    "trade": {
+        "event_type": "trade",
+        "description": "交易信号: {symbol} {operation} 价格: {price} 数量: {amount}",
+        "data": {
+            "symbol": "{symbol}",
+            "operation": "{operation}",
+            "price": "{price}",
+            "amount": "{amount}"
+        }
+    },
+    "position": {
+        "event_type": "position_update",
+        "description": "持仓更新: {symbol} 数量: {data[amount]} 价格: {data[current_price]:.2f} 盈亏: {data[pnl]:+.2f}",
+        "data": {
+            "symbol": "{symbol}",
+            "side": "{data[side]}",
+            "leverage": "{data[leverage]}x",
+            "tags": ["{exchange}", "{account[name]}"]
+        },
+        "source": "bcoin"
+    }
+}
+
+MESSAGES = {
+    "trade": {
+        "event_type": "trade",
+        "symbol": "BTCUSDT",
+        "operation": "BUY",
+        "price": 64250.5,
+        "amount": 0.015,
+        "timestamp": "2024-05-01T12:00:00",
+        "strategy": {"name": "grid", "params": {"levels": 20, "step": 0.005, "bounds": [60000, 70000]}},
+        "account": {"name": "main", "balances": {"USDT": 10234.2, "BTC": 0.31, "ETH": 2.4}},
+        "data": {"order_id": "123456789", "fills": [{"price": 64250.5, "qty": 0.015}], "fee": {"asset": "BNB", "value": 0.0001}}
+    },
+    "position": {
+        "event_type": "position_update",
+        "symbol": "ETHUSDT",
+        "exchange": "binance",
+        "timestamp": "2024-05-01T12:00:00",
+        "account": {"name": "futures", "margin": {"total": 5000.0, "used": 1200.5, "free": 3799.5}},
+        "data": {
+            "side": "LONG", "amount": 1.5, "entry_price": 3010.25, "current_price": 3120.756,
+            "pnl": 165.759, "leverage": 5, "liquidation": {"price": 2480.1, "distance": 0.2},
+            "history": [{"t": i, "pnl": i * 1.5} for i in range(20)]
+        }
+    }
+}
+
+
+def legacy_render(message: dict, template: dict) -> dict:
+    """旧实现：每条消息扁平化整个消息，对每个字符串调用 str.format"""
+    def flatten(data, result, prefix=""):
+        if not data or not isinstance(data, dict):
+            return
+        for key, value in data.items():
+            new_key = f"{prefix}.{key}" if prefix else key
+            if isinstance(value, dict):
+                flatten(value, result, new_key)
+            result[new_key] = value
+
+    def replace_variables(template_value, data):
+        if isinstance(template_value, dict):
+            return {k: replace_variables(v, data) for k, v in template_value.items()}
+        elif isinstance(template_value, list):
+            return [replace_variables(item, data) for item in template_value]
+        elif isinstance(template_value, str) and "{" in template_value:
+            try:
+                return template_value.format(**data)
+            except KeyError:
+                return template_value
+        return template_value
+
+    format_data = {}
+    flatten(message, format_data)
+    return {key: replace_variables(value, format_data) for key, value in template.items()}
+
+
+def bench(func, message: dict, rounds: int) -> float:
+    """返回每次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(message)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息模板微基准")
+    parser.add_argument("-n", "--rounds", type=int, default=100000, help="每项测试的调用次数")
+    args = parser.parse_args()
+
+    print(f"{'模板':<10}{'旧实现(us)':>12}{'编译后(us)':>12}{'加速比':>8}")
+    for name, template in TEMPLATES.items():
+        message = MESSAGES[name]
+        compiled = CompiledTemplate(template)
+        assert compiled(message) == legacy_render(message, template), f"{name} 渲染结果不一致"
+        # 缺少字段时保持原样
+        assert compiled({"symbol": "X"}) == legacy_render({"symbol": "X"}, template)
+
+        legacy = bench(lambda m: legacy_render(m, template), message, args.rounds)
+        fast = bench(compiled, message, args.rounds)
+        print(f"{name:<10}{legacy:>12.2f}{fast:>12.2f}{legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+熔断器模块
+为每个目标维护 关闭/打开/半开 三态熔断器，目标持续失败或过慢时直接短路发送，
+经过冷却时间后放行少量探测请求，探测成功再恢复
+"""
+
+import time
+from collections import deque
+from loguru import logger
+from typing import Dict, Optional, Any
+
+# 熔断器默认参数，可被全局 circuit_breaker 配置和目标的 circuit_breaker 配置逐级覆盖
+DEFAULT_BREAKER_SETTINGS = {
+    "enabled": True,
+    "window_size": 20,                # 统计最近多少次调用
+    "min_calls": 5,                   # 窗口内至少多少次调用才开始判断
+    "failure_rate_threshold": 0.5,    # 失败率达到该值时打开
+    "slow_call_threshold": 5.0,       # 耗时超过该值（秒）视为慢调用
+    "slow_call_rate_threshold": 0.8,  # 慢调用比例达到该值时打开
+    "open_duration": 30.0,            # 打开后等待多久进入半开（秒）
+    "half_open_probes": 1             # 半开状态放行的探测请求数，全部成功后关闭
+}
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个目标的熔断器"""
+
+    def __init__(self, name: str, settings: dict):
+        """初始化熔断器
+
+        Args:
+            name: 目标名称，用于日志
+            settings: 熔断器参数
+        """
+        self.name = name
+        self.settings = settings
+        self.state = STATE_CLOSED
+        self._calls: deque = deque(maxlen=settings["window_size"])
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.short_circuited = 0
+
+    def update_settings(self, settings: dict):
+        """更新参数，保留当前状态"""
+        if settings["window_size"] != self.settings["window_size"]:
+            self._calls = deque(self._calls, maxlen=settings["window_size"])
+        self.settings = settings
+
+    def retry_after(self) -> float:
+        """距离进入半开状态还需等待的秒数"""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.settings["open_duration"] - time.monotonic())
+
+    def allow(self) -> Optional[bool]:
+        """判断是否放行本次调用
+
+        Returns:
+            None 表示短路；否则放行，值表示本次调用是否为半开状态的探测请求，
+            放行后必须调用 record 记录结果
+        """
+        if not self.settings["enabled"] or self.state == STATE_CLOSED:
+            return False
+
+        if self.state == STATE_OPEN:
+            if self.retry_after() > 0:
+                self.short_circuited += 1
+                return None
+            self._transition(STATE_HALF_OPEN)
+
+        # 半开状态只放行有限的探测请求
+        if self._probes_in_flight < self.settings["half_open_probes"]:
+            self._probes_in_flight += 1
+            return True
+
+        self.short_circuited += 1
+        return None
+
+    def record(self, success: bool, latency: float, probe: bool = False):
+        """记录一次已放行调用的结果
+
+        Args:
+            success: 是否成功
+            latency: 耗时（秒）
+            probe: 是否为探测请求
+        """
+        if not self.settings["enabled"]:
+            return
+
+        slow = latency >= self.settings["slow_call_threshold"]
+
+        if probe:
+            if self.state != STATE_HALF_OPEN:
+                return
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if not success or slow:
+                self._transition(STATE_OPEN)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.settings["half_open_probes"]:
+                self._transition(STATE_CLOSED)
+            return
+
+        if self.state != STATE_CLOSED:
+            # 打开前已放行的调用迟到的结果不影响状态
+            return
+
+        self._calls.append((not success, slow))
+        if len(self._calls) < self.settings["min_calls"]:
+            return
+
+        total = len(self._calls)
+        failure_rate = sum(1 for failed, _ in self._calls if failed) / total
+        slow_rate = sum(1 for _, is_slow in self._calls if is_slow) / total
+        if failure_rate >= self.settings["failure_rate_threshold"]:
+            logger.warning(f"目标 {self.name} 失败率 {failure_rate:.0%} 达到阈值，熔断器打开")
+            self._transition(STATE_OPEN)
+        elif slow_rate >= self.settings["slow_call_rate_threshold"]:
+            logger.warning(f"目标 {self.name} 慢调用比例 {slow_rate:.0%} 达到阈值，熔断器打开")
+            self._transition(STATE_OPEN)
+
+    def release(self, probe: bool):
+        """放弃一次已放行但未完成的调用（例如被取消），不计入统计"""
+        if probe and self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _transition(self, state: str):
+        """切换状态"""
+        if state == self.state:
+            return
+
+        logger.info(f"目标 {self.name} 熔断器状态: {self.state} -> {state}")
+        self.state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == STATE_OPEN:
+            self._opened_at = time.monotonic()
+        elif state == STATE_CLOSED:
+            self._calls.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取熔断器状态快照"""
+        total = len(self._calls)
+        failures = sum(1 for failed, _ in self._calls if failed)
+        slow = sum(1 for _, is_slow in self._calls if is_slow)
+        return {
+            "enabled": self.settings["enabled"],
+            "state": self.state,
+            "window_calls": total,
+            "failure_rate": round(failures / total, 3) if total else 0.0,
+            "slow_call_rate": round(slow / total, 3) if total else 0.0,
+            "retry_after": round(self.retry_after(), 3),
+            "short_circuited": self.short_circuited
+        }
+
+
+class CircuitBreakerRegistry:
+    """按目标ID管理熔断器"""
+
+    def __init__(self, breaker_config: Optional[dict] = None):
+        """初始化熔断器注册表
+
+        Args:
+            breaker_config: 全局熔断器配置
+        """
+        self.breaker_config = breaker_config or {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def update_config(self, breaker_config: Optional[dict]):
+        """更新全局熔断器配置，已有熔断器在下次取用时应用新参数并保留状态
+
+        Args:
+            breaker_config: 全局熔断器配置
+        """
+        self.breaker_config = breaker_config or {}
+
+    def _resolve_settings(self, target: dict) -> dict:
+        """计算目标生效的熔断器参数"""
+        settings = dict(DEFAULT_BREAKER_SETTINGS)
+        settings.update({k: v for k, v in self.breaker_config.items() if k in DEFAULT_BREAKER_SETTINGS})
+        settings.update({
+            k: v for k, v in (target.get("circuit_breaker") or {}).items() if k in DEFAULT_BREAKER_SETTINGS
+        })
+        return settings
+
+    def get(self, target: dict) -> CircuitBreaker:
+        """获取目标的熔断器，不存在时创建
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            熔断器
+        """
+        target_id = target.get("id")
+        settings = self._resolve_settings(target)
+        breaker = self._breakers.get(target_id)
+        if breaker is None:
+            breaker = CircuitBreaker(target.get("name") or target_id, settings)
+            self._breakers[target_id] = breaker
+        elif breaker.settings != settings:
+            breaker.update_settings(settings)
+        return breaker
+
+    def snapshot(self, target: dict) -> Dict[str, Any]:
+        """获取目标熔断器的状态快照"""
+        return self.get(target).snapshot()
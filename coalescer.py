@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+消息合并模块
+在可配置的时间窗口内把发往同一文本类目标的多条消息合并为一条发送，
+超过长度上限时再按消息边界拆分
+"""
+
+import asyncio
+from loguru import logger
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Tuple
+
+# 合并默认参数，目标通过 coalesce 配置启用并覆盖
+DEFAULT_COALESCE_SETTINGS = {
+    "window_ms": 500,        # 合并窗口（毫秒），窗口内到达的消息合并发送
+    "max_messages": 20,      # 单批最多合并的消息数，达到后立即发送
+    "max_length": 2000,      # 单条发送的最大字符数，超过时拆分
+    "separator": "\n\n"      # 合并消息之间的分隔符
+}
+
+# 刷新函数：参数为 (目标配置, 分段列表, 批内条目列表)，返回与条目一一对应的结果
+FlushFunc = Callable[[dict, List[Tuple[str, List[int]]], List[Any]], Awaitable[List[dict]]]
+
+
+def split_texts(texts: List[str], max_length: int, separator: str) -> List[Tuple[str, List[int]]]:
+    """把多段文本合并并按长度上限拆分
+
+    尽量在消息边界处拆分，单条消息本身超过上限时按字符硬拆分。
+
+    Args:
+        texts: 文本列表
+        max_length: 单段最大字符数
+        separator: 分隔符
+
+    Returns:
+        (合并后的文本, 包含的文本下标列表) 列表
+    """
+    chunks: List[Tuple[str, List[int]]] = []
+    parts: List[str] = []
+    members: List[int] = []
+    length = 0
+
+    def emit():
+        nonlocal parts, members, length
+        if parts:
+            chunks.append((separator.join(parts), members))
+        parts, members, length = [], [], 0
+
+    for index, text in enumerate(texts):
+        extra = len(text) + (len(separator) if parts else 0)
+        if parts and length + extra > max_length:
+            emit()
+            extra = len(text)
+
+        if extra > max_length:
+            # 单条消息过长，独立硬拆分
+            emit()
+            for start in range(0, len(text), max_length):
+                chunks.append((text[start:start + max_length], [index]))
+            continue
+
+        parts.append(text)
+        members.append(index)
+        length += extra
+
+    emit()
+    return chunks
+
+
+class _Batch:
+    """某个目标正在收集中的一批消息"""
+
+    __slots__ = ("target", "settings", "texts", "items", "futures", "timer")
+
+    def __init__(self, target: dict, settings: dict):
+        self.target = target
+        self.settings = settings
+        self.texts: List[str] = []
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MessageCoalescer:
+    """按目标合并消息
+
+    第一条消息到达时开启合并窗口，窗口结束或消息数达到上限时
+    调用刷新函数一次性发送整批消息。
+    """
+
+    def __init__(self, flush: FlushFunc):
+        """初始化消息合并器
+
+        Args:
+            flush: 刷新函数，负责实际发送及每条消息的结果处理
+        """
+        self._flush_func = flush
+        self._batches: Dict[str, _Batch] = {}
+        self._flushing: set = set()
+        self.merged = 0
+        self.sent = 0
+
+    @staticmethod
+    def settings_for(target: dict) -> Optional[dict]:
+        """获取目标的合并参数
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            合并参数，目标未启用合并时返回 None
+        """
+        config = target.get("coalesce")
+        if not config:
+            return None
+
+        settings = dict(DEFAULT_COALESCE_SETTINGS)
+        if isinstance(config, dict):
+            if not config.get("enabled", True):
+                return None
+            settings.update({k: v for k, v in config.items() if k in DEFAULT_COALESCE_SETTINGS})
+        return settings
+
+    def add(self, target: dict, settings: dict, text: str, item: Any) -> "asyncio.Future":
+        """把一条已渲染的消息加入目标当前的批次
+
+        Args:
+            target: 目标配置
+            settings: 合并参数
+            text: 已渲染的消息正文
+            item: 条目，原样传给刷新函数
+
+        Returns:
+            该条消息所在批次发送完成后得到结果的 Future
+        """
+        loop = asyncio.get_running_loop()
+        target_id = target.get("id")
+
+        batch = self._batches.get(target_id)
+        if batch is None:
+            batch = _Batch(target, settings)
+            batch.timer = loop.call_later(settings["window_ms"] / 1000, self._flush, target_id)
+            self._batches[target_id] = batch
+
+        future = loop.create_future()
+        batch.texts.append(text)
+        batch.items.append(item)
+        batch.futures.append(future)
+
+        if len(batch.items) >= settings["max_messages"]:
+            self._flush(target_id)
+
+        return future
+
+    def _flush(self, target_id: str):
+        """结束目标当前批次的收集并开始发送"""
+        batch = self._batches.pop(target_id, None)
+        if batch is None:
+            return
+
+        batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _send_batch(self, batch: _Batch):
+        """发送一个批次并把结果分发给每条消息"""
+        settings = batch.settings
+        chunks = split_texts(batch.texts, settings["max_length"], settings["separator"])
+        self.merged += len(batch.items)
+        self.sent += len(chunks)
+        if len(batch.items) > 1:
+            logger.info(f"合并 {len(batch.items)} 条消息为 {len(chunks)} 条发送到 {batch.target.get('name')}")
+
+        try:
+            outcomes = await self._flush_func(batch.target, chunks, batch.items)
+        except Exception as e:
+            logger.error(f"合并发送到 {batch.target.get('name')} 时出错: {e}")
+            outcomes = [{"success": False, "error": str(e)}] * len(batch.items)
+
+        for future, outcome in zip(batch.futures, outcomes):
+            if not future.done():
+                future.set_result({**outcome, "coalesced": True})
+
+    async def close(self):
+        """立即发送所有未到期的批次并等待发送完成"""
+        for target_id in list(self._batches):
+            self._flush(target_id)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {
+            "pending": {target_id: len(batch.items) for target_id, batch in self._batches.items()},
+            "merged_messages": self.merged,
+            "sent_requests": self.sent
+        }
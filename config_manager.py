@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+配置管理模块
+配置以不可变快照的形式发布：加载或修改配置时先校验并编译出新的快照（目标格式化器、模板、路由），
+再整体替换当前快照；处理中的消息继续使用开始时拿到的路由和目标，热路径读取配置不需要加锁。
+重新编译是增量的，未变化的目标、模板和路由直接复用上一个快照中的编译结果。
+配置文件按修改时间轮询，变化后自动重新加载
+"""
+
+import os
+import json
+import asyncio
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+from loguru import logger
+
+from route_compiler import CompiledRoute, compile_route
+from route_table import RouteTable
+from template_engine import CompiledTemplate
+from target_formatter import TargetFormatter
+
+# 配置热加载默认参数
+DEFAULT_RELOAD_SETTINGS = {
+    "enabled": True,   # 是否监视配置文件
+    "interval": 2.0    # 检查配置文件修改时间的间隔（秒）
+}
+
+
+class ConfigError(ValueError):
+    """配置无效"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__(f"配置无效: {'; '.join(errors)}")
+
+
+def normalize_path(path: str) -> str:
+    """确保路由路径以 / 开头"""
+    return path if path.startswith('/') else f"/{path}"
+
+
+def validate_config(config: Any) -> List[str]:
+    """校验配置的整体结构
+
+    Args:
+        config: 配置
+
+    Returns:
+        错误列表，为空表示结构有效；路由的具体错误在编译时报告
+    """
+    if not isinstance(config, dict):
+        return ["配置必须是对象"]
+
+    errors = []
+    targets = config.get("targets", [])
+    if not isinstance(targets, list):
+        errors.append("targets 必须是列表")
+    else:
+        for index, target in enumerate(targets):
+            if not isinstance(target, dict):
+                errors.append(f"第 {index + 1} 个目标必须是对象")
+
+    for section in ("routes", "templates"):
+        value = config.get(section, {})
+        if not isinstance(value, dict):
+            errors.append(f"{section} 必须是对象")
+        elif section == "routes":
+            for path, route_config in value.items():
+                if not isinstance(route_config, dict):
+                    errors.append(f"路由 {path} 的配置必须是对象")
+    return errors
+
+
+class ConfigSnapshot:
+    """编译后的配置快照，创建后不可修改
+
+    快照中的配置字典也不会再被修改，修改配置时总是构建新的快照。
+    """
+
+    __slots__ = (
+        "version", "config", "targets", "templates", "formatters", "routes", "route_table", "route_errors", "compiled"
+    )
+
+    def __init__(self, **fields: Any):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("配置快照不可修改")
+
+    def target(self, target_id: str) -> Optional[dict]:
+        """按ID查找目标配置"""
+        return self.targets.get(target_id)
+
+
+def _share_targets(targets: List[dict], previous: Optional[ConfigSnapshot]) -> List[dict]:
+    """内容未变化的目标沿用上一个快照中的同一个对象，便于按对象判断是否需要重新编译"""
+    if previous is None:
+        return list(targets)
+    previous_targets = previous.targets
+    shared = []
+    for target in targets:
+        old = previous_targets.get(target.get("id"))
+        shared.append(old if old is not None and old == target else target)
+    return shared
+
+
+def _same_route_targets(route: CompiledRoute, targets: List[dict], previous_targets: List[dict]) -> bool:
+    """路由引用到的目标是否仍是上一个快照中的同一组对象"""
+    if not route.target_ids:
+        return True
+    if route.resolve_targets is not None:
+        # 目标ID引用路径参数时可能用到任一目标
+        return len(targets) == len(previous_targets) and all(
+            target is old for target, old in zip(targets, previous_targets)
+        )
+    selected = [target for target in targets if target.get("id") in route.target_ids]
+    previous_selected = [target for target in previous_targets if target.get("id") in route.target_ids]
+    return len(selected) == len(previous_selected) and all(
+        target is old for target, old in zip(selected, previous_selected)
+    )
+
+
+def build_snapshot(config: dict, version: int, previous: Optional[ConfigSnapshot] = None) -> ConfigSnapshot:
+    """校验并编译配置快照
+
+    Args:
+        config: 新配置，之后不应再修改
+        version: 快照版本
+        previous: 上一个快照，其中未变化的编译结果直接复用
+
+    Returns:
+        配置快照；路由的配置错误记录在 route_errors 中，无效的引用被忽略
+
+    Raises:
+        ConfigError: 配置的整体结构无效时
+    """
+    errors = validate_config(config)
+    if errors:
+        raise ConfigError(errors)
+
+    compiled = {"targets": 0, "templates": 0, "routes": 0}
+    config = dict(config)
+    previous_config = previous.config if previous is not None else {}
+
+    # 目标：内容相同的目标共用同一个对象和格式化器
+    targets = _share_targets(config.get("targets", []), previous)
+    config["targets"] = targets
+    target_index: Dict[str, dict] = {}
+    formatters: Dict[str, TargetFormatter] = {}
+    for target in targets:
+        target_id = target.get("id")
+        target_index.setdefault(target_id, target)
+        formatter = previous.formatters.get(target_id) if previous is not None else None
+        if formatter is None or formatter.target is not target:
+            formatter = TargetFormatter(target)
+            compiled["targets"] += 1
+        formatters.setdefault(target_id, formatter)
+
+    # 模板：定义未变化时复用编译结果
+    templates: Dict[str, CompiledTemplate] = {}
+    previous_templates = previous_config.get("templates", {})
+    for name, template in config.get("templates", {}).items():
+        if not isinstance(template, dict):
+            continue
+        if previous is not None and name in previous.templates and previous_templates.get(name) == template:
+            templates[name] = previous.templates[name]
+        else:
+            templates[name] = CompiledTemplate(template)
+            compiled["templates"] += 1
+
+    # 路由：配置、引用的目标和模板以及全局去重配置都未变化时复用
+    dedup_unchanged = previous is not None and previous_config.get("dedup") == config.get("dedup")
+    previous_routes = {normalize_path(path): route for path, route in previous_config.get("routes", {}).items()}
+    routes: Dict[str, CompiledRoute] = {}
+    route_errors: Dict[str, List[str]] = {}
+    for path, route_config in config.get("routes", {}).items():
+        path = normalize_path(path)
+        route = previous.routes.get(path) if previous is not None else None
+        template_name = route_config.get("template")
+        if (route is not None and dedup_unchanged and previous_routes.get(path) == route_config
+                and templates.get(template_name) is previous.templates.get(template_name)
+                and _same_route_targets(route, targets, previous_config.get("targets", []))):
+            routes[path] = route
+            # 路径冲突取决于其他路由，按新的路由表重新判断
+            previous_conflict = previous.route_table.conflicts.get(path)
+            errors = [e for e in previous.route_errors.get(path, []) if e != previous_conflict]
+            if errors:
+                route_errors[path] = errors
+            continue
+
+        route, errors = compile_route(path, route_config, config, template_factory=lambda name, _: templates[name])
+        routes[path] = route
+        if errors:
+            route_errors[path] = errors
+        compiled["routes"] += 1
+
+    route_table = RouteTable(routes)
+    for path, error in route_table.conflicts.items():
+        route_errors[path] = [*route_errors.get(path, []), error]
+
+    return ConfigSnapshot(
+        version=version,
+        config=config,
+        targets=target_index,
+        templates=templates,
+        formatters=formatters,
+        routes=routes,
+        route_table=route_table,
+        route_errors=route_errors,
+        compiled=compiled
+    )
+
+
+def read_config(path: str) -> dict:
+    """读取配置文件"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ConfigWatcher:
+    """按修改时间轮询配置文件，文件变化后读取并交给回调处理"""
+
+    def __init__(self, path: str, on_change: Callable[[dict], None], reload_config: Optional[dict] = None):
+        """初始化配置文件监视器
+
+        Args:
+            path: 配置文件路径
+            on_change: 读取到新配置后的回调
+            reload_config: 热加载配置
+        """
+        self.path = path
+        self.on_change = on_change
+        self.settings = dict(DEFAULT_RELOAD_SETTINGS)
+        self.settings.update(reload_config or {})
+        self._signature: Optional[Tuple[int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.failures = 0
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def mark(self):
+        """记录配置文件的当前状态，服务自身保存配置后调用，避免重复加载"""
+        self._signature = self._stat()
+
+    async def start(self):
+        """启动监视任务"""
+        self.mark()
+        if self.settings["enabled"] and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """停止监视任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def check(self) -> bool:
+        """检查配置文件是否变化，变化时重新加载
+
+        Returns:
+            是否加载了新配置
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            config = await asyncio.to_thread(read_config, self.path)
+            self.on_change(config)
+        except Exception as e:
+            # 配置无效时保留当前快照，等待下一次修改
+            self.failures += 1
+            logger.error(f"重新加载配置文件 {self.path} 失败，继续使用当前配置: {e}")
+            return False
+        self.reloads += 1
+        return True
+
+    async def _run(self):
+        interval = float(self.settings["interval"])
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取热加载统计"""
+        return {
+            "enabled": bool(self.settings["enabled"]),
+            "interval": self.settings["interval"],
+            "reloads": self.reloads,
+            "failures": self.failures
+        }
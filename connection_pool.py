@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+出站连接池模块
+为Webhook转发器提供长连接复用的aiohttp会话，按目标主机划分连接池
+"""
+
+import ssl
+import json
+import time
+import asyncio
+import aiohttp
+from collections import deque
+from urllib.parse import urlsplit
+from loguru import logger
+from typing import Dict, List, Optional, Any, Tuple
+
+# 连接池默认参数，可被全局、主机、目标三级配置逐级覆盖
+DEFAULT_POOL_SETTINGS = {
+    "limit": 100,               # 单个连接池的最大连接数（0表示不限制）
+    "limit_per_host": 0,        # 同一 host:port 的最大连接数（0表示不限制）
+    "keepalive_timeout": 30.0,  # 空闲连接保活时间（秒）
+    "ttl_dns_cache": 300,       # DNS缓存时间（秒），None表示永久缓存
+    "ssl_session_reuse": True,  # 是否在所有连接池之间共享同一个SSLContext
+    "force_close": False        # 每次请求后关闭连接（禁用keep-alive）
+}
+
+# 配置变化后不再使用的连接池延迟关闭的时间（秒），让仍在使用它的请求完成
+DEFAULT_RETIRE_DELAY = 30.0
+
+
+class PoolUsage:
+    """通过 aiohttp 的请求跟踪回调统计一个连接池的打开、空闲和占用连接数
+
+    aiohttp 没有公开连接器内部的连接表，这里按请求跟踪事件推算：新建连接时打开数加一，
+    请求结束时连接放回连接池成为空闲连接，超过保活时间的空闲连接视为已关闭。
+    请求出错、服务器要求关闭或设置了 force_close 时连接不会放回连接池。
+    连接在收到响应头时即视为已释放，服务器主动断开的空闲连接要到保活时间后才不再计入，统计值是近似值。
+    """
+
+    def __init__(self, settings: dict):
+        """初始化连接数统计
+
+        Args:
+            settings: 连接池参数
+        """
+        self.force_close = bool(settings["force_close"])
+        self.keepalive_timeout = float(settings["keepalive_timeout"])
+        self.open = 0
+        self.acquired = 0
+        self._idle: deque = deque()  # 空闲连接放回连接池的时间
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """创建绑定到该统计的请求跟踪配置"""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace_config.on_request_redirect.append(self._on_request_done)
+        trace_config.on_request_end.append(self._on_request_done)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    def _expire_idle(self):
+        """超过保活时间的空闲连接已被连接器关闭"""
+        deadline = time.monotonic() - self.keepalive_timeout
+        while self._idle and self._idle[0] <= deadline:
+            self._idle.popleft()
+            self.open -= 1
+
+    def _acquire(self, ctx):
+        ctx.connections = getattr(ctx, "connections", 0) + 1
+        self.acquired += 1
+
+    def _release(self, ctx, reusable: bool):
+        count = getattr(ctx, "connections", 0)
+        ctx.connections = 0
+        self.acquired -= count
+        if reusable:
+            self._idle.extend([time.monotonic()] * count)
+        else:
+            self.open -= count
+
+    async def _on_connection_create(self, session, ctx, params):
+        self.open += 1
+        self._acquire(ctx)
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self._expire_idle()
+        # 连接器复用最近放回的空闲连接
+        if self._idle:
+            self._idle.pop()
+        else:
+            self.open += 1
+        self._acquire(ctx)
+
+    async def _on_request_done(self, session, ctx, params):
+        reusable = not self.force_close and params.response.headers.get("Connection", "").lower() != "close"
+        self._release(ctx, reusable)
+
+    async def _on_request_exception(self, session, ctx, params):
+        self._release(ctx, False)
+
+    def snapshot(self) -> Dict[str, int]:
+        """获取当前的打开、空闲和占用连接数"""
+        self._expire_idle()
+        return {"open": self.open, "idle": len(self._idle), "acquired": self.acquired}
+
+
+class ConnectionPoolManager:
+    """出站连接池管理器
+
+    每个目标主机（scheme://host:port）与其生效的连接池参数对应一个长期存活的
+    aiohttp.ClientSession，避免每条消息都重新建立连接、解析DNS和完成TLS握手。
+    """
+
+    def __init__(self, pool_config: Optional[dict] = None):
+        """初始化连接池管理器
+
+        Args:
+            pool_config: 全局连接池配置，支持 hosts 字段按主机覆盖参数
+        """
+        self.pool_config = pool_config or {}
+        self._sessions: Dict[Tuple[str, tuple], aiohttp.ClientSession] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._retired: Dict[aiohttp.ClientSession, asyncio.Task] = {}
+        self._usage: Dict[aiohttp.ClientSession, PoolUsage] = {}
+
+    def update_config(self, pool_config: Optional[dict], targets: Optional[List[dict]] = None):
+        """更新连接池配置，新参数只作用于之后新建的连接池
+
+        Args:
+            pool_config: 全局连接池配置
+            targets: 新配置中的目标列表，提供时回收不再被任何目标使用的连接池
+        """
+        self.pool_config = pool_config or {}
+        if targets is not None:
+            self.retire_unused(targets)
+
+    def _session_key(self, target: dict) -> Tuple[str, tuple]:
+        """获取目标对应的连接池键：(主机键, 生效的连接池参数)"""
+        host, settings = self.resolve_settings(target)
+        return host, tuple(sorted(settings.items()))
+
+    def retire_unused(self, targets: List[dict]) -> int:
+        """回收不再被任何目标使用的连接池
+
+        连接池先从池表中移除，之后的请求不会再使用它；经过 retire_delay 秒后关闭，
+        让仍在使用它的请求完成。
+
+        Args:
+            targets: 当前的目标配置列表
+
+        Returns:
+            回收的连接池数
+        """
+        live = {self._session_key(target) for target in targets if target.get("url")}
+        stale = [key for key in self._sessions if key not in live]
+        if not stale:
+            return 0
+
+        delay = float(self.pool_config.get("retire_delay", DEFAULT_RETIRE_DELAY))
+        for key in stale:
+            session = self._sessions.pop(key)
+            if not session.closed:
+                self._retired[session] = asyncio.get_running_loop().create_task(self._close_later(session, delay))
+        logger.info(f"配置变化后回收 {len(stale)} 个不再使用的连接池，{delay} 秒后关闭")
+        return len(stale)
+
+    async def _close_later(self, session: aiohttp.ClientSession, delay: float):
+        """等待一段时间后关闭已回收的连接池"""
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._retired.pop(session, None)
+            self._usage.pop(session, None)
+            if not session.closed:
+                await session.close()
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        """获取URL对应的连接池主机键
+
+        Args:
+            url: 目标URL
+
+        Returns:
+            形如 http://host:port 的主机键
+        """
+        parts = urlsplit(url or "")
+        scheme = (parts.scheme or "http").lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        return f"{scheme}://{(parts.hostname or '').lower()}:{port}"
+
+    def resolve_settings(self, target: dict) -> Tuple[str, dict]:
+        """计算目标生效的连接池参数
+
+        优先级: 目标配置 connection_pool > 主机配置 hosts > 全局配置 > 默认值
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            (主机键, 连接池参数)
+        """
+        host = self._host_key(target.get("url", ""))
+        settings = dict(DEFAULT_POOL_SETTINGS)
+
+        for key, value in self.pool_config.items():
+            if key in DEFAULT_POOL_SETTINGS:
+                settings[key] = value
+
+        hosts = self.pool_config.get("hosts") or {}
+        # 主机配置既可以写成 host:port，也可以写成完整的 scheme://host:port
+        host_settings = hosts.get(host) or hosts.get(host.split("://", 1)[1]) or {}
+        settings.update({k: v for k, v in host_settings.items() if k in DEFAULT_POOL_SETTINGS})
+
+        target_settings = target.get("connection_pool") or {}
+        settings.update({k: v for k, v in target_settings.items() if k in DEFAULT_POOL_SETTINGS})
+
+        return host, settings
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        """获取共享的SSLContext，避免每个连接池重复加载证书"""
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _create_session(self, host: str, settings: dict) -> aiohttp.ClientSession:
+        """按参数创建新的会话
+
+        Args:
+            host: 主机键
+            settings: 连接池参数
+
+        Returns:
+            aiohttp会话
+        """
+        connector_kwargs = {
+            "limit": settings["limit"],
+            "limit_per_host": settings["limit_per_host"],
+            "ttl_dns_cache": settings["ttl_dns_cache"],
+            "use_dns_cache": True,
+            "force_close": settings["force_close"],
+            "ssl": self._get_ssl_context() if settings["ssl_session_reuse"] else True
+        }
+        # aiohttp 不允许同时设置 force_close 和 keepalive_timeout
+        if not settings["force_close"]:
+            connector_kwargs["keepalive_timeout"] = settings["keepalive_timeout"]
+
+        connector = aiohttp.TCPConnector(**connector_kwargs)
+        usage = PoolUsage(settings)
+        session = aiohttp.ClientSession(
+            connector=connector, json_serialize=json.dumps, trace_configs=[usage.trace_config()]
+        )
+        self._usage[session] = usage
+        logger.info(f"已创建连接池: {host} {settings}")
+        return session
+
+    def get_session(self, target: dict) -> aiohttp.ClientSession:
+        """获取目标对应的会话，不存在时按需创建
+
+        必须在事件循环中调用。
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            aiohttp会话
+        """
+        key = self._session_key(target)
+
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            if session is not None:
+                self._usage.pop(session, None)
+            session = self._create_session(key[0], dict(key[1]))
+            self._sessions[key] = session
+
+        return session
+
+    async def start(self, targets: List[dict]):
+        """应用启动时为所有启用的目标预先创建连接池
+
+        Args:
+            targets: 目标配置列表
+        """
+        for target in targets:
+            if target.get("enabled", True) and target.get("url"):
+                self.get_session(target)
+        logger.info(f"连接池已启动，共 {len(self._sessions)} 个连接池")
+
+    async def close(self):
+        """应用关闭时关闭所有连接池"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+
+        # 已回收、等待延迟关闭的连接池立即关闭
+        retired = list(self._retired.items())
+        self._retired.clear()
+        for session, task in retired:
+            task.cancel()
+            sessions.append(session)
+        await asyncio.gather(*(task for _, task in retired), return_exceptions=True)
+
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        self._usage.clear()
+
+        # 给底层传输一个事件循环周期完成关闭
+        await asyncio.sleep(0)
+        logger.info(f"连接池已关闭，共 {len(sessions)} 个连接池")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息
+
+        Returns:
+            每个连接池的主机、生效参数、连接数上限和打开、空闲、占用连接数，以及汇总数据
+        """
+        pools = []
+        totals = {"pools": 0, "retired": len(self._retired), "open": 0, "idle": 0, "acquired": 0}
+
+        for (host, settings_key), session in self._sessions.items():
+            connector = session.connector
+            usage = self._usage.get(session)
+            counts = usage.snapshot() if usage is not None and not session.closed else {"open": 0, "idle": 0, "acquired": 0}
+            pools.append({
+                "host": host,
+                "settings": dict(settings_key),
+                "closed": session.closed,
+                "limit": connector.limit if connector is not None else None,
+                "limit_per_host": connector.limit_per_host if connector is not None else None,
+                **counts
+            })
+            totals["pools"] += 1
+            for key, value in counts.items():
+                totals[key] += value
+
+        return {"pools": pools, "totals": totals}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+死信存储模块
+保存重试耗尽或不可重试的投递，供管理接口查看和重新投递
+"""
+
+import time
+import itertools
+from collections import OrderedDict
+from loguru import logger
+from typing import List, Optional, Any, Callable
+
+
+class DeadLetterStore:
+    """有界的内存死信存储
+
+    超出容量时淘汰最早的死信；启用持久化投递日志时，死信同时以
+    dead 状态保存在日志中，重启后会重新加载。死信被淘汰时通过 on_evict
+    通知调用方更新日志中的状态，否则日志中的记录永远不会被压缩。
+    """
+
+    def __init__(self, max_size: int = 1000, on_evict: Optional[Callable[[dict], None]] = None):
+        """初始化死信存储
+
+        Args:
+            max_size: 最多保留的死信数量
+            on_evict: 死信因超出容量被淘汰时的回调，参数为死信记录
+        """
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._letters: "OrderedDict[int, dict]" = OrderedDict()
+        self._seq = itertools.count(1)
+        self.evicted = 0
+
+    def add(self, message: dict, target: dict, ticket: Any, attempts: Optional[int],
+            status: Optional[int] = None, error: Optional[str] = None) -> dict:
+        """添加死信
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递凭据
+            attempts: 已尝试次数，未知时为 None
+            status: 最后一次HTTP状态码
+            error: 最后一次错误描述
+
+        Returns:
+            死信记录
+        """
+        letter = {
+            "id": next(self._seq),
+            "message_id": message.get("_id"),
+            "target_id": target.get("id"),
+            "target_name": target.get("name"),
+            "attempts": attempts,
+            "last_status": status,
+            "last_error": error,
+            "dead_at": time.time(),
+            "ticket": ticket,
+            "message": message
+        }
+        self._letters[letter["id"]] = letter
+        self._evict()
+
+        logger.error(
+            f"消息 ID:{letter['message_id']} 投递到 {letter['target_name']} 最终失败，已转入死信 ID:{letter['id']}"
+        )
+        return letter
+
+    def resize(self, max_size: int):
+        """修改容量，超出新容量的最早死信被淘汰
+
+        Args:
+            max_size: 最多保留的死信数量
+        """
+        self.max_size = max_size
+        self._evict()
+
+    def _evict(self):
+        """淘汰超出容量的最早死信"""
+        while len(self._letters) > self.max_size:
+            _, evicted = self._letters.popitem(last=False)
+            self.evicted += 1
+            logger.warning(f"死信存储已满，丢弃最早的死信 ID:{evicted['id']}")
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def get(self, letter_id: int) -> Optional[dict]:
+        """获取死信"""
+        return self._letters.get(letter_id)
+
+    def pop(self, letter_id: int) -> Optional[dict]:
+        """取出并删除死信"""
+        return self._letters.pop(letter_id, None)
+
+    def list(self, limit: int = 100, target_id: Optional[str] = None) -> List[dict]:
+        """列出死信，最新的在前
+
+        Args:
+            limit: 最多返回条数
+            target_id: 只返回该目标的死信
+
+        Returns:
+            死信列表
+        """
+        letters = []
+        for letter in reversed(self._letters.values()):
+            if target_id and letter["target_id"] != target_id:
+                continue
+            letters.append(letter)
+            if len(letters) >= limit:
+                break
+        return letters
+
+    def __len__(self) -> int:
+        return len(self._letters)
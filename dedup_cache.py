@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+去重缓存模块
+按到期时间分桶（时间轮）淘汰过期的消息ID，单条消息的检查与清理均摊 O(1)，
+并限制条目数和内存占用；可选布隆过滤器层以常量内存支持更长的去重窗口
+"""
+
+import sys
+import math
+import time
+import heapq
+import hashlib
+from collections import deque
+from typing import Deque, Dict, List, Optional, Any, Tuple
+
+# 去重缓存默认参数，可通过 dedup.cache 配置覆盖
+DEFAULT_CACHE_SETTINGS = {
+    "max_entries": 100000,        # 精确缓存的最大条目数
+    "max_bytes": 32 * 1024 * 1024,  # 精确缓存的最大内存估算（字节）
+    "resolution": 1.0,            # 时间轮每个桶覆盖的秒数
+    "max_ttl": 3600,              # 精确缓存的最长保留时间（秒），更长的窗口由布隆过滤器层负责
+    "bloom": None                 # 布隆过滤器层配置，见 DEFAULT_BLOOM_SETTINGS
+}
+
+DEFAULT_BLOOM_SETTINGS = {
+    "enabled": True,
+    "capacity": 1000000,          # 一个去重窗口内预期的消息数
+    "error_rate": 0.001,          # 误判率
+    "generations": 4              # 每个去重窗口分为几代轮换，代数越多，超出窗口的多余保留时间越短
+}
+
+# 每个条目在字典、时间轮中的额外开销估算（字节）
+ENTRY_OVERHEAD = 120
+
+
+class BloomFilter:
+    """定长布隆过滤器（双重哈希）"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        """初始化布隆过滤器
+
+        Args:
+            capacity: 预期元素数
+            error_rate: 误判率
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        """计算元素对应的位下标"""
+        value = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(value[:8], "little")
+        h2 = int.from_bytes(value[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key: str):
+        """添加元素"""
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class RotatingBloom:
+    """按去重窗口多代轮换的布隆过滤器
+
+    每代覆盖 window / (generations - 1) 秒，一代结束满 window 秒后整体丢弃，
+    元素至少保留 window 秒，最多再多保留一代的时长。
+    """
+
+    def __init__(self, settings: dict, window: float):
+        """初始化
+
+        Args:
+            settings: 布隆过滤器层参数
+            window: 去重窗口（秒）
+        """
+        self.window = float(window)
+        self.generations = max(2, int(settings["generations"]))
+        self.span = self.window / (self.generations - 1)
+        self.capacity = max(1, math.ceil(int(settings["capacity"]) / (self.generations - 1)))
+        self.error_rate = float(settings["error_rate"])
+        self._current = self._new()
+        self._started = time.time()
+        # 已结束的代：(结束时间, 过滤器)，按结束时间排序
+        self._previous: Deque[Tuple[float, BloomFilter]] = deque()
+        self.rotations = 0
+
+    def _new(self) -> BloomFilter:
+        return BloomFilter(self.capacity, self.error_rate)
+
+    def _rotate(self, now: float):
+        """当前代到期后开启新的一代，丢弃结束已满一个窗口的代"""
+        if now - self._started >= self.span:
+            # 到期后的第一次检查才轮换，此前加入的元素都在到期前，结束时间按到期时间计
+            self._previous.append((self._started + self.span, self._current))
+            self._current = self._new()
+            self._started = now
+            self.rotations += 1
+        while self._previous and now - self._previous[0][0] >= self.window:
+            self._previous.popleft()
+
+    def check_and_add(self, key: str, now: float) -> bool:
+        """检查元素是否存在，不存在时加入
+
+        Returns:
+            是否（可能）已存在
+        """
+        self._rotate(now)
+        if key in self._current or any(key in bloom for _, bloom in self._previous):
+            return True
+        self._current.add(key)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "generations": len(self._previous) + 1,
+            "current_count": self._current.count,
+            "bytes": self._current.nbytes * (len(self._previous) + 1),
+            "rotations": self.rotations
+        }
+
+
+class DedupCache:
+    """有界的消息ID去重缓存
+
+    条目按插入顺序保存在字典中，同时按到期时间放入时间轮的桶里；
+    每次检查只处理已到期的桶，超过容量时从最早插入的条目开始淘汰。
+    """
+
+    def __init__(self, cache_config: Optional[dict] = None):
+        """初始化去重缓存
+
+        Args:
+            cache_config: 缓存配置
+        """
+        settings = dict(DEFAULT_CACHE_SETTINGS)
+        settings.update({k: v for k, v in (cache_config or {}).items() if k in DEFAULT_CACHE_SETTINGS})
+        self.max_entries = int(settings["max_entries"])
+        self.max_bytes = int(settings["max_bytes"])
+        self.resolution = float(settings["resolution"])
+        self.max_ttl = float(settings["max_ttl"])
+
+        self._entries: Dict[str, float] = {}
+        self._wheel: Dict[int, Dict[str, None]] = {}
+        self._slots: List[int] = []
+        self._bytes = 0
+
+        # 布隆过滤器层按去重窗口分别创建，轮换周期与窗口一致
+        self.bloom_settings: Optional[dict] = None
+        self.blooms: Dict[float, RotatingBloom] = {}
+        bloom_config = settings["bloom"]
+        if bloom_config:
+            bloom_settings = dict(DEFAULT_BLOOM_SETTINGS)
+            if isinstance(bloom_config, dict):
+                bloom_settings.update({k: v for k, v in bloom_config.items() if k in DEFAULT_BLOOM_SETTINGS})
+            if bloom_settings["enabled"]:
+                self.bloom_settings = bloom_settings
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bloom_hits = 0
+
+    @staticmethod
+    def _entry_size(key: str) -> int:
+        return sys.getsizeof(key) + ENTRY_OVERHEAD
+
+    def _schedule(self, key: str, expires_at: float):
+        """把条目放入到期时间所在的桶"""
+        slot = math.ceil(expires_at / self.resolution)
+        bucket = self._wheel.get(slot)
+        if bucket is None:
+            self._wheel[slot] = bucket = {}
+            heapq.heappush(self._slots, slot)
+        bucket[key] = None
+
+    def _remove(self, key: str):
+        """删除条目，同时从所在的桶中移除"""
+        expires_at = self._entries.pop(key)
+        self._bytes -= self._entry_size(key)
+        bucket = self._wheel.get(math.ceil(expires_at / self.resolution))
+        if bucket is not None:
+            bucket.pop(key, None)
+
+    def _expire(self, now: float):
+        """清理所有已到期的桶"""
+        current_slot = math.floor(now / self.resolution)
+        while self._slots and self._slots[0] <= current_slot:
+            slot = heapq.heappop(self._slots)
+            for key in self._wheel.pop(slot):
+                del self._entries[key]
+                self._bytes -= self._entry_size(key)
+                self.expirations += 1
+
+    def _evict(self):
+        """超出条目数或内存上限时淘汰最早插入的条目"""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _bloom_for(self, ttl: float) -> Optional[RotatingBloom]:
+        """获取去重窗口对应的布隆过滤器层，窗口不超过精确缓存保留时间时不使用"""
+        if self.bloom_settings is None or ttl <= self.max_ttl:
+            return None
+        bloom = self.blooms.get(ttl)
+        if bloom is None:
+            self.blooms[ttl] = bloom = RotatingBloom(self.bloom_settings, ttl)
+        return bloom
+
+    def check_and_add(self, key: str, ttl: float) -> bool:
+        """检查消息ID是否在去重窗口内出现过，未出现时记录
+
+        Args:
+            key: 消息ID
+            ttl: 去重窗口（秒）
+
+        Returns:
+            是否为重复消息
+        """
+        now = time.time()
+        self._expire(now)
+
+        expires_at = self._entries.get(key)
+        if expires_at is not None and expires_at > now:
+            self.hits += 1
+            return True
+
+        # 超出精确缓存保留时间的窗口由布隆过滤器层判断
+        bloom = self._bloom_for(ttl)
+        if bloom is not None and bloom.check_and_add(key, now):
+            self.hits += 1
+            self.bloom_hits += 1
+            return True
+
+        self.misses += 1
+        if expires_at is not None:
+            self._remove(key)
+        expires_at = now + min(ttl, self.max_ttl)
+        self._entries[key] = expires_at
+        self._bytes += self._entry_size(key)
+        self._schedule(key, expires_at)
+        self._evict()
+        return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        self._expire(time.time())
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "buckets": len(self._wheel),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "bloom_hits": self.bloom_hits,
+            "bloom": [bloom.stats() for bloom in self.blooms.values()] if self.bloom_settings else None
+        }
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+"""
+去重存储模块
+提供可插拔的去重存储：进程内存、同一主机多个工作进程共享的SQLite文件、
+以及多节点共享的Redis协议存储。共享存储把同一批次内的检查合并为一次
+事务或流水线请求，避免每条消息一次往返
+"""
+
+import os
+import abc
+import time
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, unquote
+from loguru import logger
+from typing import Dict, List, Optional, Any, Tuple
+
+from dedup_cache import DedupCache
+
+# 去重存储默认参数，可通过 dedup.store 配置覆盖
+DEFAULT_STORE_SETTINGS = {
+    "backend": "memory",                  # memory / sqlite / redis
+    "path": "data/dedup.db",              # sqlite 文件路径，可放在 /dev/shm 下
+    "url": "redis://127.0.0.1:6379/0",    # redis 地址
+    "key_prefix": "webhook:dedup:",       # redis 键前缀
+    "batch_interval": 0.001,              # 批量窗口（秒），窗口内的检查合并为一次请求
+    "max_batch_size": 500,                # 单批最多包含的检查数
+    "timeout": 1.0,                       # 单批请求超时（秒）
+    "purge_interval": 60,                 # sqlite 清理过期条目的间隔（秒）
+    "fail_open": True                     # 存储不可用时放行消息（可能重复），否则拒收
+}
+
+
+class DedupStoreError(Exception):
+    """去重存储不可用"""
+
+
+class DedupStore(abc.ABC):
+    """去重存储接口"""
+
+    name = "base"
+
+    def __init__(self, settings: dict):
+        """初始化去重存储
+
+        Args:
+            settings: 合并后的存储配置
+        """
+        self.settings = settings
+        self.errors = 0
+
+    async def open(self):
+        """打开存储"""
+
+    async def close(self):
+        """关闭存储"""
+
+    @abc.abstractmethod
+    async def check_and_add(self, key: str, ttl: float) -> bool:
+        """原子地检查消息ID是否在去重窗口内出现过，未出现时记录
+
+        Args:
+            key: 消息ID
+            ttl: 去重窗口（秒）
+
+        Returns:
+            是否为重复消息
+
+        Raises:
+            DedupStoreError: 存储不可用且配置为不放行时
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        return {"backend": self.name, "errors": self.errors}
+
+
+class MemoryDedupStore(DedupStore):
+    """进程内存去重存储，只对当前进程有效"""
+
+    name = "memory"
+
+    def __init__(self, settings: dict, cache_config: Optional[dict] = None):
+        super().__init__(settings)
+        self.cache = DedupCache(cache_config)
+
+    async def check_and_add(self, key: str, ttl: float) -> bool:
+        return self.cache.check_and_add(key, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), **self.cache.stats()}
+
+
+class BatchingDedupStore(DedupStore):
+    """共享去重存储的基类
+
+    批量窗口内到达的检查合并为一批，由子类在一次请求中原子地逐条检查并记录；
+    同一批内的重复ID按先后顺序判断。
+    """
+
+    def __init__(self, settings: dict):
+        super().__init__(settings)
+        self._pending: List[Tuple[str, float, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.batches = 0
+        self.checked = 0
+        self.duplicates = 0
+
+    async def open(self):
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(), name=f"dedup-store-{self.name}")
+        await self._connect()
+
+    async def close(self):
+        if self._flush_task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._flush_task
+        await self._disconnect()
+
+    async def _connect(self):
+        """建立连接（子类实现）"""
+
+    async def _disconnect(self):
+        """断开连接（子类实现）"""
+
+    @abc.abstractmethod
+    async def _check_batch(self, items: List[Tuple[str, float]]) -> List[bool]:
+        """在一次请求中检查并记录一批消息ID（子类实现），超过 timeout 时抛出异常
+
+        Args:
+            items: (消息ID, 去重窗口) 列表
+
+        Returns:
+            与输入一一对应的是否重复
+        """
+
+    async def check_and_add(self, key: str, ttl: float) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((key, ttl, future))
+        self._wakeup.set()
+        return await future
+
+    async def _flush_loop(self):
+        """批量循环：等待一个批量窗口后把积累的检查一次发出"""
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._closing:
+                await asyncio.sleep(self.settings["batch_interval"])
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        """发出当前积累的检查"""
+        while self._pending:
+            batch_size = self.settings["max_batch_size"]
+            batch, self._pending = self._pending[:batch_size], self._pending[batch_size:]
+            try:
+                results = await self._check_batch([(key, ttl) for key, ttl, _ in batch])
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"去重存储 {self.name} 请求失败: {e!r}")
+                for _, _, future in batch:
+                    if future.done():
+                        continue
+                    if self.settings["fail_open"]:
+                        future.set_result(False)
+                    else:
+                        future.set_exception(DedupStoreError(str(e)))
+                continue
+
+            self.batches += 1
+            self.checked += len(batch)
+            for (_, _, future), duplicate in zip(batch, results):
+                self.duplicates += duplicate
+                if not future.done():
+                    future.set_result(duplicate)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "checked": self.checked,
+            "duplicates": self.duplicates
+        }
+
+
+class SqliteDedupStore(BatchingDedupStore):
+    """SQLite文件去重存储，同一主机上的多个工作进程共享
+
+    每批检查在一个 BEGIN IMMEDIATE 事务中用 UPSERT 完成，
+    只有插入新ID或覆盖已过期ID时才视为新消息。
+    """
+
+    name = "sqlite"
+
+    _UPSERT = (
+        "INSERT INTO dedup (key, expires_at) VALUES (?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at "
+        "WHERE dedup.expires_at <= ?"
+    )
+
+    def __init__(self, settings: dict):
+        super().__init__(settings)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._last_purge = 0.0
+
+    async def _run(self, func, *args):
+        """在数据库线程中执行函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _connect(self):
+        path = self.settings["path"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup-store")
+        await self._run(self._open_db, path)
+        logger.info(f"去重存储已打开: sqlite {path}")
+
+    def _open_db(self, path: str):
+        """打开数据库并初始化表结构（数据库线程）"""
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dedup (key TEXT PRIMARY KEY, expires_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn = conn
+
+    async def _disconnect(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    async def _check_batch(self, items: List[Tuple[str, float]]) -> List[bool]:
+        # 超时只限制等待数据库线程的时间：事务开始后线程无法中断，提交的记录会让客户端重试时被当作重复消息，
+        # 因此事务一旦开始就等它完成
+        state = {"started": False, "abandoned": False}
+        lock = threading.Lock()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._check_rows, items, state, lock)
+        done, _ = await asyncio.wait({future}, timeout=self.settings["timeout"])
+        if not done:
+            with lock:
+                if not state["started"]:
+                    state["abandoned"] = True
+            if state["abandoned"]:
+                # 线程之后取到这一批时直接跳过
+                future.add_done_callback(lambda f: f.exception())
+                raise DedupStoreError(f"等待数据库线程超过 {self.settings['timeout']} 秒")
+        return await future
+
+    def _check_rows(self, items: List[Tuple[str, float]], state: dict, lock: threading.Lock) -> List[bool]:
+        """在一个事务中检查并记录一批消息ID（数据库线程）"""
+        with lock:
+            if state["abandoned"]:
+                raise DedupStoreError("等待超时，已放弃这一批检查")
+            state["started"] = True
+        now = time.time()
+        results = []
+        cursor = self._conn.cursor()
+        # IMMEDIATE 事务先取得写锁，多个进程之间的检查与写入是原子的
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for key, ttl in items:
+                cursor.execute(self._UPSERT, (key, now + ttl, now))
+                results.append(cursor.rowcount == 0)
+            if now - self._last_purge >= self.settings["purge_interval"]:
+                cursor.execute("DELETE FROM dedup WHERE expires_at <= ?", (now,))
+                self._last_purge = now
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return results
+
+
+class RedisDedupStore(BatchingDedupStore):
+    """Redis协议去重存储，多个节点共享
+
+    每批检查以流水线方式发送 SET key 1 NX PX ttl，一次往返完成；
+    SET NX 在服务端原子执行，返回空值表示ID已存在。
+    """
+
+    name = "redis"
+
+    def __init__(self, settings: dict):
+        super().__init__(settings)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(*args: Any) -> bytes:
+        """按RESP协议编码一条命令"""
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        """读取一个RESP应答"""
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("连接已关闭")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise DedupStoreError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise DedupStoreError(f"无法解析的应答: {line!r}")
+
+    async def _connect(self):
+        url = urlparse(self.settings["url"])
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(url.hostname or "127.0.0.1", url.port or 6379),
+            timeout=self.settings["timeout"]
+        )
+
+        commands = []
+        if url.password:
+            if url.username:
+                commands.append(self._encode("AUTH", unquote(url.username), unquote(url.password)))
+            else:
+                commands.append(self._encode("AUTH", unquote(url.password)))
+        db = url.path.lstrip("/")
+        if db and db != "0":
+            commands.append(self._encode("SELECT", db))
+        if commands:
+            self._writer.write(b"".join(commands))
+            for _ in commands:
+                await self._read_reply()
+        logger.info(f"去重存储已连接: redis {url.hostname}:{url.port or 6379}")
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._reader = self._writer = None
+
+    async def _check_batch(self, items: List[Tuple[str, float]]) -> List[bool]:
+        return await asyncio.wait_for(self._pipeline(items), timeout=self.settings["timeout"])
+
+    async def _pipeline(self, items: List[Tuple[str, float]]) -> List[bool]:
+        """以流水线方式发送一批 SET NX 并读取应答"""
+        prefix = self.settings["key_prefix"]
+        payload = b"".join(
+            self._encode("SET", prefix + key, "1", "NX", "PX", max(1, int(ttl * 1000)))
+            for key, ttl in items
+        )
+
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                self._writer.write(payload)
+                await self._writer.drain()
+                replies = [await self._read_reply() for _ in items]
+            except BaseException:
+                # 流水线中途失败后连接上的应答已错位，下次重新连接
+                await self._disconnect()
+                raise
+
+        return [reply is None for reply in replies]
+
+    async def open(self):
+        try:
+            await super().open()
+        except (OSError, asyncio.TimeoutError) as e:
+            # 启动时连不上不影响服务启动，下一批检查时重连
+            self.errors += 1
+            logger.error(f"连接去重存储 redis 失败: {e!r}")
+
+
+def create_dedup_store(store_config: Optional[dict] = None, cache_config: Optional[dict] = None) -> DedupStore:
+    """根据配置创建去重存储
+
+    Args:
+        store_config: dedup.store 配置
+        cache_config: dedup.cache 配置，仅内存存储使用
+
+    Returns:
+        去重存储
+    """
+    settings = dict(DEFAULT_STORE_SETTINGS)
+    settings.update({k: v for k, v in (store_config or {}).items() if k in DEFAULT_STORE_SETTINGS})
+
+    backend = settings["backend"]
+    if backend == "sqlite":
+        return SqliteDedupStore(settings)
+    if backend == "redis":
+        return RedisDedupStore(settings)
+    if backend != "memory":
+        logger.warning(f"未知的去重存储类型: {backend}，使用内存存储")
+    return MemoryDedupStore(settings, cache_config)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+持久化投递日志模块
+使用WAL模式的SQLite记录每条消息及其在每个目标上的投递状态，
+服务重启后只重放尚未投递的 (消息, 目标) 组合
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from typing import Dict, List, Optional, Any, Tuple
+
+import json_codec
+
+# 投递日志默认参数
+DEFAULT_JOURNAL_SETTINGS = {
+    "enabled": False,
+    "path": "data/delivery_journal.db",
+    "commit_interval": 0.002,     # 组提交窗口（秒），窗口内的写入合并为一个事务
+    "max_batch_size": 1000,       # 单个事务最多包含的写操作数
+    "retention_seconds": 3600,    # 已完成投递的消息保留时间（秒）
+    "compact_interval": 300       # 压缩间隔（秒）
+}
+
+# 投递状态
+STATE_PENDING = "pending"
+STATE_DELIVERED = "delivered"
+STATE_FAILED = "failed"
+STATE_DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id TEXT,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    message_rowid INTEGER NOT NULL,
+    target_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (message_rowid, target_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_deliveries_state ON deliveries (state);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at);
+"""
+
+
+class DeliveryJournal:
+    """持久化投递日志
+
+    所有数据库操作都在单独的写线程中执行，不阻塞事件循环；
+    同一提交窗口内的写操作合并为一个事务（组提交）。
+    """
+
+    def __init__(self, journal_config: Optional[dict] = None):
+        """初始化投递日志
+
+        Args:
+            journal_config: 投递日志配置
+        """
+        self.settings = dict(DEFAULT_JOURNAL_SETTINGS)
+        self.settings.update(journal_config or {})
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._ops: List[tuple] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._compact_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._committed = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用持久化投递日志"""
+        return bool(self.settings.get("enabled"))
+
+    async def open(self):
+        """打开数据库并启动组提交和压缩任务"""
+        path = self.settings["path"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 单线程执行器保证同一时间只有一个线程使用数据库连接
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delivery-journal")
+        await self._run(self._open_db, path)
+
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(), name="delivery-journal-flush")
+        self._compact_task = asyncio.create_task(self._compact_loop(), name="delivery-journal-compact")
+        logger.info(f"持久化投递日志已打开: {path}")
+
+    async def close(self):
+        """提交剩余写操作并关闭数据库"""
+        self._compact_task.cancel()
+        await asyncio.gather(self._compact_task, return_exceptions=True)
+
+        # 让组提交循环写完剩余操作后自行退出
+        self._closing = True
+        self._wakeup.set()
+        await self._flush_task
+
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+        logger.info("持久化投递日志已关闭")
+
+    async def _run(self, func, *args):
+        """在写线程中执行函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open_db(self, path: str):
+        """打开数据库并初始化表结构（写线程）"""
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # auto_vacuum 必须在建表前设置，压缩时才能用 incremental_vacuum 归还空间
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 只在检查点时 fsync，单次提交不等待磁盘
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def record(self, message: dict, target_ids: List[str], encoded: Optional[bytes] = None) -> "asyncio.Future":
+        """记录新消息及其待投递目标，提交后返回日志ID
+
+        Args:
+            message: 消息内容
+            target_ids: 目标ID列表
+            encoded: 可选，已编码的消息JSON字节
+
+        Returns:
+            提交完成后得到日志ID的 Future
+        """
+        future = asyncio.get_running_loop().create_future()
+        payload = (json_codec.dumps(message) if encoded is None else encoded).decode("utf-8")
+        self._ops.append(("record", message.get("_id"), payload, list(target_ids), future))
+        self._wakeup.set()
+        return future
+
+    def mark(self, journal_id: int, target_id: str, state: str):
+        """更新 (消息, 目标) 的投递状态，随下一次组提交写入
+
+        Args:
+            journal_id: 日志ID
+            target_id: 目标ID
+            state: 投递状态
+        """
+        self._ops.append(("mark", journal_id, target_id, state))
+        self._wakeup.set()
+
+    async def _flush_loop(self):
+        """组提交循环：等待一个提交窗口后把积累的写操作合并提交"""
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._closing:
+                await asyncio.sleep(self.settings["commit_interval"])
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        """提交当前积累的写操作"""
+        while self._ops:
+            batch_size = self.settings["max_batch_size"]
+            batch, self._ops = self._ops[:batch_size], self._ops[batch_size:]
+            try:
+                journal_ids = await self._run(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"写入投递日志失败: {e}")
+                for op in batch:
+                    if op[0] == "record" and not op[-1].done():
+                        op[-1].set_exception(e)
+                continue
+
+            for op, journal_id in zip(batch, journal_ids):
+                if op[0] == "record" and not op[-1].done():
+                    op[-1].set_result(journal_id)
+
+    def _write_batch(self, batch: List[tuple]) -> List[Optional[int]]:
+        """在一个事务中执行一批写操作（写线程）
+
+        Args:
+            batch: 写操作列表
+
+        Returns:
+            与写操作一一对应的日志ID，mark 操作为 None
+        """
+        now = time.time()
+        journal_ids = []
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for op in batch:
+                if op[0] == "record":
+                    _, message_id, payload, target_ids, _ = op
+                    cursor.execute(
+                        "INSERT INTO messages (message_id, payload, created_at) VALUES (?, ?, ?)",
+                        (message_id, payload, now)
+                    )
+                    journal_id = cursor.lastrowid
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO deliveries (message_rowid, target_id, state, updated_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        [(journal_id, target_id, STATE_PENDING, now) for target_id in target_ids]
+                    )
+                    journal_ids.append(journal_id)
+                else:
+                    _, journal_id, target_id, state = op
+                    cursor.execute(
+                        "UPDATE deliveries SET state = ?, updated_at = ? WHERE message_rowid = ? AND target_id = ?",
+                        (state, now, journal_id, target_id)
+                    )
+                    journal_ids.append(None)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        self._committed += len(batch)
+        return journal_ids
+
+    async def load_pending(self) -> List[Tuple[int, dict, str]]:
+        """读取所有尚未投递的 (消息, 目标) 组合
+
+        Returns:
+            (日志ID, 消息, 目标ID) 列表，按日志ID排序，同一消息共享同一个消息对象
+        """
+        return await self.load_state(STATE_PENDING)
+
+    async def load_state(self, state: str) -> List[Tuple[int, dict, str]]:
+        """读取处于指定投递状态的 (消息, 目标) 组合
+
+        Args:
+            state: 投递状态
+
+        Returns:
+            (日志ID, 消息, 目标ID) 列表，按日志ID排序，同一消息共享同一个消息对象
+        """
+        await self._flush()
+        rows = await self._run(self._load_state_rows, state)
+        messages: Dict[int, dict] = {}
+        pending = []
+        for journal_id, payload, target_id in rows:
+            if journal_id not in messages:
+                messages[journal_id] = json_codec.loads(payload)
+            pending.append((journal_id, messages[journal_id], target_id))
+        return pending
+
+    def _load_state_rows(self, state: str) -> List[tuple]:
+        """查询指定状态的投递记录（写线程）"""
+        return self._conn.execute(
+            "SELECT m.id, m.payload, d.target_id FROM deliveries d "
+            "JOIN messages m ON m.id = d.message_rowid "
+            "WHERE d.state = ? ORDER BY m.id",
+            (state,)
+        ).fetchall()
+
+    async def _compact_loop(self):
+        """定期压缩投递日志"""
+        while True:
+            await asyncio.sleep(self.settings["compact_interval"])
+            try:
+                removed = await self.compact()
+                if removed:
+                    logger.info(f"投递日志压缩完成，清理 {removed} 条消息")
+            except Exception as e:
+                logger.error(f"压缩投递日志失败: {e}")
+
+    async def compact(self) -> int:
+        """删除超过保留时间且已没有待投递目标或死信的消息，并归还磁盘空间
+
+        Returns:
+            清理的消息数量
+        """
+        await self._flush()
+        return await self._run(self._compact, time.time() - self.settings["retention_seconds"])
+
+    def _compact(self, cutoff: float) -> int:
+        """执行压缩（写线程）"""
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(
+                "DELETE FROM messages WHERE created_at < ? AND NOT EXISTS ("
+                "SELECT 1 FROM deliveries d WHERE d.message_rowid = messages.id AND d.state IN (?, ?))",
+                (cutoff, STATE_PENDING, STATE_DEAD)
+            )
+            removed = cursor.rowcount
+            cursor.execute(
+                "DELETE FROM deliveries WHERE message_rowid NOT IN (SELECT id FROM messages)"
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        # 截断WAL文件并归还空闲页
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.execute("PRAGMA incremental_vacuum")
+        return removed
+
+    async def stats(self) -> Dict[str, Any]:
+        """获取投递日志统计信息
+
+        Returns:
+            各投递状态的数量及数据库文件大小
+        """
+        rows = await self._run(
+            lambda: self._conn.execute("SELECT state, COUNT(*) FROM deliveries GROUP BY state").fetchall()
+        )
+        path = self.settings["path"]
+        wal_path = f"{path}-wal"
+        return {
+            "path": path,
+            "states": dict(rows),
+            "pending_ops": len(self._ops),
+            "committed_ops": self._committed,
+            "db_bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+            "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        }
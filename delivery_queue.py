@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""
+异步投递队列模块
+为每个目标维护有界队列和后台工作协程，实现先接收、后投递
+"""
+
+import time
+import asyncio
+from collections import deque
+from loguru import logger
+from typing import Dict, List, Optional, Any, Callable, Awaitable
+
+# 异步投递默认参数
+DEFAULT_QUEUE_SETTINGS = {
+    "max_queue_size": 1000,   # 单个目标队列最大长度，可被目标的 queue_size 覆盖
+    "workers_per_target": 1,  # 单个目标的工作协程数，可被目标的 queue_workers 覆盖
+    "drain_timeout": 5.0      # 关闭时等待队列排空的最长时间（秒）
+}
+
+SendFunc = Callable[[dict, dict, Any, Any], Awaitable[dict]]
+
+
+class TargetQueue:
+    """单个目标的有界队列及其工作协程"""
+
+    def __init__(self, target: dict, maxsize: int, workers: int):
+        """初始化目标队列
+
+        Args:
+            target: 目标配置
+            maxsize: 队列最大长度
+            workers: 工作协程数
+        """
+        self.target = target
+        # 容量由队列自己检查，配置热加载时可以调整
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.maxsize = maxsize
+        self.workers = workers
+        self.tasks: List[asyncio.Task] = []
+        self.reserved = 0
+        self.delivered = 0
+        self.failed = 0
+        # 队列中各消息的入队时间，与队列同样先进先出，队首即最早入队的消息
+        self._enqueued_at: deque = deque()
+        self._not_full = asyncio.Event()
+
+    def put_nowait(self, item: tuple):
+        """放入 (入队时间, 消息, 入队凭据, 投递上下文)，队列已满时抛出 QueueFull"""
+        if self.queue.qsize() >= self.maxsize:
+            raise asyncio.QueueFull
+        self.queue.put_nowait(item)
+        self._enqueued_at.append(item[0])
+
+    async def put(self, item: tuple):
+        """放入一条消息，队列已满时等待空位"""
+        while self.queue.qsize() >= self.maxsize:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put_nowait(item)
+
+    async def get(self) -> tuple:
+        """取出最早入队的消息"""
+        item = await self.queue.get()
+        self._enqueued_at.popleft()
+        self._not_full.set()
+        return item
+
+    def resize(self, maxsize: int):
+        """修改队列容量，已在队列中的消息不受影响"""
+        self.maxsize = maxsize
+        self._not_full.set()
+
+    def free(self) -> int:
+        """未被占用或预留的空位数"""
+        return self.maxsize - self.queue.qsize() - self.reserved
+
+    def oldest_age(self, now: float) -> float:
+        """获取队列中最早消息的等待时间（秒）"""
+        if not self._enqueued_at:
+            return 0.0
+        return round(now - self._enqueued_at[0], 3)
+
+
+class DeliveryQueueManager:
+    """异步投递队列管理器
+
+    路由配置 delivery_mode 为 async 时，消息只需入队即可返回，
+    由每个目标的后台工作协程按顺序投递。
+    """
+
+    def __init__(self, queue_config: Optional[dict] = None):
+        """初始化投递队列管理器
+
+        Args:
+            queue_config: 异步投递配置
+        """
+        self.settings = dict(DEFAULT_QUEUE_SETTINGS)
+        self.settings.update(queue_config or {})
+        self._queues: Dict[str, TargetQueue] = {}
+        self._send: Optional[SendFunc] = None
+
+    def update_config(self, queue_config: Optional[dict]):
+        """更新异步投递配置，已有目标队列按新参数调整容量和工作协程数
+
+        Args:
+            queue_config: 异步投递配置
+        """
+        settings = dict(DEFAULT_QUEUE_SETTINGS)
+        settings.update(queue_config or {})
+        self.settings = settings
+        for target_queue in self._queues.values():
+            self._apply_sizing(target_queue)
+
+    def _apply_sizing(self, target_queue: TargetQueue):
+        """按目标配置和全局参数设置队列容量和工作协程数
+
+        容量缩小时已在队列中的消息照常投递；工作协程减少时多余的协程完成当前投递后退出。
+        """
+        target = target_queue.target
+        maxsize = target.get("queue_size") or self.settings["max_queue_size"]
+        if maxsize != target_queue.maxsize:
+            target_queue.resize(maxsize)
+        target_queue.workers = target.get("queue_workers") or self.settings["workers_per_target"]
+
+        target_queue.tasks = [task for task in target_queue.tasks if not task.done()]
+        for _ in range(target_queue.workers - len(target_queue.tasks)):
+            target_queue.tasks.append(asyncio.create_task(
+                self._worker(target_queue),
+                name=f"delivery-{target.get('id')}"
+            ))
+
+    async def start(self, send: SendFunc):
+        """启动队列管理器
+
+        Args:
+            send: 实际发送函数，参数为 (消息, 目标配置, 入队凭据, 投递上下文)，返回包含 success 字段的结果
+        """
+        self._send = send
+        logger.info("异步投递队列已启动")
+
+    async def close(self):
+        """等待队列在限定时间内排空，然后停止所有工作协程"""
+        queues = list(self._queues.values())
+        self._queues.clear()
+
+        pending = [q.queue.join() for q in queues if not q.queue.empty()]
+        if pending:
+            try:
+                await asyncio.wait_for(asyncio.gather(*pending), timeout=self.settings["drain_timeout"])
+            except asyncio.TimeoutError:
+                remaining = sum(q.queue.qsize() for q in queues)
+                logger.warning(f"关闭时仍有 {remaining} 条消息未投递")
+
+        tasks = [task for q in queues for task in q.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("异步投递队列已关闭")
+
+    def _get_queue(self, target: dict) -> TargetQueue:
+        """获取目标队列，不存在时创建并启动工作协程
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            目标队列
+        """
+        target_id = target.get("id")
+        target_queue = self._queues.get(target_id)
+        if target_queue is None:
+            target_queue = TargetQueue(
+                target,
+                maxsize=target.get("queue_size") or self.settings["max_queue_size"],
+                workers=target.get("queue_workers") or self.settings["workers_per_target"]
+            )
+            self._apply_sizing(target_queue)
+            self._queues[target_id] = target_queue
+        elif target_queue.target is not target:
+            # 使用最新的目标配置投递
+            target_queue.target = target
+            self._apply_sizing(target_queue)
+
+        return target_queue
+
+    async def _worker(self, target_queue: TargetQueue):
+        """目标工作协程，持续从队列取出消息并投递
+
+        Args:
+            target_queue: 目标队列
+        """
+        while True:
+            # 工作协程数被调小时，多余的协程在两次投递之间退出
+            if len(target_queue.tasks) > target_queue.workers:
+                target_queue.tasks.remove(asyncio.current_task())
+                return
+            enqueued_at, message, ticket, context = await target_queue.get()
+            target = target_queue.target
+            success = False
+            try:
+                success = (await self._send(message, target, ticket, context))["success"]
+            except asyncio.CancelledError:
+                # 关闭时被中断的投递不记为完成，持久化日志会在重启后重放
+                target_queue.queue.task_done()
+                raise
+            except Exception as e:
+                logger.error(f"异步投递到 {target.get('name')} 时出错: {e}")
+
+            if success:
+                target_queue.delivered += 1
+            else:
+                target_queue.failed += 1
+            target_queue.queue.task_done()
+
+    def reserve(self, targets: List[dict]) -> List[bool]:
+        """为一条消息在各目标队列中预留空位
+
+        预留的空位在 enqueue 或 release 之前不会被其他消息占用，
+        调用方可以在去重、记录历史和投递日志之前确认消息能够入队。
+
+        Args:
+            targets: 目标配置列表
+
+        Returns:
+            与 targets 一一对应，是否预留成功（队列已满时为 False）
+        """
+        reserved = []
+        for target in targets:
+            target_queue = self._get_queue(target)
+            ok = target_queue.free() > 0
+            if ok:
+                target_queue.reserved += 1
+            reserved.append(ok)
+        return reserved
+
+    def release(self, targets: List[dict], reserved: List[bool]):
+        """释放 reserve 预留但不再使用的空位"""
+        for target, ok in zip(targets, reserved):
+            target_queue = self._queues.get(target.get("id"))
+            if ok and target_queue is not None:
+                target_queue.reserved = max(0, target_queue.reserved - 1)
+
+    def enqueue(self, message: dict, targets: List[dict], ticket: Any = None, context: Any = None,
+                reserved: Optional[List[bool]] = None) -> List[dict]:
+        """将消息放入各目标队列
+
+        Args:
+            message: 消息内容
+            targets: 目标配置列表
+            ticket: 入队凭据，投递时原样传给发送函数
+            context: 各目标共享的投递上下文，投递时原样传给发送函数
+            reserved: reserve 的结果，提供时使用预留的空位，未预留到空位的目标不入队
+
+        Returns:
+            入队结果列表，队列已满的目标 queued 为 False
+        """
+        now = time.time()
+        results = []
+
+        for index, target in enumerate(targets):
+            target_queue = self._get_queue(target)
+            if reserved is not None and reserved[index]:
+                target_queue.reserved = max(0, target_queue.reserved - 1)
+                has_room = True
+            else:
+                # 其他消息预留的空位不能占用
+                has_room = target_queue.free() > 0
+
+            queued = False
+            if has_room:
+                try:
+                    target_queue.put_nowait((now, message, ticket, context))
+                    queued = True
+                except asyncio.QueueFull:
+                    pass
+            if not queued:
+                logger.warning(f"目标 {target.get('name')} 的投递队列已满，丢弃消息 ID:{message.get('_id')}")
+
+            results.append({
+                "target_id": target.get("id"),
+                "target_name": target.get("name"),
+                "queued": queued
+            })
+
+        return results
+
+    async def put(self, message: dict, target: dict, ticket: Any = None):
+        """将消息放入目标队列，队列已满时等待空位
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 入队凭据
+        """
+        await self._get_queue(target).put((time.time(), message, ticket, None))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取队列统计信息
+
+        Returns:
+            每个目标的队列深度、最早消息等待时间及投递计数
+        """
+        now = time.time()
+        return {
+            target_id: {
+                "target_name": q.target.get("name"),
+                "depth": q.queue.qsize(),
+                "max_size": q.maxsize,
+                "oldest_age": q.oldest_age(now),
+                "workers": q.workers,
+                "delivered": q.delivered,
+                "failed": q.failed
+            }
+            for target_id, q in self._queues.items()
+        }
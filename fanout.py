@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+并发扇出模块
+将一条消息同时分发到多个目标，并限制全局及单个目标的在途请求数
+"""
+
+import asyncio
+import contextvars
+from loguru import logger
+from typing import Dict, List, Optional, Callable, Awaitable, Tuple, Union
+
+# 扇出默认参数
+DEFAULT_FANOUT_SETTINGS = {
+    "max_concurrency": 100,       # 全局最大在途发送数
+    "per_target_concurrency": 4   # 单个目标默认最大在途发送数，可被目标的 max_concurrency 覆盖
+}
+
+# 发送函数返回结果字典，或返回稍后得到结果的 Future（如消息合并的批次）
+SendFunc = Callable[[dict, dict], Awaitable[Union[dict, "asyncio.Future"]]]
+
+# 扇出的每个目标都已发送完成或只剩等待 Future 时调用一次，由调用方在任务上下文中设置，
+# 可据此提前释放调用方自己的并发名额（如批量接收时等待合并批次的消息）
+settled_callback: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar(
+    "fanout_settled_callback", default=None
+)
+
+
+class FanoutEngine:
+    """并发扇出引擎
+
+    所有符合条件的目标同时发起发送，每个目标在独立的任务中执行，
+    单个目标超时或出错不会取消或拖慢其他目标。
+    """
+
+    def __init__(self, fanout_config: Optional[dict] = None):
+        """初始化扇出引擎
+
+        Args:
+            fanout_config: 扇出配置
+        """
+        self.settings = dict(DEFAULT_FANOUT_SETTINGS)
+        self.settings.update(fanout_config or {})
+        self._global_semaphore = asyncio.Semaphore(self.settings["max_concurrency"])
+        self._target_semaphores: Dict[str, Tuple[int, asyncio.Semaphore]] = {}
+
+    def update_config(self, fanout_config: Optional[dict]):
+        """更新扇出配置，进行中的发送在原有名额内完成
+
+        Args:
+            fanout_config: 扇出配置
+        """
+        settings = dict(DEFAULT_FANOUT_SETTINGS)
+        settings.update(fanout_config or {})
+        if settings["max_concurrency"] != self.settings["max_concurrency"]:
+            self._global_semaphore = asyncio.Semaphore(settings["max_concurrency"])
+        # 目标信号量在下次取用时按新的上限重新创建
+        self.settings = settings
+
+    def _get_target_semaphore(self, target: dict) -> asyncio.Semaphore:
+        """获取目标的并发信号量，目标并发上限变化时重新创建
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            目标信号量
+        """
+        target_id = target.get("id")
+        limit = target.get("max_concurrency") or self.settings["per_target_concurrency"]
+
+        entry = self._target_semaphores.get(target_id)
+        if entry is None or entry[0] != limit:
+            entry = (limit, asyncio.Semaphore(limit))
+            self._target_semaphores[target_id] = entry
+
+        return entry[1]
+
+    async def _send_one(self, message: dict, target: dict, send: SendFunc,
+                        settle: Optional[Callable[[], None]] = None) -> dict:
+        """在全局和目标并发限制内发送到单个目标
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            send: 实际发送函数
+            settle: 发送完成或只剩等待 Future 时调用
+
+        Returns:
+            发送结果
+        """
+        # 先占用目标配额再占用全局配额，避免排队中的目标占住全局名额
+        try:
+            async with self._get_target_semaphore(target):
+                async with self._global_semaphore:
+                    result = await send(message, target)
+        finally:
+            if settle is not None:
+                settle()
+        # 返回 Future 时释放名额后再等待，等待合并窗口期间不占用目标的并发名额
+        if isinstance(result, asyncio.Future):
+            result = await result
+        return result
+
+    async def dispatch(self, message: dict, targets: List[dict], send: SendFunc) -> List[dict]:
+        """并发发送消息到所有目标
+
+        Args:
+            message: 消息内容
+            targets: 目标配置列表
+            send: 实际发送函数，返回至少包含 success 字段的结果字典，或得到该结果的 Future
+
+        Returns:
+            转发结果列表，顺序与 targets 一致
+        """
+        if not targets:
+            return []
+
+        on_settled = settled_callback.get()
+        remaining = len(targets)
+
+        def settle():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0 and on_settled is not None:
+                on_settled()
+
+        outcomes = await asyncio.gather(
+            *(self._send_one(message, target, send, settle) for target in targets),
+            return_exceptions=True
+        )
+
+        results = []
+        for target, outcome in zip(targets, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"转发消息到 {target.get('name')} 时出错: {outcome}")
+                outcome = {"success": False}
+            results.append({
+                "target_id": target.get("id"),
+                "target_name": target.get("name"),
+                **outcome
+            })
+
+        return results
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+webhook 快速通道
+原生 ASGI 应用包在 FastAPI 应用外层：请求路径命中 webhook 路由表时直接处理，
+不经过中间件、FastAPI 路由匹配和依赖解析，请求体只读取一次，校验和处理沿用编译后的路由；
+其余请求（管理接口、表单请求、CORS 预检、WebSocket 连接、生命周期事件）交给 FastAPI 应用
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from loguru import logger
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.requests import ClientDisconnect
+
+ASGIApp = Callable[[dict, Callable, Callable], Awaitable[None]]
+
+# 在快速通道中匹配路由：(路径, HTTP方法) -> (路由, 路径参数)，不处理时返回 None
+MatchFunc = Callable[[str, str], Optional[Tuple[Any, Dict[str, str]]]]
+
+# 处理请求：(路由, 路径参数, 路径, HTTP方法, 请求头, 查询参数, 请求体分块, Content-Type) -> (状态码, 响应内容)
+IngestFunc = Callable[
+    [Any, Dict[str, str], str, str, Mapping[str, str], Mapping[str, str], AsyncIterator[bytes], str],
+    Awaitable[Tuple[int, Any]]
+]
+
+# 需要 Starlette 解析的表单请求交给 FastAPI 处理
+_FORM_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+
+async def iter_body(receive: Callable) -> AsyncIterator[bytes]:
+    """按分块读取请求体，只读取一次
+
+    Raises:
+        ClientDisconnect: 请求体读完前客户端断开时，不完整的请求体不能当作完整的消息处理
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnect()
+        body = message.get("body", b"")
+        if body:
+            yield body
+        if not message.get("more_body", False):
+            return
+
+
+class FastIngestApp:
+    """webhook 快速通道 ASGI 应用"""
+
+    def __init__(self, app: ASGIApp, match: MatchFunc, ingest: IngestFunc, dumps: Callable[[Any], bytes]):
+        """初始化快速通道
+
+        Args:
+            app: 处理其余请求的 FastAPI 应用
+            match: 在 webhook 路由表中匹配请求
+            ingest: 处理匹配到的 webhook 请求
+            dumps: 把响应内容编码为JSON字节
+        """
+        self.app = app
+        self.match = match
+        self.ingest = ingest
+        self.dumps = dumps
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        matched = self.match(scope["path"], scope["method"])
+        headers = Headers(scope=scope) if matched is not None else None
+        content_type = headers.get("content-type", "").lower() if headers is not None else ""
+        if matched is None or any(form_type in content_type for form_type in _FORM_TYPES):
+            await self.app(scope, receive, send)
+            return
+
+        route, params = matched
+        try:
+            status, content = await self.ingest(
+                route, params, scope["path"], scope["method"], headers,
+                QueryParams(scope.get("query_string", b"")), iter_body(receive), content_type
+            )
+        except HTTPException as e:
+            status, content = e.status_code, {"detail": e.detail}
+        except ClientDisconnect:
+            # 连接已断开，无法再发送响应；已读取的部分请求体不处理
+            logger.warning(f"客户端在请求体读完前断开连接，丢弃请求: {scope['method']} {scope['path']}")
+            return
+
+        body = self.dumps(content)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
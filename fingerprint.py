@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+消息指纹模块
+为去重生成跨进程、跨重启稳定的消息指纹（规范化字节 + blake2b），
+并支持按路由配置指纹字段和去重窗口
+"""
+
+import json
+import hashlib
+from typing import List, Optional, Any, Mapping
+
+# 去重默认参数，可被全局 dedup 配置和路由的 dedup 配置逐级覆盖
+DEFAULT_DEDUP_SETTINGS = {
+    "enabled": True,
+    "window": 300,   # 去重窗口（秒）
+    "key": None      # 指纹字段：None 为整条消息，字段路径列表，"_id"，或 "header:<请求头名>"
+}
+
+# 计算整条消息指纹时排除的易变字段（服务端注入的路由信息和消息ID）
+VOLATILE_FIELDS = frozenset(("_route", "_id"))
+
+_MISSING = object()
+
+
+def canonical_bytes(value: Any) -> bytes:
+    """把值编码为规范化的JSON字节（键排序、无多余空白）
+
+    Args:
+        value: 任意可JSON序列化的值
+
+    Returns:
+        规范化字节
+    """
+    # 固定使用标准库编码：不同的JSON编解码器对浮点数指数、NaN 等值的编码不同，
+    # 指纹不能随部署环境安装的编解码器变化
+    try:
+        return _dumps_canonical(value)
+    except TypeError:
+        # 键类型混杂（如整数和字符串）时无法排序，统一转换为字符串键后再编码
+        return _dumps_canonical(_str_keys(value))
+
+
+def _dumps_canonical(value: Any) -> bytes:
+    return json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+
+def _str_keys(value: Any) -> Any:
+    """把字典的键递归转换为JSON编码后的字符串形式"""
+    if isinstance(value, Mapping):
+        return {_str_key(k): _str_keys(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_str_keys(v) for v in value]
+    return value
+
+
+def _str_key(key: Any) -> str:
+    if isinstance(key, str):
+        return key
+    # 与 json.dumps 对非字符串键的转换一致
+    return json.dumps(key) if isinstance(key, (bool, int, float)) or key is None else str(key)
+
+
+def digest(data: bytes) -> str:
+    """计算稳定的128位摘要
+
+    Args:
+        data: 字节数据
+
+    Returns:
+        十六进制摘要
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class DedupPolicy:
+    """路由的去重策略：指纹规则及去重窗口"""
+
+    def __init__(self, settings: dict):
+        """初始化去重策略
+
+        Args:
+            settings: 合并后的去重配置
+        """
+        self.enabled = bool(settings["enabled"])
+        self.window = float(settings["window"]) if self.enabled else 0.0
+
+        key = settings["key"]
+        self.explicit = key is not None
+        self.header: Optional[str] = None
+        self.use_id = False
+        self.paths: Optional[List[List[str]]] = None
+
+        if isinstance(key, str) and key.lower().startswith("header:"):
+            self.header = key.split(":", 1)[1].strip().lower()
+        elif key == "_id":
+            self.use_id = True
+        elif isinstance(key, str):
+            self.paths = [key.split(".")]
+        elif key:
+            # 预先拆分字段路径
+            self.paths = [path.split(".") for path in key]
+
+    @classmethod
+    def from_config(cls, global_config: Optional[dict], route_config: Optional[dict]) -> "DedupPolicy":
+        """根据全局及路由配置创建去重策略
+
+        Args:
+            global_config: 全局 dedup 配置
+            route_config: 路由的 dedup 配置
+
+        Returns:
+            去重策略
+        """
+        settings = dict(DEFAULT_DEDUP_SETTINGS)
+        for config in (global_config, route_config):
+            settings.update({k: v for k, v in (config or {}).items() if k in DEFAULT_DEDUP_SETTINGS})
+        return cls(settings)
+
+    @staticmethod
+    def _lookup(message: Any, parts: List[str]) -> Any:
+        """按预拆分的路径取值，不存在时返回占位对象"""
+        current = message
+        for part in parts:
+            if isinstance(current, dict) and part in current:
+                current = current[part]
+            else:
+                return _MISSING
+        return current
+
+    def fingerprint(self, message: Any, headers: Optional[Mapping[str, str]] = None) -> str:
+        """计算消息指纹
+
+        配置了请求头时优先使用请求头的值；配置为 "_id" 时使用生产者提供的 _id；
+        配置了字段路径时只对这些字段取指纹；否则对排除易变字段后的整条消息取指纹。
+        所需的请求头或 _id 不存在时回退为整条消息指纹。
+
+        Args:
+            message: 消息内容
+            headers: 请求头
+
+        Returns:
+            消息指纹
+        """
+        if self.header and headers is not None:
+            value = headers.get(self.header)
+            if value:
+                return digest(f"header:{value}".encode("utf-8"))
+
+        if isinstance(message, dict):
+            if self.use_id and message.get("_id"):
+                return str(message["_id"])
+
+            if self.paths is not None:
+                values = [self._lookup(message, parts) for parts in self.paths]
+                return digest(canonical_bytes([None if v is _MISSING else v for v in values]))
+
+            return digest(canonical_bytes({k: v for k, v in message.items() if k not in VOLATILE_FIELDS}))
+
+        return digest(canonical_bytes(message))
+
+    def message_id(self, message: dict, headers: Optional[Mapping[str, str]] = None) -> str:
+        """获取消息ID
+
+        未显式配置指纹字段时沿用生产者提供的 _id，否则使用消息指纹。
+
+        Args:
+            message: 消息内容
+            headers: 请求头
+
+        Returns:
+            消息ID
+        """
+        if not self.explicit and message.get("_id"):
+            return str(message["_id"])
+        return self.fingerprint(message, headers)
+
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+"""
+持久化消息历史模块
+使用WAL模式的SQLite记录每条消息、接收路由及其在每个目标上的投递结果，
+按时间、事件类型、交易对、路由和目标建立索引，支持保留策略和时间范围查询
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from loguru import logger
+from typing import Dict, List, Optional, Any
+
+import json_codec
+
+# 持久化消息历史默认参数
+DEFAULT_HISTORY_STORE_SETTINGS = {
+    "enabled": False,
+    "path": "data/history.db",
+    "commit_interval": 0.05,      # 组提交窗口（秒）
+    "max_batch_size": 2000,       # 单个事务最多包含的写操作数
+    "retention_days": 30,         # 消息保留天数
+    "max_rows": 5000000,          # 最多保留的消息数，超过时删除最旧的消息
+    "compact_interval": 600,      # 清理间隔（秒）
+    "delete_chunk": 10000         # 清理时单个事务最多删除的消息数，避免长时间占用写锁
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_messages (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT,
+    received_at REAL NOT NULL,
+    route TEXT,
+    event_type TEXT,
+    symbol TEXT,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history_deliveries (
+    message_rowid INTEGER NOT NULL,
+    target_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (message_rowid, target_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_history_received_at ON history_messages (received_at);
+CREATE INDEX IF NOT EXISTS idx_history_event_type ON history_messages (event_type, id);
+CREATE INDEX IF NOT EXISTS idx_history_symbol ON history_messages (symbol, id);
+CREATE INDEX IF NOT EXISTS idx_history_route ON history_messages (route, id);
+CREATE INDEX IF NOT EXISTS idx_history_message_id ON history_messages (message_id);
+CREATE INDEX IF NOT EXISTS idx_history_target ON history_deliveries (target_id, state, message_rowid);
+"""
+
+# 写线程记住的最近消息ID -> 行ID 数量，用于把投递结果关联到消息
+_ROWID_CACHE_SIZE = 10000
+
+
+class HistoryStore:
+    """持久化消息历史
+
+    写操作在单独的写线程中组提交，查询使用另一个只读连接，
+    WAL 模式下查询不会阻塞写入。
+    """
+
+    def __init__(self, store_config: Optional[dict] = None):
+        """初始化持久化消息历史
+
+        Args:
+            store_config: 持久化消息历史配置
+        """
+        self.settings = dict(DEFAULT_HISTORY_STORE_SETTINGS)
+        self.settings.update(store_config or {})
+        self._conn: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self._ops: List[tuple] = []
+        self._rowids: "OrderedDict[str, int]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._compact_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._committed = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否启用持久化消息历史"""
+        return bool(self.settings.get("enabled"))
+
+    async def open(self):
+        """打开数据库并启动组提交和清理任务"""
+        path = self.settings["path"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-store")
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-query")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._open_db, path)
+        await loop.run_in_executor(self._read_executor, self._open_reader, path)
+
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop(), name="history-store-flush")
+        self._compact_task = asyncio.create_task(self._compact_loop(), name="history-store-compact")
+        logger.info(f"持久化消息历史已打开: {path}")
+
+    async def close(self):
+        """提交剩余写操作并关闭数据库"""
+        self._compact_task.cancel()
+        await asyncio.gather(self._compact_task, return_exceptions=True)
+
+        self._closing = True
+        self._wakeup.set()
+        await self._flush_task
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._read_executor, self._reader.close)
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._read_executor.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        logger.info("持久化消息历史已关闭")
+
+    async def _run(self, func, *args):
+        """在写线程中执行函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _query(self, func, *args):
+        """在查询线程中执行函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, func, *args)
+
+    def _open_db(self, path: str):
+        """打开数据库并初始化表结构（写线程）"""
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def _open_reader(self, path: str):
+        """打开只读连接（查询线程）"""
+        self._reader = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def add(self, message: dict, encoded: Optional[bytes] = None):
+        """记录一条新消息，随下一次组提交写入
+
+        Args:
+            message: 消息内容
+            encoded: 可选，已编码的消息JSON字节
+        """
+        data = message.get("data")
+        symbol = message.get("symbol") or (data.get("symbol") if isinstance(data, dict) else None)
+        payload = (json_codec.dumps(message) if encoded is None else encoded).decode("utf-8")
+        self._ops.append((
+            "add", message.get("_id"), time.time(), (message.get("_route") or {}).get("path"),
+            message.get("event_type"), None if symbol is None else str(symbol), payload
+        ))
+        self._wakeup.set()
+
+    def track(self, message_id: str, target_ids: List[str], state: str):
+        """记录消息需要投递的目标及初始状态"""
+        for target_id in target_ids:
+            self.update(message_id, target_id, state)
+
+    def update(self, message_id: str, target_id: str, state: str):
+        """更新消息在某个目标上的投递结果，随下一次组提交写入"""
+        self._ops.append(("update", message_id, target_id, state, time.time()))
+        self._wakeup.set()
+
+    async def _flush_loop(self):
+        """组提交循环：等待一个提交窗口后把积累的写操作合并提交"""
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._closing:
+                await asyncio.sleep(self.settings["commit_interval"])
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        """提交当前积累的写操作"""
+        while self._ops:
+            batch_size = self.settings["max_batch_size"]
+            batch, self._ops = self._ops[:batch_size], self._ops[batch_size:]
+            try:
+                await self._run(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"写入持久化消息历史失败: {e}")
+
+    def _write_batch(self, batch: List[tuple]):
+        """在一个事务中执行一批写操作（写线程）"""
+        cursor = self._conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for op in batch:
+                if op[0] == "add":
+                    _, message_id, received_at, route, event_type, symbol, payload = op
+                    cursor.execute(
+                        "INSERT INTO history_messages (message_id, received_at, route, event_type, symbol, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (message_id, received_at, route, event_type, symbol, payload)
+                    )
+                    if message_id is not None:
+                        self._rowids[message_id] = cursor.lastrowid
+                        self._rowids.move_to_end(message_id)
+                        if len(self._rowids) > _ROWID_CACHE_SIZE:
+                            self._rowids.popitem(last=False)
+                else:
+                    _, message_id, target_id, state, updated_at = op
+                    rowid = self._rowids.get(message_id)
+                    if rowid is None:
+                        row = cursor.execute(
+                            "SELECT MAX(id) FROM history_messages WHERE message_id = ?", (message_id,)
+                        ).fetchone()
+                        rowid = row[0]
+                        if rowid is None:
+                            continue
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO history_deliveries (message_rowid, target_id, state, updated_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (rowid, target_id, state, updated_at)
+                    )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        self._committed += len(batch)
+
+    async def query(self, limit: int = 10, cursor: Optional[int] = None, since: Optional[float] = None,
+                    until: Optional[float] = None, route: Optional[str] = None,
+                    event_type: Optional[str] = None, symbol: Optional[str] = None,
+                    target_id: Optional[str] = None, outcome: Optional[str] = None) -> bytes:
+        """从新到旧查询消息历史
+
+        Args:
+            limit: 返回条数
+            cursor: 游标，只返回序号小于该值的消息
+            since: 起始时间（Unix 秒，含）
+            until: 结束时间（Unix 秒，不含）
+            route: 路由路径
+            event_type: 事件类型
+            symbol: 交易对
+            target_id: 目标ID，只返回投递到该目标的消息
+            outcome: 投递结果；指定 target_id 时匹配该目标的结果，否则匹配任一目标
+
+        Returns:
+            JSON字节：{"history": [...], "next_cursor": 下一页游标或 null}
+        """
+        return await self._query(
+            self._query_rows, max(1, limit), cursor, since, until, route, event_type, symbol, target_id, outcome
+        )
+
+    @staticmethod
+    def _id_bound(conn: sqlite3.Connection, value: float) -> Optional[int]:
+        """通过时间索引查找接收时间不早于 value 的第一条消息的行ID"""
+        row = conn.execute(
+            "SELECT id FROM history_messages WHERE received_at >= ? ORDER BY received_at LIMIT 1", (value,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _query_rows(self, limit: int, cursor: Optional[int], since: Optional[float], until: Optional[float],
+                    route: Optional[str], event_type: Optional[str], symbol: Optional[str],
+                    target_id: Optional[str], outcome: Optional[str]) -> bytes:
+        """执行查询并拼接JSON字节（查询线程）"""
+        # 行ID随接收时间递增，时间范围换算为行ID范围后按主键倒序扫描，无需排序
+        upper = cursor
+        if until is not None:
+            bound = self._id_bound(self._reader, until)
+            if bound is not None:
+                upper = bound if upper is None else min(upper, bound)
+        lower = None
+        if since is not None:
+            lower = self._id_bound(self._reader, since)
+            if lower is None:
+                return b'{"history":[],"next_cursor":null}'
+
+        conditions, params = [], []
+        if upper is not None:
+            conditions.append("m.id < ?")
+            params.append(upper)
+        if lower is not None:
+            conditions.append("m.id >= ?")
+            params.append(lower)
+        for column, value in (("route", route), ("event_type", event_type), ("symbol", symbol)):
+            if value is not None:
+                conditions.append(f"m.{column} = ?")
+                params.append(value)
+        if target_id is not None:
+            if outcome is not None:
+                conditions.append(
+                    "EXISTS (SELECT 1 FROM history_deliveries d WHERE d.message_rowid = m.id "
+                    "AND d.target_id = ? AND d.state = ?)"
+                )
+                params.extend((target_id, outcome))
+            else:
+                conditions.append(
+                    "EXISTS (SELECT 1 FROM history_deliveries d WHERE d.message_rowid = m.id AND d.target_id = ?)"
+                )
+                params.append(target_id)
+        elif outcome is not None:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM history_deliveries d WHERE d.message_rowid = m.id AND d.state = ?)"
+            )
+            params.append(outcome)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._reader.execute(
+            f"SELECT m.id, m.received_at, m.payload FROM history_messages m {where} ORDER BY m.id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+
+        results: Dict[int, Dict[str, str]] = {}
+        if rows:
+            placeholders = ",".join("?" * len(rows))
+            for rowid, delivery_target, state in self._reader.execute(
+                f"SELECT message_rowid, target_id, state FROM history_deliveries "
+                f"WHERE message_rowid IN ({placeholders})",
+                [row[0] for row in rows]
+            ):
+                results.setdefault(rowid, {})[delivery_target] = state
+
+        items = [
+            b'{"seq":%d,"timestamp":%s,"message":%s,"results":%s}' % (
+                rowid,
+                json_codec.dumps(datetime.fromtimestamp(received_at).isoformat()),
+                payload.encode("utf-8"),
+                json_codec.dumps(results.get(rowid, {}))
+            )
+            for rowid, received_at, payload in rows
+        ]
+        return b'{"history":[%s],"next_cursor":%s}' % (
+            b",".join(items), b"null" if next_cursor is None else str(next_cursor).encode()
+        )
+
+    async def _compact_loop(self):
+        """定期按保留策略清理消息"""
+        while True:
+            await asyncio.sleep(self.settings["compact_interval"])
+            try:
+                removed = await self.compact()
+                if removed:
+                    logger.info(f"持久化消息历史清理完成，删除 {removed} 条消息")
+            except Exception as e:
+                logger.error(f"清理持久化消息历史失败: {e}")
+
+    async def compact(self) -> int:
+        """删除超过保留天数或超出最大行数的最旧消息，并归还磁盘空间
+
+        Returns:
+            删除的消息数量
+        """
+        await self._flush()
+        cutoff = time.time() - self.settings["retention_days"] * 86400
+        return await self._run(self._compact, cutoff)
+
+    def _compact(self, cutoff: float) -> int:
+        """执行清理（写线程）"""
+        conn = self._conn
+        bound = self._id_bound(conn, cutoff)
+        if bound is None:
+            bound = (conn.execute("SELECT MAX(id) FROM history_messages").fetchone()[0] or 0) + 1
+
+        # 只从最旧的一端删除，行ID是连续的，超出最大行数时把边界推进到只保留最新的 max_rows 条
+        newest = conn.execute("SELECT MAX(id) FROM history_messages").fetchone()[0]
+        if newest is not None:
+            bound = max(bound, newest - self.settings["max_rows"] + 1)
+
+        removed = 0
+        chunk = self.settings["delete_chunk"]
+        while True:
+            # 分块删除，每个事务只短暂持有写锁
+            first = conn.execute("SELECT MIN(id) FROM history_messages").fetchone()[0]
+            if first is None or first >= bound:
+                break
+            upper = min(bound, first + chunk)
+            conn.execute("BEGIN")
+            try:
+                cursor = conn.execute("DELETE FROM history_messages WHERE id < ?", (upper,))
+                removed += cursor.rowcount
+                conn.execute("DELETE FROM history_deliveries WHERE message_rowid < ?", (upper,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if removed:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA incremental_vacuum")
+        return removed
+
+    async def stats(self) -> Dict[str, Any]:
+        """获取持久化消息历史统计"""
+        def count():
+            return self._reader.execute("SELECT COUNT(*), MIN(received_at), MAX(received_at) FROM history_messages").fetchone()
+
+        rows, oldest, newest = await self._query(count)
+        path = self.settings["path"]
+        return {
+            "path": path,
+            "rows": rows,
+            "oldest": datetime.fromtimestamp(oldest).isoformat() if oldest else None,
+            "newest": datetime.fromtimestamp(newest).isoformat() if newest else None,
+            "pending_ops": len(self._ops),
+            "committed_ops": self._committed,
+            "db_bytes": os.path.getsize(path) if os.path.exists(path) else 0
+        }
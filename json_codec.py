@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+JSON编解码模块
+优先使用 orjson，其次 msgspec，都未安装时回退到标准库 json；编码结果统一为紧凑的 UTF-8 字节。
+一条消息在接收时只编码一次，历史记录、日志、投递日志和透传发送共享同一份字节
+"""
+
+import json
+from typing import Dict, Any, Callable, Union
+
+from loguru import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class JsonCodec:
+    """标准库 json 编解码器"""
+
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        """编码为紧凑的JSON字节，无法序列化的值转换为字符串"""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """解码JSON，格式错误时抛出 ValueError"""
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson 编解码器，orjson 不支持的值（如超过64位的整数）回退到标准库"""
+
+    name = "orjson"
+
+    def __init__(self):
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return orjson.dumps(value, default=str, option=self._option)
+        except orjson.JSONEncodeError:
+            return super().dumps(value)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JsonCodec):
+    """msgspec 编解码器"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return self._encoder.encode(value)
+        except (msgspec.EncodeError, TypeError, OverflowError):
+            return super().dumps(value)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+
+# 可用的编解码器，按 auto 时的优先级排列
+CODECS: Dict[str, Callable[[], JsonCodec]] = {}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec
+if msgspec is not None:
+    CODECS["msgspec"] = MsgspecCodec
+CODECS["json"] = JsonCodec
+
+
+def create_codec(name: str = "auto") -> JsonCodec:
+    """创建编解码器
+
+    Args:
+        name: 编解码器名称（orjson、msgspec、json），auto 时选择已安装的最快实现
+
+    Returns:
+        编解码器，指定的实现未安装时回退到 auto
+    """
+    if name != "auto" and name not in CODECS:
+        logger.warning(f"JSON编解码器 {name} 不可用，自动选择")
+        name = "auto"
+    if name == "auto":
+        name = next(iter(CODECS))
+    return CODECS[name]()
+
+
+codec: JsonCodec = create_codec()
+
+
+def set_codec(name: str = "auto") -> JsonCodec:
+    """切换全局编解码器
+
+    Args:
+        name: 编解码器名称
+
+    Returns:
+        当前使用的编解码器
+    """
+    global codec
+    codec = create_codec(name)
+    return codec
+
+
+def dumps(value: Any) -> bytes:
+    """用当前编解码器编码为紧凑的JSON字节"""
+    return codec.dumps(value)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """用当前编解码器解码JSON"""
+    return codec.loads(data)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+日志模块
+loguru 的输出交给后台线程：事件循环线程只把日志记录放入有界队列，
+格式化、写文件、按大小轮转都在写线程中完成，压缩在单独的线程中进行；
+文件输出为结构化的 JSON 行，消息内容可按比例采样并截断
+"""
+
+import os
+import sys
+import glob
+import json
+import queue
+import random
+import zipfile
+import threading
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional, Any, TextIO
+
+from loguru import logger
+
+# 日志默认参数，可通过 logging 配置覆盖
+DEFAULT_LOG_SETTINGS = {
+    "file": "logs/webhook_server.log",  # 日志文件，为空时不写文件
+    "level": "INFO",                    # 文件日志级别
+    "format": "json",                   # 文件格式：json（JSON 行）或 text
+    "rotation": "10 MB",                # 单个文件的最大大小
+    "compression": "zip",               # 轮转后的压缩格式：zip 或 None
+    "retention": None,                  # 保留的轮转文件数，None 为全部保留
+    "queue_size": 10000,                # 队列长度上限，写线程跟不上时丢弃新日志
+    "payload_sample_rate": 1.0,         # 记录消息内容的比例
+    "payload_max_bytes": 2048           # 记录的消息内容最大字节数
+}
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+_STOP = object()
+
+
+def parse_size(value: Any) -> Optional[int]:
+    """解析 "10 MB" 形式的大小为字节数，为空时返回 None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    number, _, unit = str(value).strip().partition(" ")
+    return int(float(number) * _SIZE_UNITS.get(unit.strip().upper() or "B", 1))
+
+
+class PayloadPreview:
+    """按比例采样并截断日志中的消息内容"""
+
+    def __init__(self, log_config: Optional[dict] = None):
+        """初始化
+
+        Args:
+            log_config: 日志配置
+        """
+        settings = dict(DEFAULT_LOG_SETTINGS)
+        settings.update(log_config or {})
+        self.sample_rate = float(settings["payload_sample_rate"])
+        self.max_bytes = int(settings["payload_max_bytes"])
+
+    def __call__(self, encoded: bytes) -> Optional[str]:
+        """获取要记录的消息内容
+
+        Args:
+            encoded: 已编码的消息JSON字节
+
+        Returns:
+            截断后的消息内容，未被采样时返回 None
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        if len(encoded) <= self.max_bytes:
+            return encoded.decode("utf-8")
+        omitted = len(encoded) - self.max_bytes
+        return f"{encoded[:self.max_bytes].decode('utf-8', errors='ignore')}...(省略{omitted}字节)"
+
+
+class LogPipeline:
+    """后台写日志的管道
+
+    loguru 的 sink 只提取记录字段并放入队列，不阻塞调用方；
+    写线程批量取出记录，格式化后写入控制台和文件。
+    """
+
+    def __init__(self, log_config: Optional[dict] = None, console: Optional[TextIO] = None):
+        """初始化日志管道
+
+        Args:
+            log_config: 日志配置
+            console: 控制台输出流，为空时不输出到控制台
+        """
+        self.settings = dict(DEFAULT_LOG_SETTINGS)
+        self.settings.update(log_config or {})
+        self.path: Optional[str] = self.settings["file"] or None
+        self.json_lines = self.settings["format"] == "json"
+        self.rotation = parse_size(self.settings["rotation"])
+        self.compression = self.settings["compression"]
+        self.retention = self.settings["retention"]
+        self.console = console
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=int(self.settings["queue_size"]))
+        self._thread: Optional[threading.Thread] = None
+        self._file: Optional[TextIO] = None
+        self._size = 0
+        self._compressors: List[threading.Thread] = []
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def start(self):
+        """启动写线程"""
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._open()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中的日志后停止写线程"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        for compressor in self._compressors:
+            compressor.join(timeout)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _enqueue(self, target: str, message):
+        """提取记录字段放入队列，队列已满时丢弃"""
+        record = message.record
+        exception = record["exception"]
+        item = (
+            target, record["time"], record["level"].name, record["name"], record["function"], record["line"],
+            record["message"], dict(record["extra"]) if record["extra"] else None,
+            tuple(exception) if exception else None
+        )
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def console_sink(self, message):
+        """控制台 sink"""
+        self._enqueue("console", message)
+
+    def file_sink(self, message):
+        """文件 sink"""
+        self._enqueue("file", message)
+
+    @staticmethod
+    def _format_exception(exception: Optional[tuple]) -> Optional[str]:
+        if not exception:
+            return None
+        return "".join(traceback.format_exception(*exception)).rstrip()
+
+    def _format_text(self, item: tuple) -> str:
+        """格式化为文本行"""
+        _, moment, level, name, function, line, message, extra, exception = item
+        text = f"{moment:%Y-%m-%d %H:%M:%S.%f}"[:-3] + f" | {level:<8} | {name}:{function}:{line} - {message}"
+        if extra:
+            text += " | " + json.dumps(extra, ensure_ascii=False, default=str)
+        exception_text = self._format_exception(exception)
+        if exception_text:
+            text += "\n" + exception_text
+        return text + "\n"
+
+    def _format_json(self, item: tuple) -> str:
+        """格式化为 JSON 行"""
+        _, moment, level, name, function, line, message, extra, exception = item
+        entry: Dict[str, Any] = {
+            "time": moment.isoformat(),
+            "level": level,
+            "logger": name,
+            "function": function,
+            "line": line,
+            "message": message
+        }
+        if extra:
+            entry.update(extra)
+        exception_text = self._format_exception(exception)
+        if exception_text:
+            entry["exception"] = exception_text
+        return json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+    def _run(self):
+        """写线程：批量取出记录并写入"""
+        while True:
+            items = [self._queue.get()]
+            try:
+                while len(items) < 1000:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = False
+            console_lines = []
+            file_lines = []
+            for item in items:
+                if item is _STOP:
+                    stop = True
+                    continue
+                try:
+                    if item[0] == "console":
+                        console_lines.append(self._format_text(item))
+                    elif self.json_lines:
+                        file_lines.append(self._format_json(item))
+                    else:
+                        file_lines.append(self._format_text(item))
+                except Exception as e:
+                    sys.stderr.write(f"格式化日志失败: {e}\n")
+
+            try:
+                if console_lines and self.console is not None:
+                    self.console.write("".join(console_lines))
+                    self.console.flush()
+                if file_lines and self._file is not None:
+                    self._write_file("".join(file_lines))
+            except Exception as e:
+                sys.stderr.write(f"写入日志失败: {e}\n")
+
+            self.written += len(items) - stop
+            if stop:
+                return
+
+    def _open(self):
+        """打开（追加）日志文件"""
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _write_file(self, data: str):
+        """写入文件，超出大小时轮转"""
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data.encode("utf-8"))
+        if self.rotation and self._size >= self.rotation:
+            self._rotate()
+
+    def _rotate(self):
+        """轮转日志文件，压缩交给单独的线程"""
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}.{datetime.now():%Y-%m-%d_%H-%M-%S_%f}{ext}"
+        os.replace(self.path, rotated)
+        self._open()
+        self.rotations += 1
+
+        self._compressors = [t for t in self._compressors if t.is_alive()]
+        if self.compression == "zip":
+            compressor = threading.Thread(target=self._compress, args=(rotated,), name="log-compress", daemon=True)
+            self._compressors.append(compressor)
+            compressor.start()
+        else:
+            self._apply_retention()
+
+    def _compress(self, path: str):
+        """压缩轮转后的日志文件"""
+        try:
+            with zipfile.ZipFile(f"{path}.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.write(path, os.path.basename(path))
+            os.remove(path)
+        except Exception as e:
+            sys.stderr.write(f"压缩日志文件 {path} 失败: {e}\n")
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """只保留最新的若干个轮转文件"""
+        if not self.retention:
+            return
+        root, ext = os.path.splitext(self.path)
+        rotated = sorted(glob.glob(f"{glob.escape(root)}.*{ext}*"))
+        for path in rotated[:-int(self.retention)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """获取日志管道统计"""
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations
+        }
+
+
+def configure_logging(log_config: Optional[dict] = None, console_level: str = "INFO") -> LogPipeline:
+    """替换 loguru 的默认输出为后台日志管道
+
+    Args:
+        log_config: 日志配置
+        console_level: 控制台日志级别
+
+    Returns:
+        已启动的日志管道，退出前应调用 close
+    """
+    pipeline = LogPipeline(log_config, console=sys.stderr)
+    pipeline.start()
+
+    logger.remove()
+    # 格式化在写线程中完成，这里只传递原始记录
+    logger.add(pipeline.console_sink, level=console_level, format="{message}", colorize=False)
+    if pipeline.path:
+        logger.add(pipeline.file_sink, level=pipeline.settings["level"], format="{message}", colorize=False)
+    return pipeline
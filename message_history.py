@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+消息历史模块
+定长环形缓冲区保存最近的消息，每条消息只序列化一次并以紧凑字节保存，
+查询时直接拼接字节返回，支持游标分页和按路由、事件类型、交易对、投递结果过滤
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterable
+
+from json_codec import dumps as _dumps
+
+# 消息历史默认参数，可通过 history 配置覆盖
+DEFAULT_HISTORY_SETTINGS = {
+    "max_entries": 1000,              # 最多保存的消息数
+    "max_bytes": 16 * 1024 * 1024     # 最多占用的序列化字节数
+}
+
+
+class HistoryEntry:
+    """一条历史记录，消息内容在写入时序列化一次"""
+
+    __slots__ = ("seq", "received_at", "message_id", "route", "event_type", "symbol", "head", "results",
+                 "_results_bytes")
+
+    def __init__(self, seq: int, message: dict, encoded: Optional[bytes] = None):
+        self.seq = seq
+        self.received_at = time.time()
+        self.message_id = message.get("_id")
+        self.route = (message.get("_route") or {}).get("path")
+        self.event_type = message.get("event_type")
+        data = message.get("data")
+        self.symbol = message.get("symbol") or (data.get("symbol") if isinstance(data, dict) else None)
+        self.head = b'{"seq":%d,"timestamp":%s,"message":%s' % (
+            seq, _dumps(datetime.fromtimestamp(self.received_at).isoformat()),
+            _dumps(message) if encoded is None else encoded
+        )
+        self.results: Dict[str, str] = {}
+        self._results_bytes: Optional[bytes] = b"{}"
+
+    @property
+    def size(self) -> int:
+        return len(self.head)
+
+    def set_result(self, target_id: str, state: str):
+        """更新目标的投递结果"""
+        self.results[target_id] = state
+        self._results_bytes = None
+
+    def to_bytes(self) -> bytes:
+        """拼接为JSON字节，投递结果只在变化后重新序列化"""
+        if self._results_bytes is None:
+            self._results_bytes = _dumps(self.results)
+        return b"%s,\"results\":%s}" % (self.head, self._results_bytes)
+
+
+class MessageHistory:
+    """定长环形缓冲区形式的消息历史
+
+    槽位数固定为 max_entries，序号为 seq 的消息位于 seq % max_entries，
+    写满或超出字节上限时覆盖最旧的消息，追加和按序号访问都是 O(1)。
+    """
+
+    def __init__(self, history_config: Optional[dict] = None):
+        """初始化消息历史
+
+        Args:
+            history_config: 消息历史配置
+        """
+        settings = dict(DEFAULT_HISTORY_SETTINGS)
+        settings.update({k: v for k, v in (history_config or {}).items() if k in DEFAULT_HISTORY_SETTINGS})
+        self.max_entries = max(1, int(settings["max_entries"]))
+        self.max_bytes = int(settings["max_bytes"])
+        self._slots: List[Optional[HistoryEntry]] = [None] * self.max_entries
+        self._by_id: Dict[str, HistoryEntry] = {}
+        self._oldest = 1
+        self._next = 1
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return self._next - self._oldest
+
+    def _evict_oldest(self):
+        """移除最旧的消息"""
+        index = self._oldest % self.max_entries
+        entry = self._slots[index]
+        self._slots[index] = None
+        self._oldest += 1
+        self._bytes -= entry.size
+        if self._by_id.get(entry.message_id) is entry:
+            del self._by_id[entry.message_id]
+
+    def add(self, message: dict, encoded: Optional[bytes] = None) -> HistoryEntry:
+        """追加一条消息
+
+        Args:
+            message: 消息内容
+            encoded: 可选，已编码的消息JSON字节
+
+        Returns:
+            历史记录
+        """
+        if len(self) >= self.max_entries:
+            self._evict_oldest()
+
+        entry = HistoryEntry(self._next, message, encoded)
+        self._slots[self._next % self.max_entries] = entry
+        self._next += 1
+        self._bytes += entry.size
+        if entry.message_id is not None:
+            self._by_id[entry.message_id] = entry
+
+        while self._bytes > self.max_bytes and len(self) > 1:
+            self._evict_oldest()
+        return entry
+
+    def track(self, message_id: str, target_ids: Iterable[str], state: str):
+        """记录消息需要投递的目标及初始状态"""
+        entry = self._by_id.get(message_id)
+        if entry is not None:
+            for target_id in target_ids:
+                entry.set_result(target_id, state)
+
+    def update(self, message_id: str, target_id: str, state: str):
+        """更新消息在某个目标上的投递结果，消息已被覆盖时忽略"""
+        entry = self._by_id.get(message_id)
+        if entry is not None:
+            entry.set_result(target_id, state)
+
+    def query(self, limit: int = 10, cursor: Optional[int] = None, since: Optional[float] = None,
+              until: Optional[float] = None, route: Optional[str] = None,
+              event_type: Optional[str] = None, symbol: Optional[str] = None,
+              target_id: Optional[str] = None, outcome: Optional[str] = None) -> bytes:
+        """从新到旧查询消息历史
+
+        Args:
+            limit: 返回条数
+            cursor: 游标，只返回序号小于该值的消息；为空时从最新的消息开始
+            since: 起始时间（Unix 秒，含）
+            until: 结束时间（Unix 秒，不含）
+            route: 路由路径
+            event_type: 事件类型
+            symbol: 交易对
+            target_id: 目标ID，只返回投递到该目标的消息
+            outcome: 投递结果；指定 target_id 时匹配该目标的结果，否则匹配任一目标
+
+        Returns:
+            JSON字节：{"history": [...], "next_cursor": 下一页游标或 null}
+        """
+        limit = max(1, limit)
+        seq = self._next - 1 if cursor is None else min(cursor - 1, self._next - 1)
+        items = []
+        next_cursor = None
+
+        while seq >= self._oldest:
+            entry = self._slots[seq % self.max_entries]
+            seq -= 1
+            if until is not None and entry.received_at >= until:
+                continue
+            if since is not None and entry.received_at < since:
+                # 更早的消息都不在范围内
+                break
+            if route is not None and entry.route != route:
+                continue
+            if event_type is not None and entry.event_type != event_type:
+                continue
+            if symbol is not None and entry.symbol != symbol:
+                continue
+            if target_id is not None:
+                state = entry.results.get(target_id)
+                if state is None or (outcome is not None and state != outcome):
+                    continue
+            elif outcome is not None and outcome not in entry.results.values():
+                continue
+
+            if len(items) >= limit:
+                next_cursor = entry.seq + 1
+                break
+            items.append(entry.to_bytes())
+
+        return b'{"history":[%s],"next_cursor":%s}' % (
+            b",".join(items), b"null" if next_cursor is None else str(next_cursor).encode()
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """获取消息历史统计"""
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes
+        }
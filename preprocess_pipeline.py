@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+消息预处理模块
+路由的 preprocess 配置在加载时编译为一组预先绑定的操作：字段路径预先拆分为取值/赋值函数，
+字段变换预先解析为变换函数（正则表达式等只编译一次），处理消息时依次执行即可
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+from time_utils import parse_time
+
+Getter = Callable[[Any], Any]
+Setter = Callable[[dict, Any], None]
+Operation = Callable[[dict, dict], dict]
+
+
+def compile_getter(path: str) -> Getter:
+    """编译点分隔路径的取值函数，路径不存在时返回 None"""
+    keys = tuple(path.split('.'))
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda data: data.get(key) if isinstance(data, dict) else None
+
+    def get(data: Any) -> Any:
+        current = data
+        for key in keys:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            else:
+                return None
+        return current
+
+    return get
+
+
+def compile_setter(path: str) -> Setter:
+    """编译点分隔路径的赋值函数，中间层不存在时创建字典"""
+    keys = path.split('.')
+    parents, last = tuple(keys[:-1]), keys[-1]
+    if not parents:
+        def set_top(data: dict, value: Any):
+            data[last] = value
+        return set_top
+
+    def set_nested(data: dict, value: Any):
+        current = data
+        for part in parents:
+            if part not in current:
+                current[part] = {}
+            current = current[part]
+        current[last] = value
+
+    return set_nested
+
+
+# 字段变换：名称 -> 根据参数创建变换函数，参数为变换配置中冒号之后的部分
+TRANSFORMS: Dict[str, Callable[[Optional[str]], Callable[[Any], Any]]] = {}
+
+
+def register_transform(name: str, factory: Callable[[Optional[str]], Callable[[Any], Any]]):
+    """注册字段变换，同名变换会被替换
+
+    Args:
+        name: 变换名称
+        factory: 根据参数创建变换函数，参数无效时抛出 ValueError
+    """
+    TRANSFORMS[name] = factory
+
+
+def _to_int(value: Any) -> int:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ("true", "yes", "1", "y")
+    return bool(value)
+
+
+def _format_transform(format_str: Optional[str]) -> Callable[[Any], Any]:
+    if format_str is None:
+        raise ValueError("缺少格式字符串")
+
+    def transform(value: Any) -> Any:
+        try:
+            return format_str.format(value=value)
+        except Exception:
+            return value
+
+    return transform
+
+
+def _round_transform(digits: Optional[str]) -> Callable[[Any], Any]:
+    try:
+        ndigits = int(digits) if digits else None
+    except ValueError:
+        raise ValueError("小数位数必须是整数")
+
+    def transform(value: Any) -> Any:
+        try:
+            return round(float(value), ndigits)
+        except (ValueError, TypeError):
+            return value
+
+    return transform
+
+
+def _case_transform(method: str) -> Callable[[Optional[str]], Callable[[Any], Any]]:
+    return lambda arg: lambda value: getattr(value, method)() if isinstance(value, str) else value
+
+
+def _timestamp_transform(unit: str) -> Callable[[Optional[str]], Callable[[Any], Any]]:
+    scale = 1000 if unit == "ms" else 1
+
+    def factory(arg: Optional[str]) -> Callable[[Any], Any]:
+        def transform(value: Any) -> Any:
+            try:
+                timestamp = parse_time(value)
+            except (ValueError, TypeError):
+                return value
+            return int(timestamp * scale) if scale != 1 else timestamp
+        return transform
+
+    return factory
+
+
+def _datetime_transform(date_format: Optional[str]) -> Callable[[Any], Any]:
+    def transform(value: Any) -> Any:
+        try:
+            moment = datetime.fromtimestamp(parse_time(value))
+        except (ValueError, TypeError, OverflowError, OSError):
+            return value
+        return moment.strftime(date_format) if date_format else moment.isoformat()
+
+    return transform
+
+
+def _regex_transform(pattern: Optional[str]) -> Callable[[Any], Any]:
+    try:
+        compiled = re.compile(pattern or "")
+    except re.error as e:
+        raise ValueError(f"正则表达式无效: {e}")
+    group = 1 if compiled.groups else 0
+
+    def transform(value: Any) -> Any:
+        match = compiled.search(value if isinstance(value, str) else str(value))
+        return match.group(group) if match else value
+
+    return transform
+
+
+register_transform("to_string", lambda arg: str)
+register_transform("to_int", lambda arg: _to_int)
+register_transform("to_float", lambda arg: _to_float)
+register_transform("to_bool", lambda arg: _to_bool)
+register_transform("format", _format_transform)
+register_transform("round", _round_transform)
+register_transform("upper", _case_transform("upper"))
+register_transform("lower", _case_transform("lower"))
+register_transform("timestamp", _timestamp_transform("s"))
+register_transform("timestamp_ms", _timestamp_transform("ms"))
+register_transform("datetime", _datetime_transform)
+register_transform("regex", _regex_transform)
+
+
+def compile_transform(spec: Any) -> Callable[[Any], Any]:
+    """解析 "名称" 或 "名称:参数" 形式的字段变换
+
+    Raises:
+        ValueError: 变换未知或参数无效时
+    """
+    if not isinstance(spec, str):
+        raise ValueError(f"字段变换必须是字符串: {spec!r}")
+    name, separator, arg = spec.partition(":")
+    factory = TRANSFORMS.get(name)
+    if factory is None:
+        raise ValueError(f"未知的字段变换: {spec}")
+    try:
+        return factory(arg if separator else None)
+    except ValueError as e:
+        raise ValueError(f"字段变换 {spec} 无效: {e}")
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _field_mapping(mappings: dict, merge: bool) -> Operation:
+    """字段映射：从原始消息中取值放到新字段"""
+    pairs = tuple((compile_getter(source), compile_setter(target)) for target, source in mappings.items())
+
+    def apply(result: dict, message: dict) -> dict:
+        mapped = {}
+        for get, set_value in pairs:
+            value = get(message)
+            if value is not None:
+                set_value(mapped, value)
+        return {**result, **mapped} if merge else mapped
+
+    return apply
+
+
+def _include_fields(fields: list) -> Operation:
+    """字段过滤：只保留指定的字段"""
+    pairs = tuple((compile_getter(field), compile_setter(field)) for field in fields)
+
+    def apply(result: dict, message: dict) -> dict:
+        filtered = {}
+        for get, set_value in pairs:
+            value = get(result)
+            if value is not None:
+                set_value(filtered, value)
+        return filtered
+
+    return apply
+
+
+def _transformations(steps: Tuple[Tuple[Getter, Setter, Callable[[Any], Any]], ...]) -> Operation:
+    """字段变换：存在的字段替换为变换后的值"""
+    def apply(result: dict, message: dict) -> dict:
+        for get, set_value, transform in steps:
+            value = get(result)
+            if value is not None:
+                set_value(result, transform(value))
+        return result
+
+    return apply
+
+
+def _add_fields(fields: dict) -> Operation:
+    """添加固定字段"""
+    pairs = tuple((compile_setter(field), value) for field, value in fields.items())
+
+    def apply(result: dict, message: dict) -> dict:
+        for set_value, value in pairs:
+            set_value(result, value)
+        return result
+
+    return apply
+
+
+class PreprocessPipeline:
+    """编译后的预处理流程，可直接作为消息转换函数调用"""
+
+    __slots__ = ("operations",)
+
+    def __init__(self, operations: Tuple[Operation, ...]):
+        self.operations = operations
+
+    def __call__(self, message: dict) -> dict:
+        """依次执行字段映射、字段过滤、字段变换和添加固定字段
+
+        Args:
+            message: 原始消息
+
+        Returns:
+            处理后的消息
+        """
+        result = message
+        for operation in self.operations:
+            result = operation(result, message)
+        return result
+
+
+def compile_preprocess(preprocess_config: dict) -> Tuple[PreprocessPipeline, List[str]]:
+    """编译路由的预处理配置
+
+    Args:
+        preprocess_config: 预处理配置
+
+    Returns:
+        (预处理流程, 错误列表)；无效的步骤被忽略，未知的字段变换保持原值
+    """
+    errors: List[str] = []
+    operations: List[Operation] = []
+
+    mappings = preprocess_config.get("field_mapping")
+    if mappings is not None:
+        if isinstance(mappings, dict):
+            operations.append(_field_mapping(mappings, preprocess_config.get("merge_mapped", True)))
+        else:
+            errors.append("field_mapping 必须是对象")
+
+    include_fields = preprocess_config.get("include_fields")
+    if include_fields is not None:
+        if isinstance(include_fields, list):
+            operations.append(_include_fields(include_fields))
+        else:
+            errors.append("include_fields 必须是列表")
+
+    transformations = preprocess_config.get("transformations")
+    if transformations is not None:
+        if isinstance(transformations, dict):
+            steps = []
+            for field, spec in transformations.items():
+                try:
+                    transform = compile_transform(spec)
+                except ValueError as e:
+                    errors.append(str(e))
+                    transform = _identity
+                steps.append((compile_getter(field), compile_setter(field), transform))
+            operations.append(_transformations(tuple(steps)))
+        else:
+            errors.append("transformations 必须是对象")
+
+    add_fields = preprocess_config.get("add_fields")
+    if add_fields is not None:
+        if isinstance(add_fields, dict):
+            operations.append(_add_fields(add_fields))
+        else:
+            errors.append("add_fields 必须是对象")
+
+    return PreprocessPipeline(tuple(operations)), errors
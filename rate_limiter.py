@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+限流模块
+基于令牌桶对每个目标及共享同一账号的目标组限流，
+超出速率的发送会排队等待令牌，而不是直接失败
+"""
+
+import time
+import asyncio
+from loguru import logger
+from typing import Dict, List, Optional, Any, Union
+
+# 各平台内置限流预设（rate: 每秒补充令牌数, burst: 桶容量）
+RATE_LIMIT_PRESETS = {
+    # 飞书自定义机器人: 100 次/分钟，5 次/秒
+    "feishu": {"rate": 100 / 60, "burst": 5},
+    # 企业微信群机器人: 20 次/分钟
+    "wechat": {"rate": 20 / 60, "burst": 5},
+    # 钉钉自定义机器人: 20 次/分钟
+    "dingtalk": {"rate": 20 / 60, "burst": 5},
+    # Discord Webhook: 30 次/分钟，2 秒内最多 5 次
+    "discord": {"rate": 0.5, "burst": 5},
+    # 普通微信个人号机器人: 保守限制，避免账号被风控
+    "wechat_personal": {"rate": 1.0, "burst": 5}
+}
+
+RateSpec = Union[str, dict, bool, None]
+
+
+class TokenBucket:
+    """令牌桶
+
+    采用预约方式：令牌不足时预先扣减（余额可为负），调用方按欠额等待相应时间，
+    因此并发的等待者按到达顺序被平滑放行。
+    """
+
+    def __init__(self, name: str, rate: float, burst: float):
+        """初始化令牌桶
+
+        Args:
+            name: 名称，用于日志和统计
+            rate: 每秒补充的令牌数
+            burst: 桶容量（允许的突发数量）
+        """
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.waiting = 0
+        self.delayed = 0
+
+    def _refill(self, now: float):
+        """按流逝时间补充令牌"""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """预约一个令牌
+
+        Returns:
+            需要等待的秒数，0 表示立即可用
+        """
+        self._refill(time.monotonic())
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+    async def acquire(self):
+        """获取一个令牌，不足时等待"""
+        delay = self.reserve()
+        if delay <= 0:
+            return
+
+        self.waiting += 1
+        self.delayed += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取令牌桶状态快照"""
+        self._refill(time.monotonic())
+        return {
+            "rate_per_minute": round(self.rate * 60, 3),
+            "burst": self.burst,
+            "tokens": round(self._tokens, 3),
+            "waiting": self.waiting,
+            "delayed": self.delayed
+        }
+
+
+class RateLimiter:
+    """按目标和限流组管理令牌桶"""
+
+    def __init__(self, rate_groups: Optional[dict] = None):
+        """初始化限流器
+
+        Args:
+            rate_groups: 限流组配置，组名 -> 预设名或 {"rate": ..., "burst": ...}
+        """
+        self.rate_groups = rate_groups or {}
+        self._target_buckets: Dict[str, TokenBucket] = {}
+        self._group_buckets: Dict[str, TokenBucket] = {}
+
+    def update_groups(self, rate_groups: Optional[dict]):
+        """更新限流组配置
+
+        参数未变的组保留令牌桶及余额，参数变化的组在下次取用时重新创建，已删除的组不再统计。
+
+        Args:
+            rate_groups: 限流组配置
+        """
+        self.rate_groups = rate_groups or {}
+        for group in [g for g in self._group_buckets if g not in self.rate_groups]:
+            del self._group_buckets[group]
+
+    @staticmethod
+    def _resolve_spec(spec: RateSpec) -> Optional[dict]:
+        """把限流配置解析为 {"rate", "burst"}
+
+        Args:
+            spec: 预设名、参数字典或 False（禁用）
+
+        Returns:
+            限流参数，禁用或无法解析时返回 None
+        """
+        if spec is None or spec is False:
+            return None
+
+        if isinstance(spec, str):
+            preset = RATE_LIMIT_PRESETS.get(spec)
+            if preset is None:
+                logger.warning(f"未知的限流预设: {spec}")
+            return preset
+
+        if isinstance(spec, dict):
+            params = dict(RATE_LIMIT_PRESETS.get(spec.get("preset"), {}))
+            if "per_minute" in spec:
+                params["rate"] = spec["per_minute"] / 60
+            params.update({k: spec[k] for k in ("rate", "burst") if k in spec})
+            if params.get("rate"):
+                params.setdefault("burst", max(1.0, params["rate"]))
+                return params
+
+        return None
+
+    @staticmethod
+    def _get_bucket(buckets: Dict[str, TokenBucket], name: str, params: dict) -> TokenBucket:
+        """获取令牌桶，参数变化时重新创建"""
+        bucket = buckets.get(name)
+        if bucket is None or bucket.rate != float(params["rate"]) or bucket.burst != float(params["burst"]):
+            bucket = TokenBucket(name, params["rate"], params["burst"])
+            buckets[name] = bucket
+        return bucket
+
+    def buckets_for(self, target: dict) -> List[TokenBucket]:
+        """获取目标发送前需要经过的令牌桶
+
+        目标未配置 rate_limit 时按目标类型使用内置预设，设置为 false 可禁用。
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            令牌桶列表（目标桶在前，组桶在后）
+        """
+        buckets = []
+
+        if "rate_limit" in target:
+            params = self._resolve_spec(target["rate_limit"])
+        else:
+            params = RATE_LIMIT_PRESETS.get(target.get("type"))
+        if params:
+            buckets.append(self._get_bucket(self._target_buckets, target.get("id"), params))
+
+        group = target.get("rate_group")
+        if group:
+            group_params = self._resolve_spec(self.rate_groups.get(group))
+            if group_params:
+                buckets.append(self._get_bucket(self._group_buckets, group, group_params))
+            else:
+                logger.warning(f"目标 {target.get('name')} 引用的限流组 {group} 未配置")
+
+        return buckets
+
+    async def acquire(self, target: dict):
+        """在发送到目标前获取所需的全部令牌
+
+        Args:
+            target: 目标配置
+        """
+        for bucket in self.buckets_for(target):
+            await bucket.acquire()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取所有令牌桶的状态"""
+        return {
+            "targets": {name: bucket.snapshot() for name, bucket in self._target_buckets.items()},
+            "groups": {name: bucket.snapshot() for name, bucket in self._group_buckets.items()}
+        }
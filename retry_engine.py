@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+重试引擎模块
+按目标配置的重试策略（指数退避 + 全抖动，支持 Retry-After）在后台调度重试，
+重试不占用接收请求的协程
+"""
+
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from email.utils import parsedate_to_datetime
+from loguru import logger
+from typing import Dict, List, Optional, Any, Callable, Awaitable
+
+# 默认重试策略，可被全局 retry 配置和目标的 retry 配置逐级覆盖
+DEFAULT_RETRY_POLICY = {
+    "max_attempts": 3,               # 最大尝试次数（含首次发送），1 表示不重试
+    "base_delay": 0.5,               # 退避基础延迟（秒）
+    "max_delay": 30.0,               # 退避延迟上限（秒）
+    "max_retry_after": 300.0,        # Retry-After 的最大采纳值（秒）
+    "retry_on_error": True,          # 网络错误、超时是否重试
+    "retryable_status": [408, 425, 429, 500, 502, 503, 504]
+}
+
+# 会携带 Retry-After 的状态码
+RETRY_AFTER_STATUS = (429, 503)
+
+
+class SendResult:
+    """单次发送结果"""
+
+    __slots__ = ("success", "status", "retry_after", "error", "short_circuited")
+
+    def __init__(self, success: bool, status: Optional[int] = None,
+                 retry_after: Optional[float] = None, error: Optional[str] = None,
+                 short_circuited: bool = False):
+        """初始化发送结果
+
+        Args:
+            success: 是否成功
+            status: HTTP状态码，网络错误时为 None
+            retry_after: 服务端通过 Retry-After 要求的等待时间（秒）
+            error: 错误描述
+            short_circuited: 是否被熔断器短路（未实际发送）
+        """
+        self.success = success
+        self.status = status
+        self.retry_after = retry_after
+        self.error = error
+        self.short_circuited = short_circuited
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头
+
+    Args:
+        value: 响应头的值，可以是秒数或HTTP日期
+
+    Returns:
+        需要等待的秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """目标的重试策略"""
+
+    def __init__(self, settings: dict):
+        """初始化重试策略
+
+        Args:
+            settings: 合并后的重试策略配置
+        """
+        self.max_attempts = max(1, int(settings["max_attempts"]))
+        self.base_delay = float(settings["base_delay"])
+        self.max_delay = float(settings["max_delay"])
+        self.max_retry_after = float(settings["max_retry_after"])
+        self.retry_on_error = bool(settings["retry_on_error"])
+        self.retryable_status = frozenset(settings["retryable_status"])
+
+    def is_retryable(self, result: SendResult) -> bool:
+        """判断失败结果是否值得重试"""
+        if result.status is None:
+            return self.retry_on_error
+        return result.status in self.retryable_status
+
+    def next_delay(self, attempt: int, result: SendResult) -> float:
+        """计算第 attempt 次尝试失败后的等待时间
+
+        Args:
+            attempt: 已完成的尝试次数
+            result: 最近一次发送结果
+
+        Returns:
+            等待秒数
+        """
+        # 服务端的 Retry-After 或熔断器剩余打开时间优先
+        if result.retry_after is not None and (result.status in RETRY_AFTER_STATUS or result.short_circuited):
+            return min(result.retry_after, self.max_retry_after)
+
+        # 全抖动：在 [0, min(上限, 基础延迟 * 2^(n-1))] 中均匀取值
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+SendFunc = Callable[[dict, dict], Awaitable[SendResult]]
+FinalFunc = Callable[[dict, dict, Any, int, SendResult], None]
+
+
+class RetryScheduler:
+    """后台重试调度器
+
+    待重试的投递按到期时间放在最小堆中，由单个调度协程在到期时
+    为每次重试创建独立任务，不会阻塞接收消息的协程。
+    """
+
+    def __init__(self, retry_config: Optional[dict] = None):
+        """初始化重试调度器
+
+        Args:
+            retry_config: 全局重试策略配置
+        """
+        self.retry_config = retry_config or {}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._send: Optional[SendFunc] = None
+        self._on_success: Optional[Callable[[dict, dict, Any], None]] = None
+        self._on_exhausted: Optional[FinalFunc] = None
+        self.retried = 0
+
+    def update_config(self, retry_config: Optional[dict]):
+        """更新全局重试策略，之后的失败按新策略决定是否重试及等待时间
+
+        Args:
+            retry_config: 全局重试策略配置
+        """
+        self.retry_config = retry_config or {}
+
+    def policy_for(self, target: dict) -> RetryPolicy:
+        """获取目标生效的重试策略
+
+        Args:
+            target: 目标配置
+
+        Returns:
+            重试策略
+        """
+        settings = dict(DEFAULT_RETRY_POLICY)
+        settings.update({k: v for k, v in self.retry_config.items() if k in DEFAULT_RETRY_POLICY})
+        settings.update({k: v for k, v in (target.get("retry") or {}).items() if k in DEFAULT_RETRY_POLICY})
+        return RetryPolicy(settings)
+
+    async def start(self, send: SendFunc, on_success: Callable[[dict, dict, Any], None], on_exhausted: FinalFunc):
+        """启动调度协程
+
+        Args:
+            send: 单次发送函数
+            on_success: 重试成功回调，参数为 (消息, 目标配置, 凭据)
+            on_exhausted: 重试耗尽回调，参数为 (消息, 目标配置, 凭据, 尝试次数, 最后一次结果)
+        """
+        self._send = send
+        self._on_success = on_success
+        self._on_exhausted = on_exhausted
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="retry-scheduler")
+        logger.info("重试调度器已启动")
+
+    async def close(self):
+        """停止调度协程和进行中的重试，未完成的重试由持久化日志在重启后重放"""
+        tasks = [t for t in (self._task, *self._running) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._heap:
+            logger.warning(f"关闭时仍有 {len(self._heap)} 个待重试投递")
+        self._heap.clear()
+        logger.info("重试调度器已关闭")
+
+    def schedule(self, message: dict, target: dict, ticket: Any, attempt: int, delay: float):
+        """安排一次重试
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递凭据
+            attempt: 已完成的尝试次数
+            delay: 等待秒数
+        """
+        due = time.monotonic() + delay
+        heapq.heappush(self._heap, (due, next(self._seq), message, target, ticket, attempt))
+        self._wakeup.set()
+
+    def handle_failure(self, message: dict, target: dict, ticket: Any, attempt: int, result: SendResult) -> bool:
+        """处理一次失败的发送：可重试则安排重试，否则交给耗尽回调
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递凭据
+            attempt: 已完成的尝试次数
+            result: 发送结果
+
+        Returns:
+            是否已安排重试
+        """
+        policy = self.policy_for(target)
+        if attempt < policy.max_attempts and policy.is_retryable(result):
+            delay = policy.next_delay(attempt, result)
+            logger.warning(
+                f"发送到 {target.get('name')} 失败（第 {attempt} 次），"
+                f"{delay:.2f} 秒后重试: {result.error or result.status}"
+            )
+            self.schedule(message, target, ticket, attempt, delay)
+            return True
+
+        self._on_exhausted(message, target, ticket, attempt, result)
+        return False
+
+    async def _run(self):
+        """调度循环：等待最早到期的重试并启动"""
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            timeout = self._heap[0][0] - time.monotonic()
+            if timeout > 0:
+                try:
+                    # 有更早的重试加入时会被提前唤醒
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    self._wakeup.clear()
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, message, target, ticket, attempt = heapq.heappop(self._heap)
+            task = asyncio.create_task(self._retry(message, target, ticket, attempt))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _retry(self, message: dict, target: dict, ticket: Any, attempt: int):
+        """执行一次重试
+
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递凭据
+            attempt: 此前已完成的尝试次数
+        """
+        self.retried += 1
+        attempt += 1
+        try:
+            result = await self._send(message, target)
+        except Exception as e:
+            result = SendResult(False, error=str(e))
+
+        if result.success:
+            logger.info(f"重试第 {attempt} 次发送到 {target.get('name')} 成功")
+            self._on_success(message, target, ticket)
+        else:
+            self.handle_failure(message, target, ticket, attempt, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取重试统计信息"""
+        return {
+            "scheduled": len(self._heap),
+            "running": len(self._running),
+            "retried": self.retried
+        }
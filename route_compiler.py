@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+路由编译模块
+在加载配置时把每个路由编译为不可变的路由对象：预先计算请求头和查询参数校验、
+解析目标、绑定预处理和模板，并在编译时报告无效的引用。
+路径可以包含参数（如 /webhook/{group}），目标ID中引用路径参数（如 wx_{group}）时按请求路径解析目标
+"""
+
+import re
+from typing import Dict, List, Optional, Any, Callable, Mapping, Tuple
+
+from fingerprint import DedupPolicy
+from preprocess_pipeline import compile_preprocess
+from template_engine import compile_format
+
+# 支持的HTTP方法
+SUPPORTED_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH")
+
+# 支持的投递模式
+DELIVERY_MODES = (None, "sync", "async")
+
+Transform = Callable[[Any], Any]
+
+# 路径参数段，如 {group}
+_PARAM_SEGMENT = re.compile(r"^\{([A-Za-z_][A-Za-z0-9_]*)\}$")
+
+
+class RouteConfigError(ValueError):
+    """路由配置无效"""
+
+    def __init__(self, path: str, errors: List[str]):
+        self.path = path
+        self.errors = errors
+        super().__init__(f"路由 {path} 配置无效: {'; '.join(errors)}")
+
+
+class CompiledRoute:
+    """编译后的路由，创建后不可修改"""
+
+    __slots__ = (
+        "path", "methods", "description", "header_checks", "query_checks", "target_ids", "targets",
+        "params", "resolve_targets", "preprocess", "template", "delivery_mode", "dedup"
+    )
+
+    def __init__(self, **fields: Any):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("编译后的路由不可修改")
+
+    def check(self, headers: Mapping[str, str], query_params: Mapping[str, str]) -> Optional[str]:
+        """校验请求是否符合路由条件
+
+        Args:
+            headers: 请求头
+            query_params: 查询参数
+
+        Returns:
+            不符合时返回错误描述，否则返回 None
+        """
+        for name, expected in self.header_checks:
+            value = headers.get(name)
+            if value is None:
+                return f"缺少必要的请求头: {name}"
+            # 如果配置了值，则需要精确匹配
+            if expected and value != expected:
+                return f"请求头 {name} 的值不匹配"
+
+        for name, expected in self.query_checks:
+            value = query_params.get(name)
+            if value is None:
+                return f"缺少必要的查询参数: {name}"
+            if expected and value != expected:
+                return f"查询参数 {name} 的值不匹配"
+
+        return None
+
+
+def split_path(path: str) -> List[Tuple[str, Optional[str]]]:
+    """把路由路径拆分为 (路径段, 参数名) 列表，固定路径段的参数名为 None"""
+    segments = []
+    for segment in path.strip("/").split("/"):
+        match = _PARAM_SEGMENT.match(segment)
+        segments.append((segment, match.group(1) if match else None))
+    return segments
+
+
+def _compile_params(path: str, errors: List[str]) -> Tuple[str, ...]:
+    """解析路径参数名，参数必须占据整个路径段且不能重名"""
+    params: List[str] = []
+    for segment, param in split_path(path):
+        if param is None:
+            if "{" in segment or "}" in segment:
+                errors.append(f"路径参数必须占据整个路径段: {segment}")
+            continue
+        if param in params:
+            errors.append(f"路径参数重复: {param}")
+        params.append(param)
+    return tuple(params)
+
+
+def _target_resolver(static_ids: List[str], templates: List[str], targets: List[dict],
+                     params: Tuple[str, ...], errors: List[str]) -> Callable[[Mapping[str, str]], Tuple[dict, ...]]:
+    """编译按路径参数解析目标的函数
+
+    Args:
+        static_ids: 固定的目标ID
+        templates: 引用路径参数的目标ID模板
+        targets: 全部目标配置
+        params: 路径参数名
+        errors: 错误列表
+
+    Returns:
+        根据路径参数返回目标配置的函数，固定目标在前，未找到的目标被忽略
+    """
+    known = {target.get("id") for target in targets}
+    for target_id in static_ids:
+        if target_id not in known:
+            errors.append(f"未知的目标ID: {target_id}")
+
+    # 启用的目标，ID -> 目标配置，重复的ID以第一个为准
+    index: Dict[str, dict] = {}
+    for target in targets:
+        if target.get("enabled", True):
+            index.setdefault(target.get("id"), target)
+
+    static = {target_id: index[target_id] for target_id in static_ids if target_id in index}
+    renders = []
+    for template in templates:
+        fields: List[str] = []
+        render = compile_format(template, fields)
+        unknown = [field for field in fields if field not in params]
+        if render is None or unknown:
+            errors.append(f"目标ID {template} 只能引用路径参数 {list(params)}")
+            continue
+        renders.append(render)
+
+    def resolve(values: Mapping[str, str]) -> Tuple[dict, ...]:
+        selected = dict(static)
+        for render in renders:
+            target = index.get(render(values))
+            if target is not None:
+                selected.setdefault(target.get("id"), target)
+        return tuple(selected.values())
+
+    return resolve
+
+
+def _compile_checks(kind: str, checks: Any, errors: List[str]) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """把请求头或查询参数条件编译为 (名称, 期望值) 元组"""
+    if not checks:
+        return ()
+    if not isinstance(checks, dict):
+        errors.append(f"{kind} 必须是对象")
+        return ()
+    return tuple((name, value or None) for name, value in checks.items())
+
+
+def compile_route(path: str, route_config: dict, config: dict,
+                  template_factory: Callable[[str, dict], Transform]) -> Tuple[CompiledRoute, List[str]]:
+    """编译单个路由
+
+    Args:
+        path: 路由路径
+        route_config: 路由配置
+        config: 完整配置，用于解析目标、模板和全局去重配置
+        template_factory: 根据模板名称和模板定义创建模板函数
+
+    Returns:
+        (编译后的路由, 错误列表)；存在错误时无效的引用被忽略
+    """
+    errors: List[str] = []
+
+    methods = route_config.get("methods") or ["POST"]
+    if not isinstance(methods, list):
+        errors.append("methods 必须是列表")
+        methods = ["POST"]
+    methods = [str(method).upper() for method in methods]
+    for method in methods:
+        if method not in SUPPORTED_METHODS:
+            errors.append(f"不支持的HTTP方法: {method}")
+    methods = tuple(method for method in methods if method in SUPPORTED_METHODS)
+
+    header_checks = _compile_checks("headers", route_config.get("headers"), errors)
+    query_checks = _compile_checks("query_params", route_config.get("query_params"), errors)
+
+    params = _compile_params(path, errors)
+
+    # 指定了目标时预先解析为目标配置（按配置顺序、去重、只保留启用的目标）
+    target_ids = tuple(route_config.get("target_ids") or ())
+    targets = None
+    resolve_targets = None
+    templated_ids = [target_id for target_id in target_ids if "{" in str(target_id)]
+    if templated_ids:
+        # 目标ID引用路径参数，请求时按参数值解析
+        static_ids = [target_id for target_id in target_ids if target_id not in templated_ids]
+        resolve_targets = _target_resolver(static_ids, templated_ids, config.get("targets", []), params, errors)
+    elif target_ids:
+        known = {t.get("id") for t in config.get("targets", [])}
+        for target_id in target_ids:
+            if target_id not in known:
+                errors.append(f"未知的目标ID: {target_id}")
+        selected: Dict[str, dict] = {}
+        for target in config.get("targets", []):
+            target_id = target.get("id")
+            if target_id in target_ids and target_id not in selected and target.get("enabled", True):
+                selected[target_id] = target
+        targets = tuple(selected.values())
+
+    preprocess = None
+    preprocess_config = route_config.get("preprocess")
+    if preprocess_config:
+        if isinstance(preprocess_config, dict):
+            preprocess, preprocess_errors = compile_preprocess(preprocess_config)
+            errors.extend(preprocess_errors)
+        else:
+            errors.append("preprocess 必须是对象")
+
+    template = None
+    template_name = route_config.get("template")
+    if template_name:
+        template_config = config.get("templates", {}).get(template_name)
+        if template_config is None:
+            errors.append(f"未知的模板: {template_name}")
+        elif not isinstance(template_config, dict):
+            errors.append(f"模板 {template_name} 必须是对象")
+        else:
+            template = template_factory(template_name, template_config)
+
+    delivery_mode = route_config.get("delivery_mode")
+    if delivery_mode not in DELIVERY_MODES:
+        errors.append(f"不支持的投递模式: {delivery_mode}")
+        delivery_mode = None
+
+    route = CompiledRoute(
+        path=path,
+        methods=methods,
+        description=route_config.get("description"),
+        header_checks=header_checks,
+        query_checks=query_checks,
+        target_ids=target_ids,
+        targets=targets,
+        params=params,
+        resolve_targets=resolve_targets,
+        preprocess=preprocess,
+        template=template,
+        delivery_mode=delivery_mode,
+        dedup=DedupPolicy.from_config(config.get("dedup"), route_config.get("dedup"))
+    )
+    return route, errors
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+路由表模块
+所有 webhook 请求由一个处理函数接收，再在路由表中查找路由：固定路径直接查字典，
+含参数的路径（如 /webhook/{group}）放在按路径段划分的基数树中，查找耗时只与路径段数有关，
+与路由数量无关
+"""
+
+from typing import Dict, List, Optional, Mapping, Tuple
+
+from route_compiler import CompiledRoute, split_path
+
+
+def normalize_request_path(path: str) -> str:
+    """去掉请求路径末尾的 /，根路径除外"""
+    return path.rstrip("/") or "/"
+
+
+class _Node:
+    """基数树节点：固定路径段的子节点、参数子节点及在此结束的路由"""
+
+    __slots__ = ("children", "param", "param_child", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.param: Optional[str] = None
+        self.param_child: Optional["_Node"] = None
+        self.route: Optional[CompiledRoute] = None
+
+
+class RouteTable:
+    """编译后的路由表，创建后不再修改，随配置快照一起替换"""
+
+    def __init__(self, routes: Mapping[str, CompiledRoute]):
+        """构建路由表
+
+        Args:
+            routes: 路由路径 -> 编译后的路由
+        """
+        self.exact: Dict[str, CompiledRoute] = {}
+        self._root = _Node()
+        self.parametrized = 0
+        # 与先注册的路由匹配相同请求路径而不会生效的路由：路径 -> 错误描述
+        self.conflicts: Dict[str, str] = {}
+
+        for path, route in routes.items():
+            if not route.params:
+                key = normalize_request_path(path)
+                if key in self.exact:
+                    self.conflicts[path] = self._conflict(self.exact[key])
+                else:
+                    self.exact[key] = route
+                continue
+
+            node = self._root
+            for segment, param in split_path(path):
+                if param is None:
+                    node = node.children.setdefault(segment, _Node())
+                else:
+                    # 同一位置的参数段共用一个节点，参数名以先注册的路由为准
+                    if node.param_child is None:
+                        node.param, node.param_child = param, _Node()
+                    node = node.param_child
+            if node.route is None:
+                node.route = route
+                self.parametrized += 1
+            else:
+                # 参数名不同但形状相同的路径（如 /webhook/{group} 与 /webhook/{name}）匹配同样的请求
+                self.conflicts[path] = self._conflict(node.route)
+
+    @staticmethod
+    def _conflict(existing: CompiledRoute) -> str:
+        return f"与路由 {existing.path} 匹配相同的请求路径，该路由不会生效"
+
+    def match(self, path: str) -> Optional[Tuple[CompiledRoute, Dict[str, str]]]:
+        """查找请求路径对应的路由
+
+        Args:
+            path: 请求路径
+
+        Returns:
+            (路由, 路径参数)，没有匹配的路由时返回 None
+        """
+        path = normalize_request_path(path)
+        route = self.exact.get(path)
+        if route is not None:
+            return route, {}
+        if not self.parametrized:
+            return None
+
+        values: List[str] = []
+        node = self._match(self._root, path.strip("/").split("/"), 0, values)
+        if node is None:
+            return None
+        return node.route, dict(zip(node.route.params, values))
+
+    def _match(self, node: _Node, segments: List[str], index: int, values: List[str]) -> Optional[_Node]:
+        """逐段匹配，固定路径段优先于参数段，不匹配时回溯"""
+        if index == len(segments):
+            return node if node.route is not None else None
+
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, values)
+            if found is not None:
+                return found
+
+        if node.param_child is not None and segment:
+            values.append(segment)
+            found = self._match(node.param_child, segments, index + 1, values)
+            if found is not None:
+                return found
+            values.pop()
+
+        return None
+
+    def __len__(self) -> int:
+        return len(self.exact) + self.parametrized
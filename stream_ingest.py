@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+WebSocket 流式接收模块
+生产者与 webhook 路由保持一个 WebSocket 连接持续发送消息，每个文本或二进制帧是一条 JSON 消息，
+服务器按帧的接收顺序编号（seq，从 0 开始）并逐条回复确认。
+未确认的消息数受在途窗口限制：窗口已满时服务器暂停读取连接，由 TCP 流控把背压传给生产者，
+处理流程变慢时不会无限缓冲
+
+协议:
+    连接建立后服务器发送 {"type": "ready", "route": 路由路径, "window": 在途窗口}
+    每条消息处理完成后服务器发送 {"type": "ack", "seq": 序号, "status": ..., "message_id": ..., "results": [...]}
+    消息处理失败时确认为 {"type": "ack", "seq": 序号, "status": "error", "error": 错误描述}
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Set
+
+from loguru import logger
+from starlette.websockets import WebSocket
+
+# WebSocket 接收默认参数，可通过 ingest.websocket 配置覆盖
+DEFAULT_STREAM_SETTINGS = {
+    "enabled": True,               # 是否接受 WebSocket 连接
+    "max_in_flight": 100,          # 每个连接未确认的最大消息数
+    "max_message_bytes": 1048576   # 单条消息的最大长度
+}
+
+# 处理一条消息：消息 -> 处理结果（status、message_id、results 或 error）
+HandleFunc = Callable[[Any], Awaitable[dict]]
+
+
+class StreamSession:
+    """一个 WebSocket 接收连接：按顺序读取消息帧，在途窗口内处理，逐条回复确认"""
+
+    def __init__(self, websocket: WebSocket, handle: HandleFunc, settings: dict, ordered: bool,
+                 loads: Callable[[Any], Any], dumps: Callable[[Any], bytes]):
+        """初始化接收连接
+
+        Args:
+            websocket: 已接受的 WebSocket 连接
+            handle: 处理一条消息
+            settings: WebSocket 接收参数
+            ordered: 是否按接收顺序逐条处理（异步投递的路由按顺序入队）；否则窗口内的消息并发处理
+            loads: JSON解码函数
+            dumps: 把确认编码为JSON字节
+        """
+        self.websocket = websocket
+        self.handle = handle
+        self.ordered = ordered
+        self.loads = loads
+        self.dumps = dumps
+        self.window = max(1, int(settings["max_in_flight"]))
+        self.max_message_bytes = int(settings["max_message_bytes"])
+        self._in_flight = asyncio.Semaphore(self.window)
+        self._send_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+        self.received = 0
+        self.failed = 0
+
+    async def _send(self, message: dict):
+        """发送一条控制消息，连接已断开时丢弃"""
+        if self._closed:
+            return
+        text = self.dumps(message).decode("utf-8")
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(text)
+            except Exception as e:
+                # 连接已断开，已接收的消息照常投递，只是无法再确认
+                self._closed = True
+                logger.debug(f"WebSocket 连接已断开，无法发送确认: {e}")
+
+    async def _process(self, seq: int, data: Any):
+        """解析并处理一条消息，回复确认"""
+        try:
+            # 文本帧按 UTF-8 编码后的字节数计算长度
+            size = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+            if size > self.max_message_bytes:
+                result = {"status": "error", "error": f"单条消息超过 {self.max_message_bytes} 字节"}
+            else:
+                try:
+                    payload = self.loads(data)
+                except ValueError as e:
+                    result = {"status": "error", "error": f"JSON格式错误: {e}"}
+                else:
+                    result = await self.handle(payload)
+            if result.get("status") == "error":
+                self.failed += 1
+            await self._send({"type": "ack", "seq": seq, **result})
+        finally:
+            self._in_flight.release()
+
+    async def run(self, route_path: str):
+        """接收消息直到连接关闭，返回前等待已接收的消息处理完成
+
+        Args:
+            route_path: 路由路径，在 ready 消息中告知生产者
+        """
+        await self._send({"type": "ready", "route": route_path, "window": self.window})
+        try:
+            while True:
+                # 窗口已满时不再读取，背压经 TCP 传给生产者
+                await self._in_flight.acquire()
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    self._in_flight.release()
+                    break
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes") or b""
+                seq = self.received
+                self.received += 1
+
+                if self.ordered:
+                    await self._process(seq, data)
+                else:
+                    task = asyncio.create_task(self._process(seq, data))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._closed = True
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+目标格式化模块
+每个转发目标在加载配置时编译为格式化器：识别所属平台并绑定消息信封、预先解析文本/模板格式、
+合并请求头；新的目标类型通过 register_platform 以插件形式注册，不需要修改发送路径。
+同一次扇出中格式相同的目标共享渲染缓存，正文只渲染和编码一次，再拼接各目标的信封
+"""
+
+import json
+from typing import Dict, Optional, Any, Callable, Mapping, Tuple
+from loguru import logger
+
+import json_codec
+from template_engine import compile_format
+
+# 参与格式化的简单类型
+SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+Envelope = Callable[[str], dict]
+
+# 单次扇出内共享的渲染缓存：渲染键 -> 渲染结果
+RenderCache = Dict[Any, Any]
+
+# 探测信封结构时使用的占位正文
+_SENTINEL = "\x00text\x00"
+_MISSING = object()
+_MESSAGE_KEY = ("message",)
+
+
+def encode_json(value: Any) -> bytes:
+    """把消息体编码为JSON字节"""
+    return json_codec.dumps(value)
+
+
+def new_render_cache(encoded_message: Optional[bytes] = None) -> RenderCache:
+    """创建单次扇出的渲染缓存
+
+    Args:
+        encoded_message: 可选，接收时已编码的原始消息，透传的目标直接复用
+
+    Returns:
+        渲染缓存
+    """
+    return {} if encoded_message is None else {_MESSAGE_KEY: encoded_message}
+
+
+def _cached(cache: Optional[RenderCache], key: Any, build: Callable[[], Any]) -> Any:
+    """从渲染缓存中取值，不存在时构建并写入"""
+    if cache is None:
+        return build()
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = cache[key] = build()
+    return value
+
+
+class Platform:
+    """目标平台：根据目标配置创建消息信封"""
+
+    def __init__(self, name: str, envelope_factory: Callable[[dict], Envelope], url_keywords: Tuple[str, ...] = ()):
+        """初始化平台
+
+        Args:
+            name: 平台名称，与目标配置的 type 对应
+            envelope_factory: 根据目标配置创建信封函数，信封函数把文本包装为发送的消息体
+            url_keywords: 未配置 type 时用于根据URL识别平台的关键字
+        """
+        self.name = name
+        self.envelope_factory = envelope_factory
+        self.url_keywords = tuple(keyword.lower() for keyword in url_keywords)
+
+
+# 已注册的平台，按注册顺序根据URL识别
+PLATFORMS: Dict[str, Platform] = {}
+
+
+def register_platform(name: str, envelope_factory: Callable[[dict], Envelope], url_keywords: Tuple[str, ...] = ()):
+    """注册目标平台，同名平台会被替换
+
+    Args:
+        name: 平台名称
+        envelope_factory: 根据目标配置创建信封函数
+        url_keywords: 根据URL识别平台的关键字
+    """
+    PLATFORMS[name] = Platform(name, envelope_factory, url_keywords)
+
+
+def detect_platform(target: dict) -> Optional[Platform]:
+    """识别目标所属的平台，优先使用 type，其次根据URL判断
+
+    Args:
+        target: 目标配置
+
+    Returns:
+        平台，无法识别时返回 None
+    """
+    platform = PLATFORMS.get(target.get("type", ""))
+    if platform is not None:
+        return platform
+
+    url = (target.get("url") or "").lower()
+    for platform in PLATFORMS.values():
+        if any(keyword in url for keyword in platform.url_keywords):
+            return platform
+
+    return None
+
+
+def _feishu_envelope(target: dict) -> Envelope:
+    return lambda text: {"msg_type": "text", "content": {"text": text}}
+
+
+def _text_envelope(target: dict) -> Envelope:
+    # 微信/企业微信、钉钉格式
+    return lambda text: {"msgtype": "text", "text": {"content": text}}
+
+
+def _wechat_personal_envelope(target: dict) -> Envelope:
+    wxid = target.get("wxid", "")
+    if not wxid:
+        logger.warning(f"目标 {target.get('name')} 缺少wxid参数")
+        return lambda text: {}
+    return lambda text: {"type": "sendText", "data": {"wxid": wxid, "msg": text}}
+
+
+def _default_envelope(text: str) -> dict:
+    # 默认返回通用格式
+    return {"text": text}
+
+
+register_platform("feishu", _feishu_envelope, url_keywords=("feishu",))
+register_platform("wechat", _text_envelope, url_keywords=("wechat",))
+register_platform("dingtalk", _text_envelope, url_keywords=("dingtalk",))
+register_platform("wechat_personal", _wechat_personal_envelope)
+
+
+def format_data(message: dict) -> dict:
+    """准备格式化数据：顶级字段及 data 中的简单类型字段
+
+    Args:
+        message: 原始消息
+
+    Returns:
+        格式化数据
+    """
+    result = {}
+
+    # 添加顶级字段
+    for key, value in message.items():
+        if isinstance(value, SIMPLE_TYPES):
+            result[key] = value
+
+    # 添加嵌套数据字段
+    if "data" in message and isinstance(message["data"], dict):
+        for key, value in message["data"].items():
+            if isinstance(value, SIMPLE_TYPES):
+                result[key] = value
+
+    return result
+
+
+class FormatView(Mapping):
+    """按需读取格式化数据，与 format_data 的结果一致但不复制整个消息"""
+
+    __slots__ = ("message", "data")
+
+    def __init__(self, message: dict):
+        self.message = message
+        data = message.get("data")
+        self.data = data if isinstance(data, dict) else None
+
+    def __getitem__(self, key: str) -> Any:
+        # data 中的简单类型字段优先于同名的顶级字段
+        if self.data is not None and key in self.data:
+            value = self.data[key]
+            if isinstance(value, SIMPLE_TYPES):
+                return value
+        value = self.message[key]
+        if isinstance(value, SIMPLE_TYPES):
+            return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(format_data(self.message))
+
+    def __len__(self) -> int:
+        return len(format_data(self.message))
+
+
+def _compile_text_format(text: Any) -> Callable[[FormatView], str]:
+    """编译文本格式字符串"""
+    render = compile_format(text) if isinstance(text, str) else None
+    if render is not None:
+        return render
+    # 无法预先编译时按原方式格式化
+    return lambda view: text.format(**format_data(view.message))
+
+
+def _compile_dollar_template(value: Any) -> Callable[[dict], Any]:
+    """编译 $变量 形式的JSON模板"""
+    if isinstance(value, dict):
+        items = tuple((key, _compile_dollar_template(item)) for key, item in value.items())
+        return lambda data: {key: render(data) for key, render in items}
+    if isinstance(value, list):
+        items = tuple(_compile_dollar_template(item) for item in value)
+        return lambda data: [render(data) for render in items]
+    if isinstance(value, str) and "$" in value:
+        def replace_vars(data: dict) -> str:
+            # 按格式化数据的顺序依次替换变量
+            text = value
+            for key, item in data.items():
+                text = text.replace(f"${key}", str(item))
+            return text
+        return replace_vars
+    return lambda data: value
+
+
+class TargetFormatter:
+    """编译后的目标格式化器"""
+
+    def __init__(self, target: dict):
+        """编译目标的格式化配置
+
+        Args:
+            target: 目标配置
+        """
+        self.target = target
+        self.name = target.get("name")
+        self.platform = detect_platform(target)
+        self.wrap: Envelope = self.platform.envelope_factory(target) if self.platform else _default_envelope
+        self.headers = {
+            "Content-Type": "application/json",
+            **(target.get("headers") or {})
+        }
+
+        format_type = target.get("format_type", "default")
+        self._template: Optional[Callable[[dict], Any]] = None
+        self._formats: Optional[Dict[str, Callable[[FormatView], str]]] = None
+        self._default_format: Optional[Callable[[FormatView], str]] = None
+        if "format" in target and format_type == "template":
+            self._template = _compile_dollar_template(target["format"])
+        elif "format" in target and format_type == "text":
+            formats = target["format"]
+            self._formats = {
+                event_type: _compile_text_format(text) for event_type, text in formats.items() if text
+            }
+            self._default_format = _compile_text_format(formats.get("default", "{description}"))
+
+        # 渲染键：渲染键相同的目标对同一条消息渲染出相同的结果，可在扇出中共享
+        format_key = json.dumps(target.get("format"), sort_keys=True, ensure_ascii=False, default=str)
+        self.template_key = ("template", format_key) if self._template is not None else None
+        if self._formats is not None:
+            self.text_key = ("text", format_key)
+        elif self.platform is not None:
+            self.text_key = ("description",)
+        else:
+            self.text_key = None
+
+        # 信封把正文原样作为一个JSON字符串嵌入时，预先编码信封的前后两段，发送时直接拼接
+        self._splice: Optional[Tuple[bytes, bytes]] = None
+        try:
+            probe = encode_json(self.wrap(_SENTINEL))
+        except Exception:
+            probe = b""
+        marker = encode_json(_SENTINEL)
+        if probe.count(marker) == 1:
+            prefix, suffix = probe.split(marker)
+            self._splice = (prefix, suffix)
+
+    def render_text(self, message: dict) -> Optional[str]:
+        """渲染发送到文本类目标的消息正文
+
+        Args:
+            message: 原始消息
+
+        Returns:
+            消息正文，目标不是文本类目标时返回 None
+        """
+        if self._formats is not None:
+            render = self._formats.get(message.get("event_type", "unknown")) or self._default_format
+            try:
+                return render(FormatView(message))
+            except KeyError as e:
+                logger.warning(f"格式化文本时缺少字段 {e}")
+                return message.get("description", str(message))
+
+        if self.platform is not None:
+            return message.get("description", str(message))
+
+        return None
+
+    def format(self, message: dict) -> Any:
+        """根据目标配置格式化消息
+
+        Args:
+            message: 原始消息
+
+        Returns:
+            发送到目标的消息体
+        """
+        if self._template is not None:
+            return self._template(format_data(message))
+
+        text = self.render_text(message)
+        if text is None:
+            # 默认情况下，直接返回原始消息
+            return message
+
+        return self.wrap(text)
+
+    def encode_text(self, text: Any, encoded: Optional[bytes] = None) -> bytes:
+        """把正文包装为信封并编码
+
+        Args:
+            text: 消息正文
+            encoded: 可选，已编码的正文
+
+        Returns:
+            发送到目标的消息体字节
+        """
+        if self._splice is None:
+            return encode_json(self.wrap(text))
+        if encoded is None:
+            encoded = encode_json(text)
+        prefix, suffix = self._splice
+        return prefix + encoded + suffix
+
+    def encode(self, message: dict, cache: Optional[RenderCache] = None) -> bytes:
+        """格式化消息并编码为发送的字节
+
+        Args:
+            message: 原始消息
+            cache: 同一次扇出共享的渲染缓存，为空时不缓存
+
+        Returns:
+            发送到目标的消息体字节
+        """
+        if self._template is not None:
+            return _cached(cache, self.template_key, lambda: encode_json(self._template(format_data(message))))
+
+        if self.text_key is None:
+            # 默认情况下，直接发送原始消息
+            return _cached(cache, _MESSAGE_KEY, lambda: encode_json(message))
+
+        text, encoded = _cached(cache, self.text_key, lambda: self._render_encoded(message))
+        return self.encode_text(text, encoded)
+
+    def _render_encoded(self, message: dict) -> Tuple[Any, bytes]:
+        """渲染正文并编码，供同一渲染键的目标共享"""
+        text = self.render_text(message)
+        return text, encode_json(text)
+
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+消息模板引擎
+模板在加载时用 string.Formatter.parse 编译为渲染计划，渲染时只读取模板引用到的字段，
+不再扁平化整个消息；编译结果保存在配置快照中，模板定义未变化时直接复用
+"""
+
+import _string
+from string import Formatter
+from typing import List, Optional, Any, Callable, Mapping, Tuple
+
+_FORMATTER = Formatter()
+
+# str.format 支持的转换标记
+_CONVERTERS = {"s": str, "r": repr, "a": ascii}
+
+Render = Callable[[dict], Any]
+
+
+def _fallback(text: str) -> Render:
+    """无法预先编译的字符串（位置参数、嵌套格式说明、格式错误等）按原方式格式化"""
+    def render(data: dict) -> Any:
+        try:
+            return text.format(**data)
+        except KeyError:
+            return text
+    return render
+
+
+def compile_format(text: str, fields: Optional[List[str]] = None) -> Optional[Callable[[Mapping], str]]:
+    """把格式字符串编译为渲染函数
+
+    每个占位符预先拆分为 (前置文本, 顶层字段, 后续属性/下标访问, 转换标记, 格式说明)，
+    渲染时只按顶层字段从映射中取值，结果与 str.format 一致，字段缺失时抛出 KeyError。
+
+    Args:
+        text: 格式字符串
+        fields: 可选，收集引用到的字段名
+
+    Returns:
+        渲染函数；含位置参数、嵌套格式说明或格式错误等无法预先编译的字符串返回 None
+    """
+    plan: List[Tuple[str, Optional[str], Tuple[Tuple[bool, Any], ...], Optional[Callable], str]] = []
+    names: List[str] = []
+    try:
+        for literal, field_name, format_spec, conversion in _FORMATTER.parse(text):
+            if field_name is None:
+                plan.append((literal, None, (), None, ""))
+                continue
+            root, rest = _string.formatter_field_name_split(field_name)
+            if root == "" or isinstance(root, int):
+                return None
+            if "{" in format_spec or (conversion is not None and conversion not in _CONVERTERS):
+                return None
+            plan.append((literal, root, tuple(rest), _CONVERTERS.get(conversion), format_spec))
+            names.append(field_name)
+    except ValueError:
+        return None
+
+    if fields is not None:
+        fields.extend(names)
+    plan = tuple(plan)
+
+    if len(plan) == 1 and not plan[0][0] and not plan[0][2] and plan[0][3] is None:
+        # 整个字符串只有一个简单占位符，如 "{symbol}"
+        root, format_spec = plan[0][1], plan[0][4]
+        return lambda data: format(data[root], format_spec)
+
+    def render(data: Mapping) -> str:
+        parts = []
+        for literal, root, rest, convert, format_spec in plan:
+            if literal:
+                parts.append(literal)
+            if root is None:
+                continue
+            value = data[root]
+            for is_attr, key in rest:
+                value = getattr(value, key) if is_attr else value[key]
+            if convert is not None:
+                value = convert(value)
+            parts.append(format(value, format_spec))
+        return "".join(parts)
+
+    return render
+
+
+def _compile_string(text: str, fields: List[str]) -> Render:
+    """编译模板中的字符串，任一字段缺失（KeyError）时原样返回模板字符串"""
+    render = compile_format(text, fields)
+    if render is None:
+        return _fallback(text)
+
+    def render_or_keep(data: dict) -> Any:
+        try:
+            return render(data)
+        except KeyError:
+            return text
+
+    return render_or_keep
+
+
+def _compile_node(value: Any, fields: List[str]) -> Render:
+    """递归编译模板节点"""
+    if isinstance(value, dict):
+        items = tuple((key, _compile_node(item, fields)) for key, item in value.items())
+        return lambda data: {key: render(data) for key, render in items}
+    if isinstance(value, list):
+        items = tuple(_compile_node(item, fields) for item in value)
+        return lambda data: [render(data) for render in items]
+    if isinstance(value, str) and "{" in value:
+        return _compile_string(value, fields)
+    return lambda data: value
+
+
+class CompiledTemplate:
+    """编译后的消息模板，可直接作为消息转换函数调用"""
+
+    __slots__ = ("source", "fields", "_render")
+
+    def __init__(self, template: dict):
+        """编译模板
+
+        Args:
+            template: 模板定义
+        """
+        if not isinstance(template, dict):
+            raise TypeError("模板定义必须是对象")
+        fields: List[str] = []
+        self.source = template
+        self._render = _compile_node(template, fields)
+        # 模板引用到的字段，按出现顺序去重
+        self.fields = tuple(dict.fromkeys(fields))
+
+    def render(self, message: Any) -> dict:
+        """用模板渲染消息
+
+        占位符的顶层字段取自消息的顶层键，嵌套字段使用 {data[symbol]} 形式访问；
+        字符串中任一字段缺失时该字符串保持原样。
+
+        Args:
+            message: 原始消息
+
+        Returns:
+            应用模板后的消息
+        """
+        return self._render(message if isinstance(message, dict) else {})
+
+    __call__ = render
+
@@ -0,0 +1,132 @@
+"""
+测试公共夹具
+模块都在仓库根目录下，测试前把根目录加入 sys.path；异步测试使用 anyio 插件在 asyncio 上运行
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from loguru import logger
+
+
+@pytest.fixture(autouse=True)
+def _quiet_logs():
+    """测试期间不输出日志"""
+    logger.remove()
+    yield
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class Sink:
+    """记录收到的请求的 HTTP 服务，按路径配置响应状态码和延迟"""
+
+    def __init__(self):
+        self.requests: List[Dict[str, Any]] = []
+        self.status: Dict[str, int] = {}
+        self.delay: Dict[str, float] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.port = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def url(self, path: str = "/ok") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def bodies(self, path: Optional[str] = None) -> List[Any]:
+        """按顺序返回收到的请求体（JSON）"""
+        return [r["json"] for r in self.requests if path is None or r["path"] == path]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            delay = self.delay.get(request.path, 0)
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        self.requests.append({"path": request.path, "json": payload, "time": time.monotonic()})
+        return web.json_response({"errcode": 0}, status=self.status.get(request.path, 200))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+@pytest.fixture
+async def sink():
+    server = Sink()
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+def make_forwarder(tmp_path, monkeypatch):
+    """在临时目录中写入配置并创建转发器，未给出的部分使用最小配置，不监视配置文件"""
+    monkeypatch.chdir(tmp_path)
+
+    def factory(config: dict):
+        from webhook_server import WebhookForwarder
+
+        path = tmp_path / "config" / "webhook_config.json"
+        path.parent.mkdir(exist_ok=True)
+        config = {"targets": [], "routes": {}, "templates": {}, "config_reload": {"enabled": False}, **config}
+        path.write_text(json.dumps(config), encoding="utf-8")
+        return WebhookForwarder(str(path))
+
+    return factory
+
+
+class Running:
+    """在生命周期内运行的转发器及进程内 HTTP 客户端"""
+
+    def __init__(self, forwarder):
+        import httpx
+
+        self.forwarder = forwarder
+        self._lifespan = forwarder.app.router.lifespan_context(forwarder.app)
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=forwarder.asgi_app), base_url="http://testserver"
+        )
+
+    async def __aenter__(self):
+        await self._lifespan.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        await self._lifespan.__aexit__(*exc_info)
+
+
+@pytest.fixture
+def running():
+    """running(forwarder) -> 异步上下文管理器，进入时启动转发器"""
+    return Running
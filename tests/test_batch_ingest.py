@@ -0,0 +1,102 @@
+import json
+import time
+
+import pytest
+
+from batch_ingest import BatchFormatError, iter_json_array, iter_ndjson, peek_stream
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def collect(items):
+    return [item async for item in items]
+
+
+async def test_ndjson_lines_are_parsed_across_chunks():
+    items = await collect(iter_ndjson(chunks(b'{"n":1}\n\n{"n"', b':2}\nnot json\n{"n":3}'), json.loads, 100))
+    assert [item for item, error in items if error is None] == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert [error for _, error in items if error is not None][0].startswith("JSON格式错误")
+
+
+async def test_ndjson_overlong_line_only_fails_itself():
+    items = await collect(iter_ndjson(chunks(b'{"a":"' + b"x" * 50, b'"}\n{"n":1}\n'), json.loads, 20))
+    assert items == [(None, "单条消息超过 20 字节"), ({"n": 1}, None)]
+
+
+async def test_ndjson_overlong_line_within_one_chunk_is_rejected():
+    line = b'{"a":"' + b"x" * 50 + b'"}'
+    items = await collect(iter_ndjson(chunks(line + b'\n{"n":1}\n' + line), json.loads, 20))
+    assert items == [(None, "单条消息超过 20 字节"), ({"n": 1}, None), (None, "单条消息超过 20 字节")]
+
+
+async def test_json_array_elements_split_anywhere():
+    body = json.dumps([{"n": 1}, 12345, "多字节", [1, 2]]).encode("utf-8")
+    for size in (1, 2, 7):
+        parts = [body[i:i + size] for i in range(0, len(body), size)]
+        items = await collect(iter_json_array(chunks(*parts), 1000))
+        assert [item for item, _ in items] == [{"n": 1}, 12345, "多字节", [1, 2]]
+
+
+@pytest.mark.parametrize("body, message", [
+    (b'{"n":1}', "请求体不是JSON数组"),
+    (b'[1 2]', "期望 ','"),
+    (b'[1] x', "多余的内容"),
+    (b'[{"n":', "JSON格式错误"),
+])
+async def test_json_array_format_errors(body, message):
+    with pytest.raises(BatchFormatError, match=message):
+        await collect(iter_json_array(chunks(body), 1000))
+
+
+async def test_peek_stream_replays_consumed_chunks():
+    first, stream = await peek_stream(chunks(b"  ", b"\n [1", b",2]"))
+    assert first == b"["
+    assert b"".join(await collect(stream)) == b"  \n [1,2]"
+
+
+def ndjson(*messages):
+    return b"".join(json.dumps(message).encode() + b"\n" for message in messages)
+
+
+async def test_batch_results_follow_item_order(make_forwarder, running, sink):
+    sink.status["/bad"] = 500
+    forwarder = make_forwarder({
+        "targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+        "routes": {"/in": {"target_ids": ["t"], "dedup": {"enabled": False}}},
+        "ingest": {"batch": {"max_items": 3}}
+    })
+    async with running(forwarder) as app:
+        response = await app.client.post("/in", content=ndjson({"n": 0}, {"n": 1}) + b"oops\n" + ndjson({"n": 3}),
+                                          headers={"content-type": "application/x-ndjson"})
+        array = await app.client.post("/in", json=[{"n": 10}, {"n": 11}])
+    content = response.json()
+    assert response.status_code == 200
+    assert [result["index"] for result in content["results"]] == [0, 1, 2]
+    assert [result["status"] for result in content["results"]][2] == "error"
+    assert content["failed"] == 1 and "3 条" in content["error"]
+    assert array.json()["count"] == 2
+    assert sorted(body["n"] for body in sink.bodies("/t")) == [0, 1, 10, 11]
+
+
+async def test_coalesced_batch_is_sent_in_one_request(make_forwarder, running, sink):
+    forwarder = make_forwarder({
+        "targets": [{"id": "chat", "name": "chat", "type": "feishu", "url": sink.url("/chat"),
+                     "coalesce": {"window_ms": 200, "max_messages": 100, "max_length": 100000}}],
+        "routes": {"/in": {"target_ids": ["chat"], "dedup": {"enabled": False}}}
+    })
+    messages = [{"description": f"m{n}"} for n in range(40)]
+    async with running(forwarder) as app:
+        started = time.monotonic()
+        response = await app.client.post("/in", content=ndjson(*messages),
+                                          headers={"content-type": "application/x-ndjson"})
+        elapsed = time.monotonic() - started
+    assert response.json()["failed"] == 0
+    # 合并窗口内的所有消息一次发出，不受目标并发上限（默认 4）限制
+    assert len(sink.requests) == 1
+    assert sink.bodies("/chat")[0]["content"]["text"].count("\n\n") == 39
+    assert elapsed < 1
@@ -0,0 +1,80 @@
+import time
+
+from circuit_breaker import (
+    CircuitBreaker, CircuitBreakerRegistry, DEFAULT_BREAKER_SETTINGS, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+)
+
+
+def breaker(**overrides):
+    return CircuitBreaker("t", dict(DEFAULT_BREAKER_SETTINGS, min_calls=4, window_size=4, **overrides))
+
+
+def fail(cb, times, latency=0.0):
+    for _ in range(times):
+        probe = cb.allow()
+        assert probe is not None
+        cb.record(False, latency, probe)
+
+
+def test_opens_at_failure_rate_and_short_circuits():
+    cb = breaker()
+    cb.record(True, 0.0)
+    fail(cb, 2)
+    assert cb.state == STATE_CLOSED  # 不足 min_calls
+    fail(cb, 1)
+    assert cb.state == STATE_OPEN
+    assert cb.allow() is None
+    assert cb.short_circuited == 1
+    assert 0 < cb.retry_after() <= DEFAULT_BREAKER_SETTINGS["open_duration"]
+
+
+def test_opens_on_slow_calls():
+    cb = breaker(slow_call_threshold=0.5, slow_call_rate_threshold=0.75)
+    for _ in range(4):
+        cb.record(True, 1.0, cb.allow())
+    assert cb.state == STATE_OPEN
+
+
+def test_half_open_probe_success_closes():
+    cb = breaker(open_duration=0.01, half_open_probes=1)
+    fail(cb, 4)
+    time.sleep(0.02)
+    probe = cb.allow()
+    assert probe is True and cb.state == STATE_HALF_OPEN
+    # 探测进行中时其他调用被短路
+    assert cb.allow() is None
+    cb.record(True, 0.0, probe)
+    assert cb.state == STATE_CLOSED
+
+
+def test_half_open_probe_failure_reopens():
+    cb = breaker(open_duration=0.01)
+    fail(cb, 4)
+    time.sleep(0.02)
+    probe = cb.allow()
+    cb.record(False, 0.0, probe)
+    assert cb.state == STATE_OPEN
+
+
+def test_cancelled_probe_is_released():
+    cb = breaker(open_duration=0.01)
+    fail(cb, 4)
+    time.sleep(0.02)
+    cb.release(cb.allow())
+    assert cb.allow() is True
+
+
+def test_disabled_breaker_always_allows():
+    cb = breaker(enabled=False)
+    fail(cb, 10)
+    assert cb.state == STATE_CLOSED
+
+
+def test_registry_applies_target_overrides_and_keeps_state():
+    registry = CircuitBreakerRegistry({"min_calls": 2, "window_size": 2})
+    target = {"id": "t", "name": "t", "circuit_breaker": {"open_duration": 99}}
+    cb = registry.get(target)
+    assert cb.settings["min_calls"] == 2 and cb.settings["open_duration"] == 99
+    fail(cb, 2)
+    assert registry.get(dict(target, circuit_breaker={"open_duration": 5})) is cb
+    assert cb.state == STATE_OPEN and cb.settings["open_duration"] == 5
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from coalescer import MessageCoalescer, split_texts, DEFAULT_COALESCE_SETTINGS
+
+pytestmark = pytest.mark.anyio
+
+TARGET = {"id": "t", "name": "t"}
+
+
+def settings(**overrides):
+    return dict(DEFAULT_COALESCE_SETTINGS, **overrides)
+
+
+def test_split_texts_respects_boundaries_and_hard_splits():
+    assert split_texts(["aa", "bb", "cc"], 6, "+") == [("aa+bb", [0, 1]), ("cc", [2])]
+    assert split_texts(["abcdefg", "x"], 3, "+") == [("abc", [0]), ("def", [0]), ("g", [0]), ("x", [1])]
+
+
+def test_settings_for_target():
+    assert MessageCoalescer.settings_for({"id": "t"}) is None
+    assert MessageCoalescer.settings_for({"coalesce": {"enabled": False}}) is None
+    assert MessageCoalescer.settings_for({"coalesce": True}) == DEFAULT_COALESCE_SETTINGS
+    assert MessageCoalescer.settings_for({"coalesce": {"window_ms": 10}})["window_ms"] == 10
+
+
+async def test_messages_in_window_are_sent_once():
+    sent = []
+
+    async def flush(target, chunks, items):
+        sent.append([text for text, _ in chunks])
+        return [{"success": True, "item": item} for item in items]
+
+    coalescer = MessageCoalescer(flush)
+    futures = [coalescer.add(TARGET, settings(window_ms=20), f"m{n}", n) for n in range(3)]
+    results = await asyncio.gather(*futures)
+    assert sent == [["m0\n\nm1\n\nm2"]]
+    assert [r["item"] for r in results] == [0, 1, 2]
+    assert all(r["coalesced"] for r in results)
+    assert coalescer.stats()["sent_requests"] == 1
+
+
+async def test_max_messages_flushes_immediately():
+    sent = []
+
+    async def flush(target, chunks, items):
+        sent.append(len(items))
+        return [{"success": True}] * len(items)
+
+    coalescer = MessageCoalescer(flush)
+    futures = [coalescer.add(TARGET, settings(window_ms=10000, max_messages=2), f"m{n}", n) for n in range(2)]
+    await asyncio.wait_for(asyncio.gather(*futures), 1)
+    assert sent == [2]
+
+
+async def test_flush_error_fails_every_item():
+    async def flush(target, chunks, items):
+        raise RuntimeError("down")
+
+    coalescer = MessageCoalescer(flush)
+    futures = [coalescer.add(TARGET, settings(window_ms=5), "m", n) for n in range(2)]
+    results = await asyncio.gather(*futures)
+    assert [r["success"] for r in results] == [False, False]
+
+
+async def test_close_sends_pending_batches():
+    sent = []
+
+    async def flush(target, chunks, items):
+        sent.append(len(items))
+        return [{"success": True}] * len(items)
+
+    coalescer = MessageCoalescer(flush)
+    future = coalescer.add(TARGET, settings(window_ms=10000), "m", 0)
+    await coalescer.close()
+    assert sent == [1] and future.done()
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from connection_pool import ConnectionPoolManager
+
+pytestmark = pytest.mark.anyio
+
+
+def target(target_id, url, **extra):
+    return {"id": target_id, "name": target_id, "url": url, **extra}
+
+
+async def test_targets_on_same_host_share_session():
+    pool = ConnectionPoolManager()
+    a = pool.get_session(target("a", "http://example.com/a"))
+    b = pool.get_session(target("b", "http://example.com:80/b"))
+    c = pool.get_session(target("c", "https://example.com/c"))
+    assert a is b
+    assert c is not a
+    await pool.close()
+    assert a.closed and c.closed
+
+
+async def test_target_override_gets_own_session():
+    pool = ConnectionPoolManager({"limit": 10})
+    shared = pool.get_session(target("a", "http://example.com/a"))
+    own = pool.get_session(target("b", "http://example.com/b", connection_pool={"limit": 2}))
+    assert own is not shared
+    assert own.connector.limit == 2
+    await pool.close()
+
+
+async def test_retire_unused_closes_stale_sessions_after_delay():
+    pool = ConnectionPoolManager({"retire_delay": 0.05})
+    kept = pool.get_session(target("a", "http://keep.example/a"))
+    stale = pool.get_session(target("b", "http://gone.example/b"))
+
+    assert pool.retire_unused([target("a", "http://keep.example/a")]) == 1
+    assert pool.stats()["totals"]["pools"] == 1 and pool.stats()["totals"]["retired"] == 1
+    # 已回收的连接池不再分配给新请求，但在延迟结束前保持打开
+    assert not stale.closed
+    assert pool.get_session(target("a", "http://keep.example/a")) is kept
+
+    await asyncio.sleep(0.1)
+    assert stale.closed
+    assert not kept.closed
+    assert pool.stats()["totals"]["retired"] == 0
+    await pool.close()
+
+
+async def test_update_config_retires_sessions_with_changed_settings():
+    pool = ConnectionPoolManager({"retire_delay": 60})
+    t = target("a", "http://example.com/a")
+    old = pool.get_session(t)
+
+    pool.update_config({"limit": 5, "retire_delay": 60}, [t])
+    new = pool.get_session(t)
+    assert new is not old
+    assert new.connector.limit == 5
+
+    # 关闭时立即关闭等待中的已回收连接池
+    await pool.close()
+    assert old.closed and new.closed
+
+
+async def test_stats_reports_limits_and_connection_counts():
+    pool = ConnectionPoolManager()
+    pool.get_session(target("a", "http://example.com/a"))
+    stats = pool.stats()
+    assert stats["pools"][0]["host"] == "http://example.com:80"
+    assert stats["pools"][0]["limit"] == 100
+    assert {k: stats["pools"][0][k] for k in ("open", "idle", "acquired")} == {"open": 0, "idle": 0, "acquired": 0}
+    assert stats["totals"] == {"pools": 1, "retired": 0, "open": 0, "idle": 0, "acquired": 0}
+    await pool.close()
+
+
+async def test_connection_counts_track_reuse_and_in_flight(sink):
+    pool = ConnectionPoolManager()
+    t = target("a", sink.url("/a"))
+    session = pool.get_session(t)
+
+    async def post():
+        async with session.post(sink.url("/a"), json={}) as response:
+            await response.read()
+
+    sink.delay["/a"] = 0.1
+    task = asyncio.create_task(post())
+    await asyncio.sleep(0.05)
+    assert pool.stats()["totals"]["acquired"] == 1
+    await task
+    # 请求结束后连接放回连接池成为空闲连接，下一个请求复用它
+    assert {k: pool.stats()["totals"][k] for k in ("open", "idle", "acquired")} == {"open": 1, "idle": 1, "acquired": 0}
+
+    sink.delay["/a"] = 0
+    await post()
+    assert {k: pool.stats()["totals"][k] for k in ("open", "idle", "acquired")} == {"open": 1, "idle": 1, "acquired": 0}
+
+    await asyncio.gather(post(), post())
+    assert pool.stats()["totals"]["open"] == 2
+    await pool.close()
+
+
+async def test_force_close_connections_are_not_counted_idle(sink):
+    pool = ConnectionPoolManager({"force_close": True})
+    session = pool.get_session(target("a", sink.url("/a")))
+    async with session.post(sink.url("/a"), json={}) as response:
+        await response.read()
+    assert {k: pool.stats()["totals"][k] for k in ("open", "idle", "acquired")} == {"open": 0, "idle": 0, "acquired": 0}
+    await pool.close()
+
+
+async def test_idle_connections_expire_after_keepalive(sink):
+    pool = ConnectionPoolManager({"keepalive_timeout": 0.05})
+    session = pool.get_session(target("a", sink.url("/a")))
+    async with session.post(sink.url("/a"), json={}) as response:
+        await response.read()
+    assert pool.stats()["totals"]["idle"] == 1
+    await asyncio.sleep(0.1)
+    assert pool.stats()["totals"]["open"] == 0
+    await pool.close()
+
+
+async def test_hot_reload_retires_removed_target_session(make_forwarder, running, sink):
+    forwarder = make_forwarder({
+        "targets": [target("a", sink.url("/a")), target("b", "http://127.0.0.1:1/b")],
+        "connection_pool": {"retire_delay": 0}
+    })
+    async with running(forwarder):
+        pool = forwarder.connection_pool
+        removed = pool.get_session(target("b", "http://127.0.0.1:1/b"))
+        config = dict(forwarder.config, targets=[target("a", sink.url("/a"))])
+        forwarder._install_config(config, save=False)
+        await asyncio.sleep(0.01)
+        assert removed.closed
+        assert pool.stats()["totals"]["pools"] == 1 and pool.stats()["totals"]["retired"] == 0
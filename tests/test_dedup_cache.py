@@ -0,0 +1,69 @@
+import pytest
+
+import dedup_cache
+from dedup_cache import DedupCache, RotatingBloom, DEFAULT_BLOOM_SETTINGS
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup_cache.time, "time", clock)
+    return clock
+
+
+def test_entries_expire_with_their_ttl(clock):
+    cache = DedupCache({"resolution": 1})
+    assert not cache.check_and_add("a", 10)
+    assert cache.check_and_add("a", 10)
+    clock.now += 11
+    assert not cache.check_and_add("a", 10)
+    assert cache.stats()["expirations"] == 1
+
+
+def test_entry_limit_evicts_oldest(clock):
+    cache = DedupCache({"max_entries": 2})
+    for key in "abc":
+        cache.check_and_add(key, 60)
+    assert len(cache) == 2
+    assert not cache.check_and_add("a", 60)
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_bloom_layer_follows_route_window(clock):
+    cache = DedupCache({"max_ttl": 10, "bloom": {"capacity": 1000, "generations": 4}})
+    assert not cache.check_and_add("a", 600)
+    # 精确缓存只保留 max_ttl，之后由布隆过滤器层判断
+    clock.now += 300
+    assert cache.check_and_add("a", 600)
+    assert cache.stats()["bloom_hits"] == 1
+    # 超出窗口（加最多一代）后不再视为重复
+    clock.now += 600
+    assert not cache.check_and_add("a", 600)
+    assert [bloom["window"] for bloom in cache.stats()["bloom"]] == [600]
+
+
+def test_short_windows_do_not_use_bloom(clock):
+    cache = DedupCache({"max_ttl": 10, "bloom": True})
+    cache.check_and_add("a", 5)
+    assert cache.blooms == {}
+
+
+def test_rotating_bloom_retention_is_bounded_by_window():
+    bloom = RotatingBloom(dict(DEFAULT_BLOOM_SETTINGS, capacity=100, generations=3), window=100)
+    assert bloom.span == 50
+    start = bloom._started
+    # 一代结束前加入的元素至少保留一个窗口
+    assert not bloom.check_and_add("late", start + 49)
+    assert bloom.check_and_add("late", start + 148)
+    # 最多再多保留一代：窗口加一代之后一定被丢弃
+    assert not bloom.check_and_add("early", start + 150)
+    assert not bloom.check_and_add("early", start + 301)
+    assert bloom.stats()["generations"] <= 3
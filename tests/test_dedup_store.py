@@ -0,0 +1,187 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from dedup_store import (DedupStore, BatchingDedupStore, DedupStoreError, SqliteDedupStore,
+                         create_dedup_store)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    """最小的 RESP 服务：支持 SET NX PX、AUTH、SELECT，记录收到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self.writers = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop(self):
+        """断开所有客户端连接"""
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                self.commands.append(args)
+                if args[0] == "SET":
+                    key, expires = args[1], self.data.get(args[1], 0)
+                    if expires > time.time():
+                        writer.write(b"$-1\r\n")
+                    else:
+                        self.data[key] = time.time() + int(args[5]) / 1000
+                        writer.write(b"+OK\r\n")
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+
+@pytest.fixture
+async def redis():
+    server = FakeRedis()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+async def open_redis_store(redis, **settings):
+    store = create_dedup_store({"backend": "redis", "url": f"redis://127.0.0.1:{redis.port}/0",
+                                "batch_interval": 0.01, **settings})
+    await store.open()
+    return store
+
+
+def test_store_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        DedupStore({})
+    with pytest.raises(TypeError):
+        BatchingDedupStore({})
+
+
+async def test_redis_checks_are_pipelined_in_one_batch(redis):
+    store = await open_redis_store(redis, key_prefix="p:")
+    try:
+        results = await asyncio.gather(*(store.check_and_add(key, 60) for key in ["a", "b", "a"]))
+    finally:
+        await store.close()
+    assert results == [False, False, True]
+    assert store.stats()["batches"] == 1
+    assert [args[:2] + args[3:5] for args in redis.commands] == [["SET", "p:" + key, "NX", "PX"] for key in "aba"]
+    assert {args[5] for args in redis.commands} == {"60000"}
+
+
+async def test_redis_keys_expire_with_ttl(redis):
+    store = await open_redis_store(redis)
+    try:
+        assert not await store.check_and_add("a", 0.05)
+        assert await store.check_and_add("a", 0.05)
+        await asyncio.sleep(0.08)
+        assert not await store.check_and_add("a", 0.05)
+    finally:
+        await store.close()
+
+
+async def test_redis_reconnects_after_connection_loss(redis):
+    store = await open_redis_store(redis)
+    try:
+        assert not await store.check_and_add("a", 60)
+        redis.drop()
+        await asyncio.sleep(0.01)
+        # 断线的那一批按配置放行，下一批重新连接
+        assert not await store.check_and_add("b", 60)
+        assert store.errors == 1
+        assert await store.check_and_add("a", 60)
+    finally:
+        await store.close()
+    assert redis.connections == 2
+
+
+async def test_redis_sends_auth_and_select(redis):
+    store = create_dedup_store({"backend": "redis", "url": f"redis://:secret@127.0.0.1:{redis.port}/3"})
+    await store.open()
+    await store.close()
+    assert redis.commands == [["AUTH", "secret"], ["SELECT", "3"]]
+
+
+async def test_unreachable_store_fails_closed_when_configured(redis):
+    port = redis.port
+    await redis.stop()
+    store = create_dedup_store({"backend": "redis", "url": f"redis://127.0.0.1:{port}/0",
+                                "fail_open": False, "timeout": 0.2})
+    await store.open()
+    try:
+        with pytest.raises(DedupStoreError):
+            await store.check_and_add("a", 60)
+    finally:
+        await store.close()
+    await redis.start()
+
+
+async def test_sqlite_store_is_shared_between_instances(tmp_path):
+    settings = {"backend": "sqlite", "path": str(tmp_path / "dedup.db")}
+    first, second = create_dedup_store(settings), create_dedup_store(settings)
+    assert isinstance(first, SqliteDedupStore)
+    await first.open()
+    await second.open()
+    try:
+        assert not await first.check_and_add("a", 60)
+        assert await second.check_and_add("a", 60)
+        assert not await second.check_and_add("short", 0.01)
+        await asyncio.sleep(0.02)
+        assert not await first.check_and_add("short", 0.01)
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def test_sqlite_batch_that_started_is_not_timed_out(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    store = create_dedup_store({"backend": "sqlite", "path": path, "fail_open": False, "timeout": 0.05})
+    await store.open()
+    # 另一个进程持有写锁，这一批的事务在超时后才能提交
+    locker = sqlite3.connect(path, isolation_level=None)
+    locker.execute("BEGIN IMMEDIATE")
+    try:
+        check = asyncio.create_task(store.check_and_add("a", 60))
+        await asyncio.sleep(0.2)
+        assert not check.done()
+        locker.execute("COMMIT")
+        # 事务开始后等它完成，不会返回错误后仍写入记录
+        assert await check is False
+        assert await store.check_and_add("a", 60) is True
+        assert store.errors == 0
+    finally:
+        locker.close()
+        await store.close()
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from delivery_journal import DeliveryJournal, STATE_DELIVERED, STATE_PENDING, STATE_DEAD, STATE_FAILED
+
+pytestmark = pytest.mark.anyio
+
+
+async def reopen_pending(path):
+    journal = await open_journal(path)
+    try:
+        return await journal.load_pending()
+    finally:
+        await journal.close()
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.db")
+
+
+async def open_journal(path, **settings):
+    journal = DeliveryJournal({"enabled": True, "path": path, **settings})
+    await journal.open()
+    return journal
+
+
+async def test_record_and_mark_are_group_committed(journal_path):
+    journal = await open_journal(journal_path)
+    ids = await asyncio.gather(*(
+        journal.record({"_id": f"m{n}", "n": n}, ["a", "b"]) for n in range(5)
+    ))
+    assert len(set(ids)) == 5
+
+    journal.mark(ids[0], "a", STATE_DELIVERED)
+    journal.mark(ids[0], "b", STATE_DELIVERED)
+    journal.mark(ids[1], "a", STATE_DEAD)
+    pending = await journal.load_pending()
+    await journal.close()
+
+    assert [(journal_id, target_id) for journal_id, _, target_id in pending] == (
+        [(ids[1], "b")] + [(journal_id, t) for journal_id in ids[2:] for t in ("a", "b")]
+    )
+    # 同一消息的多个目标共享同一个消息对象
+    assert pending[1][1] is pending[2][1]
+
+
+async def test_pending_state_survives_reopen(journal_path):
+    journal = await open_journal(journal_path)
+    journal_id = await journal.record({"_id": "m", "n": 1}, ["a"])
+    await journal.close()
+
+    journal = await open_journal(journal_path)
+    assert await journal.load_pending() == [(journal_id, {"_id": "m", "n": 1}, "a")]
+    await journal.close()
+
+
+async def test_compact_removes_finished_messages_only(journal_path):
+    journal = await open_journal(journal_path, retention_seconds=0)
+    done = await journal.record({"_id": "done"}, ["a"])
+    failed = await journal.record({"_id": "failed"}, ["a"])
+    pending = await journal.record({"_id": "pending"}, ["a"])
+    dead = await journal.record({"_id": "dead"}, ["a"])
+    journal.mark(done, "a", STATE_DELIVERED)
+    journal.mark(failed, "a", STATE_FAILED)
+    journal.mark(dead, "a", STATE_DEAD)
+    await asyncio.sleep(0.01)
+
+    assert await journal.compact() == 2
+    stats = await journal.stats()
+    await journal.close()
+    assert stats["states"] == {STATE_PENDING: 1, STATE_DEAD: 1}
+    assert [journal_id for journal_id, _, _ in await reopen_pending(journal_path)] == [pending]
+
+
+async def test_forwarder_replays_pending_deliveries_on_startup(make_forwarder, running, sink, journal_path):
+    journal = await open_journal(journal_path)
+    await journal.record({"_id": "m1", "event_type": "status", "n": 7}, ["t"])
+    await journal.close()
+
+    forwarder = make_forwarder({
+        "targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+        "journal": {"enabled": True, "path": journal_path}
+    })
+    async with running(forwarder):
+        for _ in range(50):
+            if sink.requests:
+                break
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.05)
+        states = (await forwarder.journal.stats())["states"]
+
+    assert sink.bodies("/t")[0]["n"] == 7
+    assert states == {STATE_DELIVERED: 1}
+    assert await reopen_pending(journal_path) == []
+
+
+async def test_replay_gives_up_on_removed_target(make_forwarder, running, journal_path):
+    journal = await open_journal(journal_path)
+    await journal.record({"_id": "m1"}, ["gone"])
+    await journal.close()
+
+    forwarder = make_forwarder({"journal": {"enabled": True, "path": journal_path}})
+    async with running(forwarder):
+        await asyncio.sleep(0.05)
+        states = (await forwarder.journal.stats())["states"]
+    assert states == {STATE_FAILED: 1}
+
+
+async def test_messages_received_during_replay_are_not_replayed(make_forwarder, running, sink, journal_path):
+    forwarder = make_forwarder({
+        "targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+        "routes": {"/in": {"target_ids": ["t"], "dedup": {"enabled": False}}},
+        "journal": {"enabled": True, "path": journal_path}
+    })
+    async with running(forwarder) as app:
+        # 启动后立即到达的消息已经写入日志，重放不应再投递一次
+        for n in range(3):
+            assert (await app.client.post("/in", json={"n": n})).status_code == 200
+        await asyncio.sleep(0.1)
+    assert sorted(body["n"] for body in sink.bodies("/t")) == [0, 1, 2]
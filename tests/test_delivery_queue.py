@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from delivery_queue import DeliveryQueueManager
+
+pytestmark = pytest.mark.anyio
+
+TARGET = {"id": "t", "name": "t"}
+
+
+async def test_worker_delivers_in_order():
+    manager = DeliveryQueueManager()
+    delivered = []
+
+    async def send(message, target, ticket, context):
+        delivered.append(message["n"])
+        return {"success": True}
+
+    await manager.start(send)
+    for n in range(5):
+        assert manager.enqueue({"n": n}, [TARGET])[0]["queued"]
+    await manager.close()
+    assert delivered == [0, 1, 2, 3, 4]
+
+
+async def test_full_queue_rejects_message():
+    manager = DeliveryQueueManager({"max_queue_size": 1})
+    release = asyncio.Event()
+
+    async def send(message, target, ticket, context):
+        await release.wait()
+        return {"success": True}
+
+    await manager.start(send)
+    manager.enqueue({"n": 0}, [TARGET])
+    await asyncio.sleep(0)  # 工作协程取走第一条
+    assert manager.enqueue({"n": 1}, [TARGET])[0]["queued"]
+    assert not manager.enqueue({"n": 2}, [TARGET])[0]["queued"]
+    release.set()
+    await manager.close()
+
+
+async def test_reserved_slot_is_not_taken_by_other_messages():
+    manager = DeliveryQueueManager({"max_queue_size": 1})
+    await manager.start(lambda *args: asyncio.sleep(1))
+
+    reserved = manager.reserve([TARGET])
+    assert reserved == [True]
+    # 空位已被预留：其他消息不能预留也不能直接入队
+    assert manager.reserve([TARGET]) == [False]
+    assert not manager.enqueue({"n": "other"}, [TARGET])[0]["queued"]
+
+    assert manager.enqueue({"n": "mine"}, [TARGET], reserved=reserved)[0]["queued"]
+    assert manager.stats()["t"]["depth"] == 1
+    await manager.close()
+
+
+async def test_release_returns_reserved_slot():
+    manager = DeliveryQueueManager({"max_queue_size": 1})
+    await manager.start(lambda *args: asyncio.sleep(1))
+    reserved = manager.reserve([TARGET])
+    manager.release([TARGET], reserved)
+    assert manager.reserve([TARGET]) == [True]
+    await manager.close()
+
+
+async def test_async_route_503_does_not_consume_dedup_entry(make_forwarder, running, sink):
+    """队列已满返回 503 的消息重发后应被接收并投递，而不是被当作重复消息"""
+    sink.delay["/slow"] = 0.2
+    forwarder = make_forwarder({
+        "targets": [{"id": "slow", "name": "slow", "url": sink.url("/slow"), "queue_size": 1}],
+        "routes": {"/in": {"target_ids": ["slow"], "delivery_mode": "async"}}
+    })
+    async with running(forwarder) as app:
+        first = await app.client.post("/in", json={"n": 1})
+        assert first.status_code == 202
+        await asyncio.sleep(0.05)  # 工作协程取走第一条，正在发送
+        assert (await app.client.post("/in", json={"n": 2})).status_code == 202
+
+        rejected = await app.client.post("/in", json={"n": 3})
+        assert rejected.status_code == 503
+        # 被拒收的消息不记入历史
+        history = (await app.client.get("/history", params={"limit": 10})).json()
+        assert sorted(entry["message"]["n"] for entry in history["history"]) == [1, 2]
+
+        await asyncio.sleep(0.5)
+        resent = await app.client.post("/in", json={"n": 3})
+        assert resent.status_code == 202
+        assert resent.json()["results"][0]["queued"] is True
+        await asyncio.sleep(0.3)
+
+    assert [body["n"] for body in sink.bodies("/slow")] == [1, 2, 3]
+
+
+async def test_oldest_age_follows_queue_head():
+    manager = DeliveryQueueManager()
+    release = asyncio.Event()
+
+    async def send(message, target, ticket, context):
+        await release.wait()
+        return {"success": True}
+
+    await manager.start(send)
+    assert manager.enqueue({"n": 0}, [TARGET])[0]["queued"]
+    await asyncio.sleep(0)  # 工作协程取走第一条
+    assert manager.stats()["t"]["oldest_age"] == 0.0
+
+    manager.enqueue({"n": 1}, [TARGET])
+    await asyncio.sleep(0.05)
+    manager.enqueue({"n": 2}, [TARGET])
+    assert manager.stats()["t"]["oldest_age"] >= 0.05
+    release.set()
+    await manager.close()
+
+
+async def test_update_config_resizes_queue_and_workers():
+    manager = DeliveryQueueManager({"max_queue_size": 1})
+    release = asyncio.Event()
+
+    async def send(message, target, ticket, context):
+        await release.wait()
+        return {"success": True}
+
+    await manager.start(send)
+    manager.enqueue({"n": 0}, [TARGET])
+    await asyncio.sleep(0)
+    manager.enqueue({"n": 1}, [TARGET])
+    assert not manager.enqueue({"n": 2}, [TARGET])[0]["queued"]
+
+    manager.update_config({"max_queue_size": 3, "workers_per_target": 3})
+    assert manager.enqueue({"n": 2}, [TARGET])[0]["queued"]
+    stats = manager.stats()["t"]
+    assert (stats["max_size"], stats["workers"]) == (3, 3)
+
+    # 工作协程减少时多余的协程完成当前投递后退出
+    manager.update_config({"max_queue_size": 3, "workers_per_target": 1})
+    release.set()
+    await asyncio.sleep(0.05)
+    assert len([task for task in manager._queues["t"].tasks if not task.done()]) == 1
+    assert manager.stats()["t"]["delivered"] == 3
+    await manager.close()
@@ -0,0 +1,75 @@
+import time
+import asyncio
+
+import pytest
+
+from fanout import FanoutEngine
+
+pytestmark = pytest.mark.anyio
+
+
+def targets(*ids, **extra):
+    return [{"id": target_id, "name": target_id, **extra} for target_id in ids]
+
+
+async def test_targets_are_sent_concurrently_and_results_keep_order():
+    engine = FanoutEngine()
+
+    async def send(message, target):
+        await asyncio.sleep(0.1 if target["id"] == "a" else 0.01)
+        return {"success": True}
+
+    started = time.monotonic()
+    results = await engine.dispatch({}, targets("a", "b", "c"), send)
+    assert time.monotonic() - started < 0.18
+    assert [r["target_id"] for r in results] == ["a", "b", "c"]
+    assert all(r["success"] for r in results)
+
+
+async def test_failing_target_does_not_affect_others():
+    engine = FanoutEngine()
+
+    async def send(message, target):
+        if target["id"] == "bad":
+            raise RuntimeError("boom")
+        return {"success": True}
+
+    results = await engine.dispatch({}, targets("ok", "bad"), send)
+    assert results[0]["success"] is True
+    assert results[1]["success"] is False
+
+
+async def test_per_target_and_global_caps():
+    engine = FanoutEngine({"max_concurrency": 3, "per_target_concurrency": 2})
+    in_flight = {}
+    peak = {"total": 0}
+
+    async def send(message, target):
+        in_flight[target["id"]] = in_flight.get(target["id"], 0) + 1
+        total = sum(in_flight.values())
+        peak[target["id"]] = max(peak.get(target["id"], 0), in_flight[target["id"]])
+        peak["total"] = max(peak["total"], total)
+        await asyncio.sleep(0.02)
+        in_flight[target["id"]] -= 1
+        return {"success": True}
+
+    await asyncio.gather(*(engine.dispatch({}, targets("a", "b"), send) for _ in range(6)))
+    assert peak["a"] <= 2 and peak["b"] <= 2
+    assert peak["total"] == 3
+
+
+async def test_target_max_concurrency_overrides_default():
+    engine = FanoutEngine({"per_target_concurrency": 4})
+    in_flight = 0
+    peak = 0
+
+    async def send(message, target):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"success": True}
+
+    await asyncio.gather(*(engine.dispatch({}, targets("a", max_concurrency=1), send) for _ in range(5)))
+    assert peak == 1
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from fast_ingest import FastIngestApp, iter_body
+
+pytestmark = pytest.mark.anyio
+
+
+def receiver(*messages):
+    queue = list(messages)
+
+    async def receive():
+        if queue:
+            return queue.pop(0)
+        await asyncio.sleep(3600)
+
+    return receive
+
+
+def http_scope(path, content_type=b"application/json", method="POST"):
+    return {"type": "http", "method": method, "path": path, "query_string": b"", "scheme": "http",
+            "server": ("testserver", 80), "headers": [(b"content-type", content_type)]}
+
+
+async def call(app, scope, *messages):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receiver(*messages), send)
+    return sent
+
+
+async def test_iter_body_raises_on_disconnect():
+    chunks = []
+    with pytest.raises(ClientDisconnect):
+        async for chunk in iter_body(receiver({"type": "http.request", "body": b"{\"a\"", "more_body": True},
+                                              {"type": "http.disconnect"})):
+            chunks.append(chunk)
+    assert chunks == [b"{\"a\""]
+
+
+@pytest.fixture
+def forwarder(make_forwarder, sink):
+    return make_forwarder({
+        "targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+        "routes": {"/in": {"target_ids": ["t"], "dedup": {"enabled": False}}}
+    })
+
+
+async def test_truncated_body_is_dropped(forwarder, running, sink):
+    async with running(forwarder):
+        sent = await call(forwarder.asgi_app, http_scope("/in"),
+                          {"type": "http.request", "body": b'{"text": "trunc', "more_body": True},
+                          {"type": "http.disconnect"})
+    assert sent == []
+    assert sink.requests == []
+
+
+async def test_truncated_ndjson_keeps_complete_lines_only(forwarder, running, sink):
+    async with running(forwarder):
+        await call(forwarder.asgi_app, http_scope("/in", b"application/x-ndjson"),
+                   {"type": "http.request", "body": b'{"n": 1}\n{"n": 2}\n{"n": 3', "more_body": True},
+                   {"type": "http.disconnect"})
+    assert sorted(body["n"] for body in sink.bodies("/t")) == [1, 2]
+
+
+async def test_webhooks_take_the_fast_lane(forwarder, running, sink, monkeypatch):
+    async with running(forwarder) as app:
+        assert isinstance(forwarder.asgi_app, FastIngestApp)
+        # 命中路由的请求不经过 FastAPI 应用
+        fastapi_calls = []
+        original = forwarder.asgi_app.app
+
+        async def spy(scope, receive, send):
+            fastapi_calls.append(scope.get("path"))
+            await original(scope, receive, send)
+
+        monkeypatch.setattr(forwarder.asgi_app, "app", spy)
+        response = await app.client.post("/in", json={"n": 1})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert fastapi_calls == []
+
+        # 表单、不支持的方法和管理接口交给 FastAPI
+        assert (await app.client.post("/in", data={"n": "2"})).status_code == 200
+        assert (await app.client.put("/in", json={"n": 3})).status_code == 405
+        assert (await app.client.get("/routes")).status_code == 200
+        assert fastapi_calls == ["/in", "/in", "/routes"]
+    assert [body["n"] for body in sink.bodies("/t")] == [1, "2"]
+
+
+async def test_fast_lane_can_be_disabled(make_forwarder):
+    forwarder = make_forwarder({"ingest": {"fast_lane": False}})
+    assert forwarder.asgi_app is forwarder.app
@@ -0,0 +1,58 @@
+import pytest
+
+import json_codec
+from fingerprint import DedupPolicy, canonical_bytes, digest
+
+
+def policy(**route):
+    return DedupPolicy.from_config({"window": 60}, route)
+
+
+def test_canonical_bytes_ignore_key_order():
+    assert canonical_bytes({"b": 1, "a": [1, 2]}) == canonical_bytes({"a": [1, 2], "b": 1})
+    assert digest(b"x") == digest(b"x") and len(digest(b"x")) == 32
+
+
+@pytest.mark.parametrize("name", list(json_codec.CODECS))
+def test_canonical_bytes_do_not_depend_on_the_installed_codec(monkeypatch, name):
+    # 各编解码器编码结果不同的值：指数形式的浮点数、NaN、整数与字符串混合的键
+    message = {"p": 1e16, "q": 1e-7, "r": float("nan"), "s": None, "mixed": {1: "a", "b": 2}}
+    monkeypatch.setattr(json_codec, "codec", json_codec.codec)
+    json_codec.set_codec("json")
+    reference = canonical_bytes(message)
+    json_codec.set_codec(name)
+    assert canonical_bytes(message) == reference
+    assert reference == b'{"mixed":{"1":"a","b":2},"p":1e+16,"q":1e-07,"r":NaN,"s":null}'
+    # NaN 不会与 None 冲突
+    assert canonical_bytes({"r": float("nan")}) != canonical_bytes({"r": None})
+
+
+def test_whole_message_fingerprint_ignores_volatile_fields():
+    p = policy()
+    assert p.fingerprint({"a": 1, "_route": {"path": "/x"}, "_id": "z"}) == p.fingerprint({"a": 1})
+    assert p.fingerprint({"a": 1}) != p.fingerprint({"a": 2})
+
+
+def test_key_paths_select_fields():
+    p = policy(key=["data.symbol", "data.side"])
+    base = {"data": {"symbol": "BTC", "side": "buy", "price": 1}}
+    assert p.fingerprint(base) == p.fingerprint({"data": {"symbol": "BTC", "side": "buy", "price": 2}})
+    assert p.fingerprint(base) != p.fingerprint({"data": {"symbol": "ETH", "side": "buy"}})
+
+
+def test_header_key_falls_back_to_message():
+    p = policy(key="header:X-Idempotency-Key")
+    assert p.fingerprint({"a": 1}, {"x-idempotency-key": "k1"}) == p.fingerprint({"a": 2}, {"x-idempotency-key": "k1"})
+    assert p.fingerprint({"a": 1}, {}) == policy().fingerprint({"a": 1})
+
+
+def test_message_id_prefers_producer_id_unless_key_configured():
+    assert policy().message_id({"_id": "given", "a": 1}) == "given"
+    assert policy(key="_id").message_id({"_id": "given"}) == "given"
+    assert policy(key="a").message_id({"_id": "given", "a": 1}) != "given"
+
+
+def test_route_settings_override_global():
+    p = DedupPolicy.from_config({"window": 60}, {"window": 5})
+    assert p.window == 5
+    assert DedupPolicy.from_config({"window": 60}, {"enabled": False}).window == 0
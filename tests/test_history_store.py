@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+import history_store
+from history_store import HistoryStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = HistoryStore({"enabled": True, "path": str(tmp_path / "history.db"), "commit_interval": 0})
+    await store.open()
+    yield store
+    await store.close()
+
+
+async def query(store, **kwargs):
+    await store._flush()
+    return json.loads(await store.query(**kwargs))
+
+
+async def test_messages_and_results_are_queried_newest_first(store):
+    for n in range(5):
+        store.add({"_id": f"m{n}", "n": n, "event_type": "trade" if n % 2 else "status",
+                   "data": {"symbol": "BTC" if n < 3 else "ETH"}, "_route": {"path": "/in"}})
+    store.track("m1", ["t1", "t2"], "pending")
+    store.update("m1", "t1", "delivered")
+    store.track("m4", ["t2"], "pending")
+
+    page = await query(store, limit=2)
+    assert [item["message"]["n"] for item in page["history"]] == [4, 3]
+    rest = await query(store, limit=10, cursor=page["next_cursor"])
+    assert [item["message"]["n"] for item in rest["history"]] == [2, 1, 0]
+    assert rest["next_cursor"] is None
+
+    def ns(page):
+        return [item["message"]["n"] for item in page["history"]]
+
+    assert ns(await query(store, event_type="trade")) == [3, 1]
+    assert ns(await query(store, symbol="ETH")) == [4, 3]
+    assert ns(await query(store, route="/other")) == []
+    assert ns(await query(store, target_id="t2")) == [4, 1]
+    assert ns(await query(store, target_id="t1", outcome="delivered")) == [1]
+    assert ns(await query(store, outcome="pending")) == [4, 1]
+    assert (await query(store, event_type="trade"))["history"][1]["results"] == {"t1": "delivered", "t2": "pending"}
+
+
+async def test_time_range_uses_receive_time(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(history_store.time, "time", lambda: now[0])
+    for n in range(4):
+        store.add({"_id": f"m{n}", "n": n})
+        now[0] += 10
+    page = await query(store, since=1010, until=1030)
+    assert [item["message"]["n"] for item in page["history"]] == [2, 1]
+    assert (await query(store, since=5000))["history"] == []
+
+
+async def test_compact_keeps_the_newest_rows(store):
+    store.settings.update(max_rows=3, delete_chunk=2)
+    for n in range(10):
+        store.add({"_id": f"m{n}", "n": n})
+        store.track(f"m{n}", ["t"], "delivered")
+    assert await store.compact() == 7
+    stats = await store.stats()
+    assert stats["rows"] == 3
+    assert [item["message"]["n"] for item in (await query(store, limit=10))["history"]] == [9, 8, 7]
+
+
+async def test_history_endpoint_reads_the_store(make_forwarder, running, sink, tmp_path):
+    forwarder = make_forwarder({
+        "targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+        "routes": {"/in": {"target_ids": ["t"]}},
+        "history_store": {"enabled": True, "path": str(tmp_path / "history.db"), "commit_interval": 0}
+    })
+    async with running(forwarder) as app:
+        for n in range(3):
+            await app.client.post("/in", json={"n": n, "event_type": "status"})
+        await forwarder.history_store._flush()
+        page = (await app.client.get("/history", params={"limit": 2, "since": "2000-01-01T00:00:00"})).json()
+    assert [item["message"]["n"] for item in page["history"]] == [2, 1]
+    assert page["history"][0]["results"] == {"t": "delivered"}
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from config_manager import ConfigError, build_snapshot
+
+pytestmark = pytest.mark.anyio
+
+BASE = {
+    "targets": [{"id": "a", "name": "a", "url": "http://a"}, {"id": "b", "name": "b", "url": "http://b"}],
+    "templates": {"t": {"description": "{x}"}},
+    "routes": {"/one": {"target_ids": ["a"], "template": "t"}, "/two": {"target_ids": ["b"]}},
+}
+
+
+def test_unchanged_parts_are_reused():
+    first = build_snapshot(BASE, 1)
+    assert first.compiled == {"targets": 2, "templates": 1, "routes": 2}
+
+    changed = {**BASE, "targets": [BASE["targets"][0], {**BASE["targets"][1], "url": "http://b2"}]}
+    second = build_snapshot(changed, 2, first)
+    assert second.compiled == {"targets": 1, "templates": 0, "routes": 1}
+    assert second.formatters["a"] is first.formatters["a"]
+    assert second.templates["t"] is first.templates["t"]
+    assert second.routes["/one"] is first.routes["/one"]
+    assert second.routes["/two"] is not first.routes["/two"]
+    assert second.routes["/two"].targets[0]["url"] == "http://b2"
+
+    # 模板变化时引用它的路由重新编译
+    third = build_snapshot({**changed, "templates": {"t": {"description": "[{x}]"}}}, 3, second)
+    assert third.compiled == {"targets": 0, "templates": 1, "routes": 1}
+    assert third.routes["/one"] is not second.routes["/one"]
+
+
+def test_snapshots_are_immutable_and_validated():
+    snapshot = build_snapshot(BASE, 1)
+    with pytest.raises(AttributeError):
+        snapshot.version = 2
+    with pytest.raises(ConfigError):
+        build_snapshot({"targets": {}, "routes": []}, 2, snapshot)
+
+
+def test_route_conflicts_are_reported_and_cleared():
+    config = {**BASE, "routes": {"/hook/{group}": {"target_ids": ["a"]}, "/hook/{name}": {"target_ids": ["b"]}}}
+    first = build_snapshot(config, 1)
+    assert list(first.route_errors) == ["/hook/{name}"]
+    assert len(first.route_table) == 1
+
+    # 冲突的路由删除后，复用的路由不再带有冲突错误
+    second = build_snapshot({**config, "routes": {"/hook/{name}": {"target_ids": ["b"]}}}, 2, first)
+    assert second.routes["/hook/{name}"] is first.routes["/hook/{name}"]
+    assert second.route_errors == {}
+    assert second.route_table.match("/hook/x")[1] == {"name": "x"}
+
+
+def rewrite(path, config):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    # 保证修改时间变化
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+async def test_config_file_changes_are_picked_up(make_forwarder, running, sink):
+    config = {"targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+              "routes": {"/old": {"target_ids": ["t"]}}}
+    forwarder = make_forwarder(config)
+    async with running(forwarder) as app:
+        version = forwarder.snapshot.version
+        rewrite(forwarder.config_path, {**config, "routes": {"/new": {"target_ids": ["t"]}}})
+        assert await forwarder.config_watcher.check()
+        assert forwarder.snapshot.version == version + 1
+        assert (await app.client.post("/new", json={"n": 1})).status_code == 200
+        assert (await app.client.post("/old", json={"n": 2})).status_code == 404
+
+        # 无效的配置文件不影响当前快照
+        with open(forwarder.config_path, "w", encoding="utf-8") as f:
+            f.write("{broken")
+        assert not await forwarder.config_watcher.check()
+        assert forwarder.config_watcher.stats()["failures"] == 1
+        assert (await app.client.post("/new", json={"n": 3})).status_code == 200
+        status = (await app.client.get("/config/status")).json()
+    assert status["version"] == version + 1
+    assert [body["n"] for body in sink.bodies("/t")] == [1, 3]
+
+
+async def test_invalid_route_update_is_rejected(make_forwarder, running):
+    forwarder = make_forwarder({"routes": {"/in": {}}})
+    async with running(forwarder) as app:
+        snapshot = forwarder.snapshot
+        response = await app.client.put("/routes/in", json={"methods": ["TRACE"]})
+        assert response.status_code == 400
+        assert forwarder.snapshot is snapshot
+        assert (await app.client.post("/routes", json={"path": "/x", "target_ids": ["nope"]})).status_code == 400
+
+
+async def test_in_flight_messages_keep_their_snapshot(make_forwarder, running, sink):
+    sink.delay["/t"] = 0.2
+    forwarder = make_forwarder({"targets": [{"id": "t", "name": "t", "url": sink.url("/t")}],
+                                "routes": {"/in": {"target_ids": ["t"]}}})
+    async with running(forwarder) as app:
+        request = asyncio.create_task(app.client.post("/in", json={"n": 1}))
+        while not sink.in_flight:
+            await asyncio.sleep(0.01)
+        assert (await app.client.delete("/targets/t")).status_code == 200
+        response = await request
+    assert response.json()["results"][0]["success"]
+    assert sink.bodies("/t")[0]["n"] == 1
+
+
+async def test_reload_applies_runtime_sections_to_components(make_forwarder, running, sink):
+    target = {"id": "t", "name": "t", "url": sink.url("/t"), "rate_group": "acct"}
+    config = {"targets": [target], "routes": {"/in": {"target_ids": ["t"]}},
+              "fanout": {"max_concurrency": 8}, "retry": {"max_attempts": 2},
+              "circuit_breaker": {"min_calls": 10}, "delivery_queue": {"max_queue_size": 5},
+              "dead_letter_max_size": 10}
+    forwarder = make_forwarder(config)
+    async with running(forwarder) as app:
+        assert (await app.client.post("/in", json={"n": 1})).status_code == 200
+        assert forwarder.rate_limiter.buckets_for(target) == []
+
+        forwarder._install_config({
+            **forwarder.config,
+            "fanout": {"max_concurrency": 2}, "retry": {"max_attempts": 7},
+            "circuit_breaker": {"min_calls": 3}, "delivery_queue": {"max_queue_size": 50},
+            "dead_letter_max_size": 1, "rate_groups": {"acct": {"per_minute": 60}},
+            "logging": {"payload_max_bytes": 16}
+        }, save=False)
+
+        assert forwarder.fanout.settings["max_concurrency"] == 2
+        assert forwarder.retry.policy_for(target).max_attempts == 7
+        assert forwarder.breakers.get(target).settings["min_calls"] == 3
+        assert forwarder.delivery_queue.reserve([target]) == [True]
+        assert forwarder.delivery_queue.stats()["t"]["max_size"] == 50
+        assert forwarder.dead_letters.max_size == 1
+        assert forwarder.payload_preview.max_bytes == 16
+        # 新增的限流组立即生效
+        assert [bucket.name for bucket in forwarder.rate_limiter.buckets_for(target)] == ["acct"]
+        assert forwarder.restart_required == []
+
+
+async def test_restart_only_changes_are_flagged(make_forwarder, running):
+    forwarder = make_forwarder({})
+    async with running(forwarder) as app:
+        forwarder._install_config({**forwarder.config, "history": {"max_entries": 5}, "json_codec": "json"}, save=False)
+        status = (await app.client.get("/config/status")).json()
+        assert status["restart_required"] == ["json_codec", "history"]
+
+        # 改回启动时的值后不再需要重启
+        forwarder._install_config({k: v for k, v in forwarder.config.items() if k not in ("history", "json_codec")},
+                                  save=False)
+        assert forwarder.restart_required == []
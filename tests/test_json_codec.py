@@ -0,0 +1,42 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+import json_codec
+from json_codec import CODECS, JsonCodec, create_codec
+
+MESSAGES = [
+    {"symbol": "BTC", "price": 1.5, "n": 3, "ok": True, "none": None},
+    {"中文": "消息", "nested": {"b": [1, 2, {"c": "d"}], "a": 0.1}},
+    {"big": 2 ** 70, "list": []},
+    {"dec": Decimal("1.10")},
+]
+
+
+@pytest.fixture(params=list(CODECS))
+def codec(request):
+    return create_codec(request.param)
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_codecs_agree_with_the_stdlib(codec, message):
+    reference = JsonCodec()
+    assert json.loads(codec.dumps(message)) == json.loads(reference.dumps(message))
+    assert codec.loads(codec.dumps(message)) == json.loads(reference.dumps(message))
+
+
+def test_encoding_is_compact_utf8(codec):
+    assert codec.dumps({"a": [1, "二"]}) == '{"a":[1,"二"]}'.encode("utf-8")
+
+
+def test_invalid_json_raises_value_error(codec):
+    with pytest.raises(ValueError):
+        codec.loads(b"{not json")
+
+
+def test_unknown_codec_falls_back_to_auto(monkeypatch):
+    monkeypatch.setattr(json_codec, "codec", json_codec.codec)
+    assert json_codec.set_codec("nope").name == next(iter(CODECS))
+    assert json_codec.set_codec("json").name == "json"
+    assert json_codec.dumps({"x": 1}) == b'{"x":1}'
@@ -0,0 +1,95 @@
+import io
+import json
+import os
+import time
+
+import pytest
+from loguru import logger
+
+from log_pipeline import LogPipeline, PayloadPreview, parse_size
+
+
+@pytest.fixture
+def pipeline_for(tmp_path):
+    pipelines, handlers = [], []
+
+    def create(console=None, **settings):
+        pipeline = LogPipeline({"file": str(tmp_path / "logs" / "app.log"), **settings}, console=console)
+        pipeline.start()
+        handlers.append(logger.add(pipeline.file_sink, format="{message}", level="DEBUG"))
+        if console is not None:
+            handlers.append(logger.add(pipeline.console_sink, format="{message}", level="DEBUG"))
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield create
+    for handler in handlers:
+        logger.remove(handler)
+    for pipeline in pipelines:
+        pipeline.close()
+
+
+def test_parse_size():
+    assert parse_size("10 MB") == 10 * 1024 ** 2
+    assert parse_size("1.5 kb") == 1536
+    assert parse_size(100) == 100
+    assert parse_size(None) is None
+
+
+def test_payload_preview_truncates_and_samples():
+    preview = PayloadPreview({"payload_max_bytes": 4})
+    assert preview(b'{"a"}') == '{"a"...(省略1字节)'
+    assert preview(b"[1]") == "[1]"
+    # 截断不会拆开多字节字符
+    assert preview('"中文"'.encode("utf-8")).startswith('"')
+    assert PayloadPreview({"payload_sample_rate": 0})(b"{}") is None
+
+
+def test_json_lines_include_extras_and_exceptions(pipeline_for, tmp_path):
+    console = io.StringIO()
+    pipeline = pipeline_for(console=console)
+    logger.bind(route="/in").info("收到消息")
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.exception("失败")
+    pipeline.close()
+
+    lines = [json.loads(line) for line in (tmp_path / "logs" / "app.log").read_text("utf-8").splitlines()]
+    assert [(line["level"], line["message"]) for line in lines] == [("INFO", "收到消息"), ("ERROR", "失败")]
+    assert lines[0]["route"] == "/in"
+    assert "RuntimeError: boom" in lines[1]["exception"]
+    assert "| INFO     |" in console.getvalue() and '{"route": "/in"}' in console.getvalue()
+    assert pipeline.stats()["written"] == 4
+
+
+def test_rotation_and_retention(pipeline_for, tmp_path):
+    pipeline = pipeline_for(rotation=200, compression=None, retention=2, format="text")
+    # 写线程按批写入，每批之后检查大小
+    for n in range(6):
+        for _ in range(5):
+            logger.info(f"line {n} " + "x" * 40)
+        time.sleep(0.02)
+    pipeline.close()
+    files = sorted(os.listdir(tmp_path / "logs"))
+    assert pipeline.rotations >= 3
+    assert len(files) == 3 and "app.log" in files
+
+
+def test_rotated_files_are_zipped(pipeline_for, tmp_path):
+    pipeline = pipeline_for(rotation=100)
+    for n in range(5):
+        logger.info("y" * 80)
+    pipeline.close()
+    assert any(name.endswith(".log.zip") for name in os.listdir(tmp_path / "logs"))
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    pipeline = LogPipeline({"file": "", "queue_size": 2})
+    handler = logger.add(pipeline.console_sink, format="{message}")
+    try:
+        for n in range(5):
+            logger.info("x")
+    finally:
+        logger.remove(handler)
+    assert pipeline.stats() == {"queued": 2, "written": 0, "dropped": 3, "rotations": 0}
@@ -0,0 +1,102 @@
+import json
+
+from message_history import MessageHistory
+
+
+def query(history, **kwargs):
+    return json.loads(history.query(**kwargs))
+
+
+def add(history, n, **fields):
+    return history.add({"_id": f"m{n}", "n": n, **fields})
+
+
+def test_ring_buffer_keeps_the_newest_entries():
+    history = MessageHistory({"max_entries": 3})
+    for n in range(5):
+        add(history, n)
+    page = query(history, limit=10)
+    assert [item["message"]["n"] for item in page["history"]] == [4, 3, 2]
+    assert page["next_cursor"] is None
+    assert len(history) == 3
+    # 已覆盖的消息不再更新
+    history.update("m0", "t", "delivered")
+    assert history.stats()["entries"] == 3
+
+
+def test_byte_limit_evicts_oldest_but_keeps_one():
+    history = MessageHistory({"max_entries": 100, "max_bytes": 200})
+    for n in range(10):
+        add(history, n, pad="x" * 40)
+    assert history.stats()["bytes"] <= 200
+    assert query(history)["history"][0]["message"]["n"] == 9
+
+    history = MessageHistory({"max_bytes": 10})
+    add(history, 1)
+    assert len(history) == 1
+
+
+def test_cursor_pages_from_newest_to_oldest():
+    history = MessageHistory()
+    for n in range(5):
+        add(history, n)
+    first = query(history, limit=2)
+    second = query(history, limit=2, cursor=first["next_cursor"])
+    third = query(history, limit=2, cursor=second["next_cursor"])
+    assert [[item["message"]["n"] for item in page["history"]] for page in (first, second, third)] == \
+        [[4, 3], [2, 1], [0]]
+    assert third["next_cursor"] is None
+
+
+def test_non_positive_limit_still_advances_cursor():
+    history = MessageHistory()
+    for n in range(3):
+        add(history, n)
+    seen = []
+    cursor = None
+    for _ in range(5):
+        page = query(history, limit=0, cursor=cursor)
+        seen += [item["message"]["n"] for item in page["history"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    # 每页至少返回一条，按游标翻页最终结束
+    assert seen == [2, 1, 0] and cursor is None
+    assert len(query(history, limit=-5)["history"]) == 1
+
+
+def test_filters_and_delivery_results():
+    history = MessageHistory()
+    history.add({"_id": "a", "event_type": "trade", "data": {"symbol": "BTC"}, "_route": {"path": "/x"}})
+    history.add({"_id": "b", "event_type": "status", "symbol": "ETH", "_route": {"path": "/y"}})
+    history.track("a", ["t1", "t2"], "pending")
+    history.update("a", "t1", "delivered")
+    history.track("b", ["t1"], "pending")
+
+    def ids(**kwargs):
+        return [item["message"]["_id"] for item in query(history, **kwargs)["history"]]
+
+    assert ids(event_type="trade") == ["a"]
+    assert ids(symbol="ETH") == ["b"]
+    assert ids(route="/x") == ["a"]
+    assert ids(target_id="t2") == ["a"]
+    assert ids(target_id="t1", outcome="pending") == ["b"]
+    assert ids(outcome="delivered") == ["a"]
+    assert query(history, event_type="trade")["history"][0]["results"] == {"t1": "delivered", "t2": "pending"}
+
+
+def test_time_range_filters(monkeypatch):
+    import message_history
+    now = [1000.0]
+    monkeypatch.setattr(message_history.time, "time", lambda: now[0])
+    history = MessageHistory()
+    for n in range(4):
+        add(history, n)
+        now[0] += 10
+    assert [item["message"]["n"] for item in query(history, since=1010, until=1030)["history"]] == [2, 1]
+
+
+def test_preencoded_message_is_used_verbatim():
+    history = MessageHistory()
+    history.add({"_id": "a"}, encoded=b'{"_id":"a","raw":true}')
+    assert query(history)["history"][0]["message"] == {"_id": "a", "raw": True}
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+
+import preprocess_pipeline
+from preprocess_pipeline import compile_preprocess, compile_transform, register_transform
+from time_utils import parse_time
+
+
+def run(config, message):
+    pipeline, errors = compile_preprocess(config)
+    assert errors == []
+    return pipeline(message)
+
+
+def test_parse_time_accepts_seconds_milliseconds_and_iso():
+    assert parse_time(None) is None and parse_time("") is None
+    assert parse_time("1700000000") == 1700000000
+    assert parse_time("1700000000500") == 1700000000.5
+    assert parse_time("2024-01-02T03:04:05") == datetime(2024, 1, 2, 3, 4, 5).timestamp()
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
+
+
+def test_mapping_filter_transform_and_add_run_in_order():
+    message = {"data": {"sym": "btc", "px": "1.239", "qty": "3"}, "noise": 1}
+    result = run({
+        "field_mapping": {"symbol": "data.sym", "order.price": "data.px", "qty": "data.qty", "missing": "data.none"},
+        "merge_mapped": False,
+        "include_fields": ["symbol", "order.price", "qty"],
+        "transformations": {"symbol": "upper", "order.price": "round:2", "qty": "to_int"},
+        "add_fields": {"source": "tv", "meta.v": 1},
+    }, message)
+    assert result == {"symbol": "BTC", "order": {"price": 1.24}, "qty": 3, "source": "tv", "meta": {"v": 1}}
+
+
+def test_merge_mapped_keeps_original_fields():
+    assert run({"field_mapping": {"s": "a.b"}}, {"a": {"b": 1}}) == {"a": {"b": 1}, "s": 1}
+
+
+@pytest.mark.parametrize("spec, value, expected", [
+    ("to_string", 5, "5"),
+    ("to_float", "x", 0.0),
+    ("to_bool", "yes", True),
+    ("lower", "ABC", "abc"),
+    ("format:{value}%", 5, "5%"),
+    ("timestamp", "1700000000000", 1700000000.0),
+    ("timestamp_ms", "1700000000", 1700000000000),
+    ("timestamp", "not a time", "not a time"),
+    ("datetime:%Y", "1700000000", "2023"),
+    ("regex:(\\d+)USDT", "BTC 42USDT", "42"),
+    ("regex:zzz", "keep", "keep"),
+])
+def test_transforms(spec, value, expected):
+    assert compile_transform(spec)(value) == expected
+
+
+def test_invalid_steps_are_reported_and_skipped():
+    pipeline, errors = compile_preprocess({
+        "transformations": {"a": "nope", "b": "round:x", "c": "regex:("},
+        "include_fields": "a",
+    })
+    assert errors[0] == "include_fields 必须是列表"
+    assert errors[1] == "未知的字段变换: nope"
+    assert errors[2].startswith("字段变换 round:x 无效")
+    assert errors[3].startswith("字段变换 regex:( 无效")
+    assert pipeline({"a": 1, "b": 2.5}) == {"a": 1, "b": 2.5}
+
+
+def test_registered_transform_is_available(monkeypatch):
+    monkeypatch.setattr(preprocess_pipeline, "TRANSFORMS", dict(preprocess_pipeline.TRANSFORMS))
+    register_transform("suffix", lambda arg: lambda value: f"{value}{arg}")
+    assert run({"transformations": {"s": "suffix:USDT"}}, {"s": "BTC"}) == {"s": "BTCUSDT"}
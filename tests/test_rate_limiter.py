@@ -0,0 +1,67 @@
+import time
+import asyncio
+
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, RATE_LIMIT_PRESETS
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bucket_allows_burst_then_paces():
+    bucket = TokenBucket("t", rate=20, burst=2)
+    started = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    elapsed = time.monotonic() - started
+    # 2 个突发立即放行，之后每个间隔 50ms
+    assert 0.08 <= elapsed < 0.2
+    assert bucket.delayed == 2
+
+
+async def test_concurrent_waiters_are_released_in_arrival_order():
+    bucket = TokenBucket("t", rate=50, burst=1)
+    order = []
+
+    async def worker(n):
+        await bucket.acquire()
+        order.append(n)
+
+    await asyncio.gather(*(worker(n) for n in range(5)))
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_target_type_preset_and_opt_out():
+    limiter = RateLimiter()
+    assert limiter.buckets_for({"id": "f", "type": "feishu"})[0].burst == RATE_LIMIT_PRESETS["feishu"]["burst"]
+    assert limiter.buckets_for({"id": "f", "type": "feishu", "rate_limit": False}) == []
+    assert limiter.buckets_for({"id": "x", "type": "custom"}) == []
+    bucket = limiter.buckets_for({"id": "p", "rate_limit": {"per_minute": 120}})[0]
+    assert bucket.rate == 2 and bucket.burst == 2
+
+
+def test_rate_group_bucket_is_shared():
+    limiter = RateLimiter({"account": {"rate": 1, "burst": 3}})
+    a = limiter.buckets_for({"id": "a", "rate_group": "account", "rate_limit": False})
+    b = limiter.buckets_for({"id": "b", "rate_group": "account", "rate_limit": False})
+    assert a[0] is b[0]
+    assert set(limiter.stats()["groups"]) == {"account"}
+
+
+async def test_open_breaker_does_not_consume_tokens(make_forwarder, running):
+    """熔断器短路的发送不应等待或消耗令牌"""
+    target = {
+        "id": "dead", "name": "dead", "url": "http://127.0.0.1:1/dead",
+        "rate_limit": {"rate": 1, "burst": 1},
+        "circuit_breaker": {"min_calls": 1, "window_size": 1, "open_duration": 60}
+    }
+    forwarder = make_forwarder({"targets": [target]})
+    async with running(forwarder):
+        first = await forwarder._send_payload(b"{}", target)
+        assert not first.success and not first.short_circuited
+
+        started = time.monotonic()
+        results = [await forwarder._send_payload(b"{}", target) for _ in range(5)]
+        assert time.monotonic() - started < 0.1
+        assert all(result.short_circuited for result in results)
+        assert forwarder.rate_limiter.stats()["targets"]["dead"]["delayed"] == 0
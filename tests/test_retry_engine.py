@@ -0,0 +1,90 @@
+import time
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+from dead_letter import DeadLetterStore
+from delivery_journal import STATE_DEAD, STATE_FAILED
+from retry_engine import RetryPolicy, RetryScheduler, SendResult, DEFAULT_RETRY_POLICY, parse_retry_after
+
+pytestmark = pytest.mark.anyio
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+
+def test_backoff_is_bounded_and_retry_after_wins():
+    policy = RetryPolicy(dict(DEFAULT_RETRY_POLICY, base_delay=1, max_delay=4, max_retry_after=60))
+    failure = SendResult(False, status=500)
+    assert all(0 <= policy.next_delay(10, failure) <= 4 for _ in range(100))
+    assert policy.next_delay(1, SendResult(False, status=429, retry_after=7)) == 7
+    assert policy.next_delay(1, SendResult(False, status=503, retry_after=600)) == 60
+    assert policy.is_retryable(SendResult(False, status=502))
+    assert not policy.is_retryable(SendResult(False, status=400))
+
+
+async def test_scheduler_retries_until_success():
+    scheduler = RetryScheduler({"base_delay": 0.01, "max_attempts": 5})
+    calls = []
+    done = asyncio.Event()
+
+    async def send(message, target):
+        calls.append(time.monotonic())
+        return SendResult(len(calls) >= 3, status=None if len(calls) >= 3 else 500)
+
+    await scheduler.start(send, lambda *args: done.set(), lambda *args: pytest.fail("不应耗尽"))
+    assert scheduler.handle_failure({}, {"id": "t"}, None, 1, SendResult(False, status=500))
+    await asyncio.wait_for(done.wait(), 1)
+    await scheduler.close()
+    assert len(calls) == 3
+
+
+async def test_scheduler_gives_up_after_max_attempts():
+    scheduler = RetryScheduler({"base_delay": 0.001, "max_attempts": 3})
+    exhausted = asyncio.Future()
+
+    async def send(message, target):
+        return SendResult(False, status=502)
+
+    await scheduler.start(send, lambda *args: None, lambda *args: exhausted.set_result(args))
+    scheduler.handle_failure({}, {"id": "t"}, "ticket", 1, SendResult(False, status=502))
+    message, target, ticket, attempts, result = await asyncio.wait_for(exhausted, 1)
+    await scheduler.close()
+    assert (ticket, attempts, result.status) == ("ticket", 3, 502)
+
+
+def test_dead_letter_eviction_calls_back():
+    evicted = []
+    store = DeadLetterStore(max_size=2, on_evict=evicted.append)
+    for n in range(3):
+        store.add({"_id": f"m{n}"}, {"id": "t", "name": "t"}, ticket=n, attempts=1)
+    assert [letter["ticket"] for letter in evicted] == [0]
+    assert [letter["ticket"] for letter in store.list()] == [2, 1]
+
+
+async def test_evicted_and_discarded_dead_letters_become_compactable(make_forwarder, running, sink, tmp_path):
+    sink.status["/bad"] = 400
+    forwarder = make_forwarder({
+        "targets": [{"id": "bad", "name": "bad", "url": sink.url("/bad")}],
+        "routes": {"/in": {"target_ids": ["bad"], "dedup": {"enabled": False}}},
+        "journal": {"enabled": True, "path": str(tmp_path / "journal.db"), "retention_seconds": 0},
+        "dead_letter_max_size": 2
+    })
+    async with running(forwarder) as app:
+        for n in range(3):
+            assert (await app.client.post("/in", json={"n": n})).status_code == 200
+        letters = (await app.client.get("/dead-letters")).json()["dead_letters"]
+        assert len(letters) == 2
+
+        assert (await app.client.delete(f"/dead-letters/{letters[0]['id']}")).status_code == 200
+        journal = forwarder.journal
+        await journal._flush()
+        assert (await journal.stats())["states"] == {STATE_DEAD: 1, STATE_FAILED: 2}
+
+        assert await journal.compact() == 2
+        assert (await journal.stats())["states"] == {STATE_DEAD: 1}
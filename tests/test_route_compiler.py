@@ -0,0 +1,70 @@
+import pytest
+
+from route_compiler import compile_route, split_path
+
+TARGETS = [
+    {"id": "a", "name": "a", "url": "http://a"},
+    {"id": "b", "name": "b", "url": "http://b", "enabled": False},
+    {"id": "wx_ops", "name": "wx_ops", "url": "http://ops"},
+]
+
+
+def compile(path="/in", targets=TARGETS, templates=None, **route_config):
+    config = {"targets": targets, "templates": templates or {}}
+    return compile_route(path, route_config, config, lambda name, template: ("template", name))
+
+
+def test_targets_are_resolved_at_compile_time():
+    route, errors = compile(target_ids=["a", "b", "a", "missing"])
+    assert [t["id"] for t in route.targets] == ["a"]
+    assert errors == ["未知的目标ID: missing"]
+
+
+def test_compiled_route_is_immutable():
+    route, _ = compile()
+    with pytest.raises(AttributeError):
+        route.path = "/other"
+
+
+def test_methods_are_normalised_and_validated():
+    route, errors = compile(methods=["post", "get", "trace"])
+    assert route.methods == ("POST", "GET")
+    assert errors == ["不支持的HTTP方法: TRACE"]
+    assert compile()[0].methods == ("POST",)
+
+
+def test_header_and_query_checks():
+    route, errors = compile(headers={"X-Token": "s3cret", "X-Any": ""}, query_params={"k": "v"})
+    assert not errors
+    assert route.check({"X-Token": "s3cret", "X-Any": "1"}, {"k": "v"}) is None
+    assert "X-Any" in route.check({"X-Token": "s3cret"}, {"k": "v"})
+    assert "X-Token" in route.check({"X-Token": "bad", "X-Any": "1"}, {"k": "v"})
+    assert "k" in route.check({"X-Token": "s3cret", "X-Any": "1"}, {})
+    assert compile(headers=["X-Token"])[1] == ["headers 必须是对象"]
+
+
+def test_path_parameters_select_targets():
+    route, errors = compile("/hook/{team}", target_ids=["a", "wx_{team}"])
+    assert not errors
+    assert route.params == ("team",)
+    assert [t["id"] for t in route.resolve_targets({"team": "ops"})] == ["a", "wx_ops"]
+    assert [t["id"] for t in route.resolve_targets({"team": "nobody"})] == ["a"]
+
+
+def test_invalid_path_parameters_are_reported():
+    assert split_path("/x/{id}") == [("x", None), ("{id}", "id")]
+    _, errors = compile("/x/{a}/{a}/pre{b}")
+    assert errors == ["路径参数重复: a", "路径参数必须占据整个路径段: pre{b}"]
+    _, errors = compile("/x/{team}", target_ids=["wx_{other}"])
+    assert errors == ["目标ID wx_{other} 只能引用路径参数 ['team']"]
+
+
+def test_templates_modes_and_dedup_are_bound():
+    route, errors = compile(templates={"t": {"description": "{x}"}}, template="t", delivery_mode="async",
+                            dedup={"window": 5})
+    assert not errors
+    assert route.template == ("template", "t")
+    assert route.delivery_mode == "async"
+    assert route.dedup.window == 5
+    _, errors = compile(template="missing", delivery_mode="later", preprocess=[1])
+    assert errors == ["preprocess 必须是对象", "未知的模板: missing", "不支持的投递模式: later"]
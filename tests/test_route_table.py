@@ -0,0 +1,73 @@
+import pytest
+
+from route_compiler import compile_route
+from route_table import RouteTable
+
+
+def table(*paths):
+    routes = {}
+    for path in paths:
+        route, errors = compile_route(path, {}, {"targets": []}, lambda name, template: None)
+        assert not errors
+        routes[path] = route
+    return RouteTable(routes)
+
+
+def matched(routes, path):
+    result = routes.match(path)
+    return None if result is None else (result[0].path, result[1])
+
+
+def test_exact_paths_ignore_trailing_slash():
+    routes = table("/webhook", "/")
+    assert matched(routes, "/webhook/") == ("/webhook", {})
+    assert matched(routes, "/") == ("/", {})
+    assert matched(routes, "/other") is None
+
+
+def test_same_shape_parameter_routes_conflict():
+    routes = table("/webhook/{group}", "/webhook/{name}", "/webhook/{group}/x")
+    assert len(routes) == 2
+    assert list(routes.conflicts) == ["/webhook/{name}"]
+    assert "/webhook/{group}" in routes.conflicts["/webhook/{name}"]
+    # 先注册的路由生效
+    assert matched(routes, "/webhook/a") == ("/webhook/{group}", {"group": "a"})
+
+
+def test_parameters_are_extracted():
+    routes = table("/hook/{team}", "/hook/{team}/events/{kind}")
+    assert len(routes) == 2
+    assert matched(routes, "/hook/ops") == ("/hook/{team}", {"team": "ops"})
+    assert matched(routes, "/hook/ops/events/fill") == ("/hook/{team}/events/{kind}", {"team": "ops", "kind": "fill"})
+    assert matched(routes, "/hook/ops/events") is None
+    assert matched(routes, "/hook//events/x") is None
+
+
+def test_static_segments_win_and_backtrack():
+    routes = table("/hook/admin", "/hook/{team}", "/a/static/x", "/a/{p}/y")
+    assert matched(routes, "/hook/admin") == ("/hook/admin", {})
+    assert matched(routes, "/hook/dev") == ("/hook/{team}", {"team": "dev"})
+    # 固定段 static 匹配后找不到 y，回溯到参数段
+    assert matched(routes, "/a/static/y") == ("/a/{p}/y", {"p": "static"})
+
+
+def test_parameter_names_follow_each_route():
+    routes = table("/x/{a}/one", "/x/{b}/two")
+    assert matched(routes, "/x/1/one") == ("/x/{a}/one", {"a": "1"})
+    assert matched(routes, "/x/2/two") == ("/x/{b}/two", {"b": "2"})
+
+
+@pytest.mark.anyio
+async def test_dispatch_uses_the_route_table(make_forwarder, running, sink):
+    forwarder = make_forwarder({
+        "targets": [{"id": "wx_ops", "name": "ops", "url": sink.url("/ops")}],
+        "routes": {"/hook/{team}": {"target_ids": ["wx_{team}"], "methods": ["POST"]}}
+    })
+    async with running(forwarder) as app:
+        assert (await app.client.post("/hook/ops", json={"n": 1})).status_code == 200
+        # 路径参数解析不到目标
+        assert (await app.client.post("/hook/nobody", json={"n": 2})).status_code == 404
+        assert (await app.client.put("/hook/ops", json={"n": 3})).status_code == 405
+        assert (await app.client.post("/nothing/here", json={"n": 4})).status_code == 404
+    assert sink.bodies("/ops")[0]["n"] == 1
+    assert len(sink.requests) == 1
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import web
+
+from stream_ingest import DEFAULT_STREAM_SETTINGS, StreamSession
+from webhook_client import WebhookStreamClient
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeWebSocket:
+    """按顺序交付预先放入的帧，记录服务器发出的消息"""
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.receives = 0
+
+    def feed(self, *frames):
+        for frame in frames:
+            key = "bytes" if isinstance(frame, bytes) else "text"
+            self.incoming.put_nowait({"type": "websocket.receive", key: frame})
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+
+    async def receive(self):
+        self.receives += 1
+        return await self.incoming.get()
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    def acks(self):
+        return [m for m in self.sent if m["type"] == "ack"]
+
+
+def make_session(ws, handle, ordered=False, **settings):
+    return StreamSession(
+        ws, handle, {**DEFAULT_STREAM_SETTINGS, **settings}, ordered,
+        loads=json.loads, dumps=lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    )
+
+
+async def echo(payload):
+    return {"status": "success", "results": [payload]}
+
+
+async def test_ready_then_one_ack_per_frame_in_order():
+    ws = FakeWebSocket()
+    ws.feed('{"n":0}', b'{"n":1}', '{"n":2}')
+    ws.disconnect()
+    session = make_session(ws, echo, ordered=True, max_in_flight=8)
+    await session.run("/hook")
+
+    assert ws.sent[0] == {"type": "ready", "route": "/hook", "window": 8}
+    assert [(a["seq"], a["results"]) for a in ws.acks()] == [(0, [{"n": 0}]), (1, [{"n": 1}]), (2, [{"n": 2}])]
+    assert session.received == 3 and session.failed == 0
+
+
+async def test_in_flight_window_stops_reading():
+    ws = FakeWebSocket()
+    release = asyncio.Event()
+    active = 0
+    peak = 0
+
+    async def slow(payload):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await release.wait()
+        active -= 1
+        return {"status": "success"}
+
+    ws.feed(*['{"n":%d}' % i for i in range(5)])
+    ws.disconnect()
+    session = make_session(ws, slow, max_in_flight=2)
+    task = asyncio.create_task(session.run("/hook"))
+    await asyncio.sleep(0.05)
+    # 窗口已满时不再读取后续帧
+    assert active == 2 and ws.receives == 2
+
+    release.set()
+    await asyncio.wait_for(task, 1)
+    assert peak == 2
+    assert sorted(a["seq"] for a in ws.acks()) == [0, 1, 2, 3, 4]
+
+
+async def test_text_frame_limit_counts_utf8_bytes():
+    ws = FakeWebSocket()
+    # 6 个字符，UTF-8 编码后 14 字节
+    ws.feed('"中文中文"', '"abcd"')
+    ws.disconnect()
+    session = make_session(ws, echo, ordered=True, max_message_bytes=10)
+    await session.run("/hook")
+
+    oversize, fits = ws.acks()
+    assert oversize["status"] == "error" and "10 字节" in oversize["error"]
+    assert fits["status"] == "success"
+    assert session.failed == 1
+
+
+async def test_bad_json_is_acked_as_error_and_stream_continues():
+    ws = FakeWebSocket()
+    ws.feed("not json", '{"n":1}')
+    ws.disconnect()
+    session = make_session(ws, echo)
+    await session.run("/hook")
+
+    acks = sorted(ws.acks(), key=lambda a: a["seq"])
+    assert acks[0]["status"] == "error" and acks[0]["error"].startswith("JSON格式错误")
+    assert acks[1]["status"] == "success"
+
+
+async def test_disconnect_waits_for_messages_already_received():
+    ws = FakeWebSocket()
+    handled = []
+
+    async def slow(payload):
+        await asyncio.sleep(0.05)
+        handled.append(payload["n"])
+        return {"status": "success"}
+
+    ws.feed('{"n":0}', '{"n":1}')
+    ws.disconnect()
+    await make_session(ws, slow).run("/hook")
+    assert sorted(handled) == [0, 1]
+
+
+class AckServer:
+    """WebSocket 接收端：发送 ready 后按配置逐条确认或不确认"""
+
+    def __init__(self, window=100, ack=True, status="success"):
+        self.window = window
+        self.ack = ack
+        self.status = status
+        self.received = []
+        self.port = 0
+        self._runner = None
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"type": "ready", "route": request.path, "window": self.window})
+        seq = 0
+        async for msg in ws:
+            self.received.append(json.loads(msg.data))
+            if self.ack:
+                await ws.send_json({"type": "ack", "seq": seq, "status": self.status, "error": "失败"})
+            seq += 1
+        return ws
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/hook", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/hook"
+
+
+async def test_client_send_waits_for_ack():
+    async with AckServer() as server:
+        client = WebhookStreamClient(server.url())
+        try:
+            assert await client.send({"n": 1}) is True
+            assert await client.send({"n": 2}) is True
+        finally:
+            await client.close()
+    assert server.received == [{"n": 1}, {"n": 2}]
+
+
+async def test_client_send_reports_error_ack():
+    async with AckServer(status="error") as server:
+        client = WebhookStreamClient(server.url())
+        try:
+            assert await client.send({"n": 1}) is False
+        finally:
+            await client.close()
+
+
+async def test_client_send_timeout_covers_waiting_for_window():
+    async with AckServer(window=1, ack=False) as server:
+        client = WebhookStreamClient(server.url(), ack_timeout=0.2)
+        try:
+            # 占满在途窗口，之后的发送在等待窗口时就应超时
+            unacked = await client.publish({"n": 0})
+            started = time.monotonic()
+            assert await asyncio.wait_for(client.send({"n": 1}), 2) is False
+            assert time.monotonic() - started < 1
+        finally:
+            await client.close()
+    # 连接关闭时未确认的消息以失败结束
+    with pytest.raises(ConnectionError):
+        await unacked
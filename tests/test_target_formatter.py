@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import target_formatter
+from target_formatter import TargetFormatter, detect_platform, register_platform, format_data
+
+MESSAGE = {"event_type": "trade", "description": "成交", "symbol": "BTC", "price": 1,
+           "data": {"price": 2, "side": "buy", "nested": {"x": 1}}}
+
+
+def decode(formatter, message=MESSAGE, cache=None):
+    return json.loads(formatter.encode(message, cache))
+
+
+@pytest.mark.parametrize("target, body", [
+    ({"url": "https://open.feishu.cn/hook"}, {"msg_type": "text", "content": {"text": "成交"}}),
+    ({"url": "https://qyapi.weixin.qq.com/wechat"}, {"msgtype": "text", "text": {"content": "成交"}}),
+    ({"type": "dingtalk", "url": "http://x"}, {"msgtype": "text", "text": {"content": "成交"}}),
+    ({"type": "wechat_personal", "url": "http://x", "wxid": "w1"},
+     {"type": "sendText", "data": {"wxid": "w1", "msg": "成交"}}),
+])
+def test_platform_envelopes(target, body):
+    formatter = TargetFormatter(target)
+    assert formatter.format(MESSAGE) == body
+    assert decode(formatter) == body
+
+
+def test_unknown_target_receives_the_raw_message():
+    formatter = TargetFormatter({"url": "http://example.com/hook"})
+    assert formatter.platform is None
+    assert formatter.format(MESSAGE) is MESSAGE
+    assert decode(formatter) == MESSAGE
+
+
+def test_text_formats_by_event_type():
+    formatter = TargetFormatter({"type": "feishu", "format_type": "text", "format": {
+        "trade": "{symbol} {side} @ {price}", "default": "{description}"}})
+    # data 中的简单字段优先于顶级字段
+    assert formatter.render_text(MESSAGE) == "BTC buy @ 2"
+    assert formatter.render_text({"event_type": "other", "description": "d"}) == "d"
+    assert formatter.render_text({"event_type": "trade", "description": "缺字段"}) == "缺字段"
+
+
+def test_dollar_template_format():
+    formatter = TargetFormatter({"url": "http://x", "format_type": "template",
+                                 "format": {"title": "$symbol/$side", "n": 1, "list": ["$price"]}})
+    assert decode(formatter) == {"title": "BTC/buy", "n": 1, "list": ["2"]}
+    assert "nested" not in format_data(MESSAGE)
+
+
+def test_registered_platform_is_detected_by_url(monkeypatch):
+    monkeypatch.setattr(target_formatter, "PLATFORMS", dict(target_formatter.PLATFORMS))
+    register_platform("slack", lambda target: (lambda text: {"text": text, "channel": target["channel"]}),
+                      url_keywords=("hooks.slack.com",))
+    target = {"url": "https://hooks.slack.com/services/x", "channel": "#ops"}
+    assert detect_platform(target).name == "slack"
+    assert decode(TargetFormatter(target)) == {"text": "成交", "channel": "#ops"}
+
+
+def test_headers_are_merged():
+    formatter = TargetFormatter({"url": "http://x", "headers": {"X-Key": "k"}})
+    assert formatter.headers == {"Content-Type": "application/json", "X-Key": "k"}
+
+
+def test_targets_with_the_same_format_share_one_render(monkeypatch):
+    fmt = {"format_type": "text", "format": {"trade": "{symbol} {side}"}}
+    feishu = TargetFormatter({"type": "feishu", **fmt})
+    dingtalk = TargetFormatter({"type": "dingtalk", **fmt})
+    other = TargetFormatter({"type": "dingtalk", "format_type": "text", "format": {"trade": "{symbol}"}})
+    assert feishu.text_key == dingtalk.text_key != other.text_key
+
+    renders = []
+    original = TargetFormatter.render_text
+    monkeypatch.setattr(TargetFormatter, "render_text", lambda self, message: renders.append(self) or original(self, message))
+    cache = target_formatter.new_render_cache()
+    bodies = [decode(formatter, cache=cache) for formatter in (feishu, dingtalk, other)]
+    assert len(renders) == 2
+    assert bodies == [
+        {"msg_type": "text", "content": {"text": "BTC buy"}},
+        {"msgtype": "text", "text": {"content": "BTC buy"}},
+        {"msgtype": "text", "text": {"content": "BTC"}},
+    ]
+
+
+def test_spliced_envelope_matches_full_encoding():
+    formatter = TargetFormatter({"type": "feishu"})
+    for text in ("plain", "引号\"和\\反斜杠", "换行\n"):
+        assert formatter.encode_text(text) == target_formatter.encode_json(formatter.wrap(text))
+
+
+def test_passthrough_reuses_the_encoded_message():
+    encoded = b'{"already":"encoded"}'
+    formatter = TargetFormatter({"url": "http://example.com"})
+    assert formatter.encode({"other": 1}, target_formatter.new_render_cache(encoded)) is encoded
+
+
+@pytest.mark.anyio
+async def test_fanout_delivers_shared_renders_to_each_target(make_forwarder, running, sink):
+    fmt = {"format_type": "text", "format": {"trade": "{symbol} {side}"}}
+    forwarder = make_forwarder({
+        "targets": [
+            {"id": "f", "name": "f", "type": "feishu", "url": sink.url("/f"), **fmt},
+            {"id": "d", "name": "d", "type": "dingtalk", "url": sink.url("/d"), **fmt},
+            {"id": "raw", "name": "raw", "url": sink.url("/raw")},
+        ],
+        "routes": {"/in": {"target_ids": ["f", "d", "raw"]}}
+    })
+    async with running(forwarder) as app:
+        assert (await app.client.post("/in", json={"event_type": "trade", "symbol": "BTC", "side": "buy"})).status_code == 200
+    assert sink.bodies("/f") == [{"msg_type": "text", "content": {"text": "BTC buy"}}]
+    assert sink.bodies("/d") == [{"msgtype": "text", "text": {"content": "BTC buy"}}]
+    assert sink.bodies("/raw")[0]["symbol"] == "BTC"
@@ -0,0 +1,52 @@
+import pytest
+
+from template_engine import CompiledTemplate, compile_format
+
+DATA = {"symbol": "BTC", "price": 1234.5, "data": {"side": "buy", "legs": [1, 2]}, "n": 7}
+
+
+@pytest.mark.parametrize("text", [
+    "{symbol}",
+    "{price:.2f}",
+    "{symbol!r} @ {price:>10}",
+    "{data[side]} {data[legs][1]}",
+    "价格 {price:,.1f}，{{literal}} {n:03d}",
+    "plain text",
+])
+def test_compiled_format_matches_str_format(text):
+    assert compile_format(text)(DATA) == text.format(**DATA)
+
+
+def test_fields_are_collected_and_uncompilable_strings_rejected():
+    fields = []
+    compile_format("{symbol} {data[side]}", fields)
+    assert fields == ["symbol", "data[side]"]
+    for text in ("{0}", "{}", "{price:{width}}", "{unclosed", "{x!z}"):
+        assert compile_format(text) is None
+
+
+def test_template_renders_nested_structures():
+    template = CompiledTemplate({
+        "msgtype": "text",
+        "text": {"content": "{symbol} {data[side]} {price}"},
+        "tags": ["{symbol}", 3, None],
+    })
+    assert template(DATA) == {
+        "msgtype": "text",
+        "text": {"content": "BTC buy 1234.5"},
+        "tags": ["BTC", 3, None],
+    }
+    assert template.fields == ("symbol", "data[side]", "price")
+
+
+def test_missing_fields_keep_the_original_string():
+    template = CompiledTemplate({"a": "{symbol} {missing}", "b": "{symbol:>{width}}", "c": "{symbol}"})
+    assert template({"symbol": "ETH"}) == {"a": "{symbol} {missing}", "b": "{symbol:>{width}}", "c": "ETH"}
+    assert template({"symbol": "ETH", "width": 5})["b"] == "  ETH"
+    assert template("not a dict") == {"a": "{symbol} {missing}", "b": "{symbol:>{width}}", "c": "{symbol}"}
+
+
+def test_single_placeholder_keeps_formatting():
+    assert CompiledTemplate({"v": "{price}"})({"price": 2})["v"] == "2"
+    with pytest.raises(TypeError):
+        CompiledTemplate(["not", "a", "dict"])
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""
+时间解析工具
+解析查询参数和消息字段中的时间，接受 Unix 时间戳（秒或毫秒）或 ISO 8601 时间
+"""
+
+from datetime import datetime
+from typing import Optional
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """解析查询参数或消息字段中的时间
+
+    Args:
+        value: Unix 时间戳（秒或毫秒）或 ISO 8601 时间
+
+    Returns:
+        Unix 时间戳（秒），为空时返回 None
+
+    Raises:
+        ValueError: 无法解析时
+    """
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+        return number / 1000 if number > 1e11 else number
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
@@ -6,6 +6,7 @@ Webhook客户端模块
 
 import json
 import time
+import asyncio
 import aiohttp
 from loguru import logger
 from typing import Dict, Any, Optional, List, Union, Tuple
@@ -40,21 +41,173 @@ class TradeSide(Enum):
     BUY = "buy"
     SELL = "sell"
 
+class WebhookStreamClient:
+    """WebSocket流式客户端，与webhook路由保持一个连接持续发送消息，服务器逐条确认
+    
+    未确认的消息数不超过在途窗口（客户端设置与服务器告知的窗口取较小值），窗口已满时发送方等待确认
+    """
+    
+    def __init__(self,
+                webhook_url: Optional[str] = None,
+                additional_headers: Optional[Dict[str, str]] = None,
+                window: int = 100,
+                ack_timeout: float = 10):
+        """初始化流式客户端
+        
+        Args:
+            webhook_url: webhook URL（http/https/ws/wss），如果不提供则使用配置中的URL
+            additional_headers: 握手时附带的额外请求头
+            window: 在途窗口，即最多允许多少条消息等待确认
+            ack_timeout: 等待确认的超时时间（秒）
+        """
+        self.webhook_url = webhook_url or WEBHOOK_URL
+        self.headers = dict(additional_headers or WEBHOOK_ADDITIONAL_HEADERS or {})
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._seq = 0
+        self._connect_lock = asyncio.Lock()
+        self._send_lock = asyncio.Lock()
+    
+    async def connect(self):
+        """建立连接，已连接时直接返回"""
+        async with self._connect_lock:
+            if self._ws is not None and not self._ws.closed:
+                return
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            ws = await self._session.ws_connect(self.webhook_url, headers=self.headers, heartbeat=30)
+            ready = await ws.receive_json(timeout=self.ack_timeout)
+            window = min(self.window, int(ready.get("window", self.window)))
+            
+            # 序号和未确认的消息按连接计算
+            self._ws = ws
+            self._pending = {}
+            self._in_flight = asyncio.Semaphore(window)
+            self._seq = 0
+            self._reader = asyncio.create_task(self._read_acks(ws, self._pending))
+            logger.info(f"✅ Webhook WebSocket连接已建立: {self.webhook_url}，在途窗口 {window}")
+    
+    async def _read_acks(self, ws: aiohttp.ClientWebSocketResponse, pending: Dict[int, asyncio.Future]):
+        """读取服务器的确认，连接断开时未确认的消息以失败结束"""
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                ack = json.loads(msg.data)
+                if ack.get("type") != "ack":
+                    continue
+                future = pending.pop(ack.get("seq"), None)
+                if future is not None and not future.done():
+                    future.set_result(ack)
+        finally:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("WebSocket连接已断开，消息未被确认"))
+            pending.clear()
+            if ws.close_code not in (None, 1000):
+                logger.warning(f"⚠️ Webhook WebSocket连接已断开: {ws.close_code}")
+    
+    async def publish(self, data: Dict[str, Any]) -> asyncio.Future:
+        """发送一条消息，不等待确认；在途窗口已满时等待
+        
+        Args:
+            data: 要发送的数据
+            
+        Returns:
+            得到服务器确认后完成的 Future，结果为确认内容
+        """
+        await self.connect()
+        ws, pending, in_flight = self._ws, self._pending, self._in_flight
+        await in_flight.acquire()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: in_flight.release())
+        try:
+            async with self._send_lock:
+                if ws.closed:
+                    raise ConnectionError("WebSocket连接已断开")
+                seq = self._seq
+                self._seq += 1
+                pending[seq] = future
+                await ws.send_str(json.dumps(data, ensure_ascii=False))
+        except BaseException:
+            if not future.done():
+                future.cancel()
+            raise
+        return future
+    
+    async def send(self, data: Dict[str, Any]) -> bool:
+        """发送数据并等待服务器确认
+        
+        Args:
+            data: 要发送的数据
+            
+        Returns:
+            服务器是否确认处理成功
+        """
+        if not self.webhook_url:
+            logger.warning("⚠️ Webhook URL未配置，跳过通知")
+            return False
+        
+        async def round_trip():
+            return await (await self.publish(data))
+        
+        try:
+            # 建立连接、等待在途窗口和等待确认都计入超时
+            ack = await asyncio.wait_for(round_trip(), self.ack_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ 等待webhook确认超时 ({self.ack_timeout}秒)")
+            return False
+        except (aiohttp.ClientError, ConnectionError) as e:
+            logger.error(f"❌ 通过WebSocket发送webhook通知时出现网络错误: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ 通过WebSocket发送webhook通知时出现未知错误: {e}")
+            return False
+        
+        if ack.get("status") == "error":
+            logger.error(f"❌ webhook消息处理失败: {ack.get('error')}")
+            return False
+        return True
+    
+    async def close(self):
+        """关闭连接"""
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 class WebhookClient:
     """Webhook客户端类，用于发送消息到webhook服务器"""
     
-    def __init__(self, webhook_url: Optional[str] = None, additional_headers: Optional[Dict[str, str]] = None):
+    def __init__(self,
+                webhook_url: Optional[str] = None,
+                additional_headers: Optional[Dict[str, str]] = None,
+                stream: bool = False,
+                stream_window: int = 100):
         """初始化webhook客户端
         
         Args:
             webhook_url: webhook URL，如果不提供则使用配置中的URL
             additional_headers: 额外的请求头
+            stream: 是否通过一个长连接的WebSocket发送，适用于持续发送的高频消息
+            stream_window: WebSocket发送时的在途窗口
         """
         self.webhook_url = webhook_url or WEBHOOK_URL
         self.base_headers = {
             "Content-Type": "application/json",
             **(additional_headers or WEBHOOK_ADDITIONAL_HEADERS or {})
         }
+        self.stream = WebhookStreamClient(self.webhook_url, additional_headers, stream_window) if stream else None
     
     async def send(self, data: Dict[str, Any]) -> bool:
         """发送数据到webhook
@@ -68,6 +221,9 @@ class WebhookClient:
         if not self.webhook_url:
             logger.warning("⚠️ Webhook URL未配置，跳过通知")
             return False
+        
+        if self.stream is not None:
+            return await self.stream.send(data)
             
         try:
             async with aiohttp.ClientSession() as session:
@@ -443,6 +599,12 @@ class WebhookClient:
         return await self.send(notification)
 
 
+    async def close(self):
+        """关闭WebSocket连接（如果使用）"""
+        if self.stream is not None:
+            await self.stream.close()
+
+
 # 创建默认客户端实例，方便直接调用
 default_client = WebhookClient()
 
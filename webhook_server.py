@@ -11,17 +11,59 @@ import time
 import re
 import asyncio
 import argparse
-import aiohttp
-from fastapi import FastAPI, Request, HTTPException, Depends
+import functools
+from fastapi import FastAPI, Request, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
 from loguru import logger
-from datetime import datetime
 import uvicorn
-from typing import Dict, List, Optional, Any, Union, Callable
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, Union, Callable, Sequence, Mapping, Tuple, Awaitable, AsyncIterator
+
+from connection_pool import ConnectionPoolManager
+from fanout import FanoutEngine, settled_callback
+from delivery_queue import DeliveryQueueManager
+from delivery_journal import DeliveryJournal, STATE_PENDING, STATE_DELIVERED, STATE_FAILED, STATE_DEAD
+from retry_engine import RetryScheduler, SendResult, parse_retry_after
+from dead_letter import DeadLetterStore
+from circuit_breaker import CircuitBreakerRegistry
+from rate_limiter import RateLimiter
+from coalescer import MessageCoalescer
+from fingerprint import DedupPolicy
+from dedup_store import create_dedup_store, DedupStoreError
+from message_history import MessageHistory
+from history_store import HistoryStore
+from time_utils import parse_time
+from route_compiler import CompiledRoute, RouteConfigError, SUPPORTED_METHODS
+from target_formatter import TargetFormatter, RenderCache, new_render_cache
+from config_manager import ConfigSnapshot, ConfigWatcher, build_snapshot
+import json_codec
+from log_pipeline import PayloadPreview, configure_logging
+from fast_ingest import FastIngestApp
+from batch_ingest import (
+    DEFAULT_BATCH_SETTINGS, BatchFormatError, BatchItem, is_ndjson, peek_stream, iter_ndjson, iter_json_array
+)
+from stream_ingest import DEFAULT_STREAM_SETTINGS, StreamSession
 
 # 确保日志目录存在
 os.makedirs("logs", exist_ok=True)
 
+# 只在启动时读取的配置项（"节.键"），热加载后修改这些配置需要重启才能生效
+RESTART_ONLY_SETTINGS = (
+    "json_codec", "journal", "history", "history_store", "dedup.store", "dedup.cache",
+    "ingest.fast_lane", "config_reload", "logging.file", "logging.level", "logging.format",
+    "logging.rotation", "logging.compression", "logging.retention", "logging.queue_size"
+)
+
+
+def _config_value(config: dict, path: str) -> Any:
+    """按 "节.键" 读取配置项，不存在时返回 None"""
+    value: Any = config
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
 class WebhookForwarder:
     """Webhook转发服务器，接收交易信号并转发到多个目标"""
     
@@ -35,7 +77,8 @@ class WebhookForwarder:
         self.app = FastAPI(
             title="Bcoin Webhook转发服务器",
             description="接收交易信号并转发到多个目标",
-            version="1.0.0"
+            version="1.0.0",
+            lifespan=self._lifespan
         )
         
         # 添加CORS中间件
@@ -47,19 +90,164 @@ class WebhookForwarder:
             allow_headers=["*"],
         )
         
-        # 加载配置
+        # 加载配置并编译为快照（目标格式化器、模板、路由），之后的修改总是替换整个快照
         self.config_path = config_path
-        self.config = self._load_config()
+        self.snapshot: ConfigSnapshot = build_snapshot(self._load_config(), version=0)
+        self._log_route_errors(self.snapshot)
+        # 启动时的配置，热加载时据此判断哪些只在启动时读取的配置已修改
+        self._startup_config = self.snapshot.config
+        self.restart_required: List[str] = []
+        
+        # JSON编解码器：优先使用已安装的 orjson / msgspec
+        self.codec = json_codec.set_codec(self.config.get("json_codec", "auto"))
+        
+        # 日志中记录的消息内容按配置采样并截断
+        self.payload_preview = PayloadPreview(self.config.get("logging"))
+        
+        # 出站连接池，在应用启动时创建、关闭时释放
+        self.connection_pool = ConnectionPoolManager(self.config.get("connection_pool"))
+        
+        # 并发扇出引擎
+        self.fanout = FanoutEngine(self.config.get("fanout"))
+        
+        # 异步投递队列，用于 delivery_mode 为 async 的路由
+        self.delivery_queue = DeliveryQueueManager(self.config.get("delivery_queue"))
+        
+        # 持久化投递日志，重启后重放未投递的消息
+        self.journal = DeliveryJournal(self.config.get("journal"))
+        
+        # 失败重试调度器和死信存储
+        self.retry = RetryScheduler(self.config.get("retry"))
+        self.dead_letters = DeadLetterStore(self.config.get("dead_letter_max_size", 1000), self._discard_dead_letter)
+        
+        # 目标熔断器
+        self.breakers = CircuitBreakerRegistry(self.config.get("circuit_breaker"))
+        
+        # 目标及限流组令牌桶
+        self.rate_limiter = RateLimiter(self.config.get("rate_groups"))
+        
+        # 文本类目标的消息合并器
+        self.coalescer = MessageCoalescer(self._send_coalesced)
+        
+        # 消息去重：默认策略及去重存储（内存或多进程/多节点共享），路由的策略在编译路由时生成
+        self.default_dedup = DedupPolicy.from_config(self.config.get("dedup"), None)
+        dedup_config = self.config.get("dedup") or {}
+        self.dedup_store = create_dedup_store(dedup_config.get("store"), dedup_config.get("cache"))
         
         # 消息历史记录
-        self.message_history = []
-        self.max_history_size = 100
+        self.history = MessageHistory(self.config.get("history"))
+        
+        # 持久化消息历史，记录全部消息及投递结果，供按时间范围查询
+        self.history_store = HistoryStore(self.config.get("history_store"))
+        
+        # 配置文件监视器，文件修改后自动重新加载
+        self.config_watcher = ConfigWatcher(config_path, self._reload_config, self.config.get("config_reload"))
         
         # 注册路由
         self._register_routes()
         
+        # webhook 快速通道：命中路由表的请求直接处理，不经过中间件和 FastAPI 路由
+        self.asgi_app = self.app
+        if (self.config.get("ingest") or {}).get("fast_lane", True):
+            self.asgi_app = FastIngestApp(self.app, self._match_fast_lane, self._ingest_stream, self.codec.dumps)
+        
         logger.info(f"Webhook转发服务器初始化完成，配置路径: {config_path}")
     
+    @property
+    def config(self) -> dict:
+        """当前配置快照中的配置，只读"""
+        return self.snapshot.config
+    
+    @property
+    def routes(self) -> Dict[str, CompiledRoute]:
+        """当前配置快照中编译后的路由，路径 -> 路由对象"""
+        return self.snapshot.routes
+    
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """应用生命周期：启动时创建连接池，关闭时释放"""
+        await self.connection_pool.start(self.config.get("targets", []))
+        await self.config_watcher.start()
+        await self.dedup_store.open()
+        if self.history_store.enabled:
+            await self.history_store.open()
+        await self.retry.start(self._send_to_target, self._on_retry_success, self._on_delivery_exhausted)
+        await self.delivery_queue.start(functools.partial(self._attempt_delivery, wait=False))
+        if self.journal.enabled:
+            await self.journal.open()
+            # 在接收新消息前读取日志，新消息的待投递记录不会被当作未投递记录重复投递
+            pending = await self._restore_journal()
+            replay_task = asyncio.create_task(self._replay_journal(pending))
+        try:
+            yield
+        finally:
+            if self.journal.enabled:
+                replay_task.cancel()
+                await asyncio.gather(replay_task, return_exceptions=True)
+            await self.delivery_queue.close()
+            await self.coalescer.close()
+            await self.retry.close()
+            if self.journal.enabled:
+                await self.journal.close()
+            await self.dedup_store.close()
+            if self.history_store.enabled:
+                await self.history_store.close()
+            await self.config_watcher.close()
+            await self.connection_pool.close()
+    
+    async def _restore_journal(self) -> List[Tuple[int, dict, str]]:
+        """从持久化投递日志恢复死信，读取尚未投递的 (消息, 目标) 组合
+        
+        Returns:
+            (日志ID, 消息, 目标ID) 列表
+        """
+        targets = {t.get("id"): t for t in self.config.get("targets", [])}
+        for journal_id, message, target_id in await self.journal.load_state(STATE_DEAD):
+            target = targets.get(target_id) or {"id": target_id, "name": target_id}
+            self.dead_letters.add(message, target, journal_id, attempts=None, error="从投递日志恢复")
+        return await self.journal.load_pending()
+    
+    async def _replay_journal(self, pending: List[Tuple[int, dict, str]]):
+        """重放启动时读取的未投递记录
+        
+        Args:
+            pending: (日志ID, 消息, 目标ID) 列表
+        """
+        if not pending:
+            return
+        targets = {t.get("id"): t for t in self.config.get("targets", [])}
+        
+        logger.info(f"从投递日志重放 {len(pending)} 条未投递记录")
+        for journal_id, message, target_id in pending:
+            target = targets.get(target_id)
+            if not target:
+                logger.warning(f"投递日志中的目标 {target_id} 已不存在，放弃投递消息 ID:{message.get('_id')}")
+                self.journal.mark(journal_id, target_id, STATE_FAILED)
+                continue
+            await self.delivery_queue.put(message, target, ticket=journal_id)
+    
+    def _mark_delivery(self, message: dict, journal_id: Optional[int], target: dict, state: str):
+        """更新 (消息, 目标) 在消息历史和投递日志中的状态"""
+        self.history.update(message.get("_id"), target.get("id"), state)
+        if self.history_store.enabled:
+            self.history_store.update(message.get("_id"), target.get("id"), state)
+        if self.journal.enabled and journal_id is not None:
+            self.journal.mark(journal_id, target.get("id"), state)
+    
+    def _on_retry_success(self, message: dict, target: dict, journal_id: Optional[int]):
+        """重试成功后标记为已投递"""
+        self._mark_delivery(message, journal_id, target, STATE_DELIVERED)
+    
+    def _on_delivery_exhausted(self, message: dict, target: dict, journal_id: Optional[int],
+                               attempts: int, result: SendResult):
+        """重试耗尽或不可重试时转入死信"""
+        self.dead_letters.add(message, target, journal_id, attempts, status=result.status, error=result.error)
+        self._mark_delivery(message, journal_id, target, STATE_DEAD)
+    
+    def _discard_dead_letter(self, letter: dict):
+        """死信被淘汰或丢弃后不再保留，标记为失败，投递日志压缩时可以清理"""
+        self._mark_delivery(letter["message"], letter["ticket"], {"id": letter["target_id"]}, STATE_FAILED)
+    
     def _load_config(self) -> dict:
         """加载配置文件"""
         default_config = {
@@ -137,6 +325,7 @@ class WebhookForwarder:
         try:
             with open(self.config_path, "w", encoding="utf-8") as f:
                 json.dump(self.config, f, indent=4, ensure_ascii=False)
+            self.config_watcher.mark()
             logger.info(f"配置已保存到: {self.config_path}")
             return True
         except Exception as e:
@@ -146,14 +335,13 @@ class WebhookForwarder:
     def _register_routes(self):
         """注册API路由"""
         
-        # 动态注册webhook路由
-        for route_path, route_config in self.config.get("routes", {}).items():
-            self._register_route(route_path, route_config)
-        
         @self.app.get("/targets")
         async def get_targets():
-            """获取所有转发目标"""
-            return {"targets": self.config.get("targets", [])}
+            """获取所有转发目标及其熔断器状态"""
+            return {"targets": [
+                {**target, "circuit_breaker": self.breakers.snapshot(target)}
+                for target in self.config.get("targets", [])
+            ]}
         
         @self.app.post("/targets")
         async def add_target(target: dict):
@@ -170,8 +358,7 @@ class WebhookForwarder:
                 target["enabled"] = True
             
             # 添加到配置
-            self.config["targets"].append(target)
-            self._save_config()
+            self._install_config({**self.config, "targets": [*self.config.get("targets", []), target]})
             
             return {
                 "status": "success",
@@ -183,13 +370,12 @@ class WebhookForwarder:
         async def delete_target(target_id: str):
             """删除转发目标"""
             targets = self.config.get("targets", [])
-            initial_count = len(targets)
             
             # 过滤掉要删除的目标
-            self.config["targets"] = [t for t in targets if t.get("id") != target_id]
+            remaining = [t for t in targets if t.get("id") != target_id]
             
-            if len(self.config["targets"]) < initial_count:
-                self._save_config()
+            if len(remaining) < len(targets):
+                self._install_config({**self.config, "targets": remaining})
                 return {"status": "success", "message": f"已删除转发目标 ID: {target_id}"}
             else:
                 raise HTTPException(status_code=404, detail=f"未找到ID为 {target_id} 的转发目标")
@@ -197,15 +383,16 @@ class WebhookForwarder:
         @self.app.put("/targets/{target_id}")
         async def update_target(target_id: str, target_update: dict):
             """更新转发目标"""
-            for i, target in enumerate(self.config.get("targets", [])):
+            targets = self.config.get("targets", [])
+            for i, target in enumerate(targets):
                 if target.get("id") == target_id:
-                    # 更新目标配置
-                    self.config["targets"][i].update(target_update)
-                    self._save_config()
+                    # 更新目标配置，替换为新的目标对象
+                    updated = {**target, **target_update}
+                    self._install_config({**self.config, "targets": [*targets[:i], updated, *targets[i + 1:]]})
                     return {
                         "status": "success",
                         "message": f"已更新转发目标: {target.get('name')}",
-                        "target": self.config["targets"][i]
+                        "target": updated
                     }
             
             raise HTTPException(status_code=404, detail=f"未找到ID为 {target_id} 的转发目标")
@@ -235,12 +422,14 @@ class WebhookForwarder:
                 "query_params": route.get("query_params", {})
             }
             
-            # 添加到配置
-            self.config["routes"][path] = route_config
-            self._save_config()
-            
-            # 重新注册路由
-            self._register_route(path, route_config)
+            # 添加到配置，先编译校验，配置无效时不保存
+            try:
+                self._install_config(
+                    {**self.config, "routes": {**self.config.get("routes", {}), path: route_config}},
+                    strict_route=path
+                )
+            except RouteConfigError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             
             return {
                 "status": "success",
@@ -258,9 +447,9 @@ class WebhookForwarder:
             if not path.startswith('/'):
                 path = f"/{path}"
             
-            if path in self.config.get("routes", {}):
-                del self.config["routes"][path]
-                self._save_config()
+            routes = self.config.get("routes", {})
+            if path in routes:
+                self._install_config({**self.config, "routes": {k: v for k, v in routes.items() if k != path}})
                 return {"status": "success", "message": f"已删除路由: {path}"}
             else:
                 raise HTTPException(status_code=404, detail=f"未找到路由: {path}")
@@ -272,29 +461,123 @@ class WebhookForwarder:
             if not path.startswith('/'):
                 path = f"/{path}"
             
-            if path in self.config.get("routes", {}):
-                # 更新路由配置
-                self.config["routes"][path].update(route_update)
-                self._save_config()
-                
-                # 重新注册路由
-                self._register_route(path, self.config["routes"][path])
+            routes = self.config.get("routes", {})
+            if path in routes:
+                # 更新路由配置，先编译校验，配置无效时不修改
+                route_config = {**routes[path], **route_update}
+                try:
+                    self._install_config({**self.config, "routes": {**routes, path: route_config}}, strict_route=path)
+                except RouteConfigError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
                 
                 return {
                     "status": "success",
                     "message": f"已更新路由: {path}",
                     "route": {
                         "path": path,
-                        **self.config["routes"][path]
+                        **route_config
                     }
                 }
             else:
                 raise HTTPException(status_code=404, detail=f"未找到路由: {path}")
         
+        @self.app.get("/config/status")
+        async def get_config_status():
+            """获取当前配置快照的版本、编译统计和热加载状态"""
+            snapshot = self.snapshot
+            return {
+                "version": snapshot.version,
+                "compiled": snapshot.compiled,
+                "route_errors": snapshot.route_errors,
+                "restart_required": self.restart_required,
+                "reload": self.config_watcher.stats()
+            }
+        
+        @self.app.get("/pool")
+        async def get_pool_stats():
+            """获取出站连接池统计信息"""
+            return self.connection_pool.stats()
+        
+        @self.app.get("/rate-limits")
+        async def get_rate_limits():
+            """获取目标及限流组的令牌桶状态"""
+            return self.rate_limiter.stats()
+        
+        @self.app.get("/queues")
+        async def get_queue_stats():
+            """获取异步投递队列深度及最早消息等待时间"""
+            result = {"queues": self.delivery_queue.stats(), "coalesce": self.coalescer.stats()}
+            if self.journal.enabled:
+                result["journal"] = await self.journal.stats()
+            return result
+        
+        @self.app.get("/dedup")
+        async def get_dedup_stats():
+            """获取去重存储统计"""
+            return self.dedup_store.stats()
+        
+        @self.app.get("/dead-letters")
+        async def get_dead_letters(limit: int = 100, target_id: Optional[str] = None):
+            """获取死信列表"""
+            return {
+                "total": len(self.dead_letters),
+                "retry": self.retry.stats(),
+                "dead_letters": self.dead_letters.list(limit, target_id)
+            }
+        
+        @self.app.post("/dead-letters/redrive")
+        async def redrive_dead_letters(target_id: Optional[str] = None):
+            """重新投递所有（或指定目标的）死信"""
+            letters = self.dead_letters.list(len(self.dead_letters), target_id)
+            for letter in letters:
+                self._redrive(letter["id"])
+            return {"status": "success", "message": f"已重新投递 {len(letters)} 条死信"}
+        
+        @self.app.post("/dead-letters/{letter_id}/redrive")
+        async def redrive_dead_letter(letter_id: int):
+            """重新投递单条死信"""
+            if not self._redrive(letter_id):
+                raise HTTPException(status_code=404, detail=f"未找到死信 ID: {letter_id}")
+            return {"status": "success", "message": f"已重新投递死信 ID: {letter_id}"}
+        
+        @self.app.delete("/dead-letters/{letter_id}")
+        async def delete_dead_letter(letter_id: int):
+            """丢弃单条死信"""
+            letter = self.dead_letters.pop(letter_id)
+            if not letter:
+                raise HTTPException(status_code=404, detail=f"未找到死信 ID: {letter_id}")
+            self._discard_dead_letter(letter)
+            return {"status": "success", "message": f"已删除死信 ID: {letter_id}"}
+        
         @self.app.get("/history")
-        async def get_history(limit: int = 10):
-            """获取消息历史"""
-            return {"history": self.message_history[:limit]}
+        async def get_history(limit: int = 10, cursor: Optional[int] = None,
+                              since: Optional[str] = None, until: Optional[str] = None,
+                              route: Optional[str] = None, event_type: Optional[str] = None,
+                              symbol: Optional[str] = None, target_id: Optional[str] = None,
+                              outcome: Optional[str] = None):
+            """获取消息历史，按游标分页，消息在写入时已序列化，直接返回
+            
+            启用持久化消息历史时查询全部已保存的消息，否则查询内存中最近的消息
+            """
+            try:
+                since_ts, until_ts = parse_time(since), parse_time(until)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="since/until 应为 Unix 时间戳或 ISO 8601 时间")
+            
+            args = (limit, cursor, since_ts, until_ts, route, event_type, symbol, target_id, outcome)
+            if self.history_store.enabled:
+                content = await self.history_store.query(*args)
+            else:
+                content = self.history.query(*args)
+            return Response(content=content, media_type="application/json")
+        
+        @self.app.get("/history/stats")
+        async def get_history_stats():
+            """获取消息历史统计"""
+            stats = {"memory": self.history.stats()}
+            if self.history_store.enabled:
+                stats["store"] = await self.history_store.stats()
+            return stats
         
         @self.app.post("/test")
         async def send_test_message(target_id: Optional[str] = None, route_path: Optional[str] = None):
@@ -333,11 +616,13 @@ class WebhookForwarder:
                 if not route_path.startswith('/'):
                     route_path = f"/{route_path}"
                 
-                if route_path not in self.config.get("routes", {}):
+                matched = self.snapshot.route_table.match(route_path)
+                if matched is None:
                     raise HTTPException(status_code=404, detail=f"未找到路由: {route_path}")
                 
-                route_config = self.config["routes"][route_path]
-                results = await self.process_message(test_message, target_ids=route_config.get("target_ids", []))
+                route, params = matched
+                targets = route.resolve_targets(params) if route.resolve_targets is not None else None
+                results = await self.process_message(test_message, route=route, targets=targets)
                 
                 return {
                     "status": "success",
@@ -352,260 +637,462 @@ class WebhookForwarder:
                     "message": "测试消息已发送到所有启用的目标",
                     "results": results
                 }
+        
+        # 所有其他路径都由同一个处理函数接收，按路由表分发到webhook路由；必须最后注册
+        self.app.add_api_route(
+            "/{path:path}", self._handle_webhook, methods=list(SUPPORTED_METHODS), include_in_schema=False
+        )
+        self.app.add_api_websocket_route("/{path:path}", self._handle_stream)
+        logger.info(f"已加载 {len(self.snapshot.route_table)} 个webhook路由")
     
-    def _register_route(self, route_path: str, route_config: dict):
-        """注册单个路由
+    def _redrive(self, letter_id: int) -> bool:
+        """把死信交给重试调度器立即重新投递
         
         Args:
-            route_path: 路由路径
-            route_config: 路由配置
+            letter_id: 死信ID
+            
+        Returns:
+            是否找到该死信
         """
-        # 确保路径格式正确
-        if not route_path.startswith('/'):
-            route_path = f"/{route_path}"
-        
-        # 获取支持的HTTP方法
-        methods = route_config.get("methods", ["POST"])
-        if not methods or not isinstance(methods, list):
-            methods = ["POST"]
-        
-        # 创建请求处理依赖
-        def request_filter(request: Request):
-            """验证请求是否符合路由条件"""
-            # 校验请求头
-            if "headers" in route_config and route_config["headers"]:
-                for header_name, header_value in route_config["headers"].items():
-                    if header_name not in request.headers:
-                        raise HTTPException(status_code=400, detail=f"缺少必要的请求头: {header_name}")
-                    
-                    # 如果配置了值，则需要精确匹配
-                    if header_value and request.headers.get(header_name) != header_value:
-                        raise HTTPException(status_code=400, detail=f"请求头 {header_name} 的值不匹配")
+        letter = self.dead_letters.pop(letter_id)
+        if not letter:
+            return False
+        
+        # 使用最新的目标配置，目标已被删除时沿用死信中的信息
+        target = next(
+            (t for t in self.config.get("targets", []) if t.get("id") == letter["target_id"]),
+            None
+        )
+        if target is None:
+            logger.warning(f"死信 ID:{letter_id} 的目标 {letter['target_id']} 已不存在")
+            self.dead_letters.add(letter["message"], {"id": letter["target_id"], "name": letter["target_name"]},
+                                  letter["ticket"], letter["attempts"], error="目标不存在")
+            return True
+        
+        self._mark_delivery(letter["message"], letter["ticket"], target, STATE_PENDING)
+        self.retry.schedule(letter["message"], target, letter["ticket"], attempt=0, delay=0)
+        return True
+    
+    def _log_route_errors(self, snapshot: ConfigSnapshot, previous: Optional[ConfigSnapshot] = None):
+        """记录快照中新编译的路由的配置错误"""
+        for route_path, errors in snapshot.route_errors.items():
+            if previous is not None and snapshot.routes[route_path] is previous.routes.get(route_path):
+                continue
+            for error in errors:
+                logger.error(f"路由 {route_path} 配置错误: {error}")
+    
+    def _install_config(self, config: dict, strict_route: Optional[str] = None, save: bool = True) -> ConfigSnapshot:
+        """编译新配置并替换当前快照
+        
+        只重新编译变化的目标、模板和路由；替换快照是一次赋值，处理中的消息继续使用已取得的路由和目标。
+        
+        Args:
+            config: 新配置，之后不再修改
+            strict_route: 该路由配置无效时抛出异常且不替换快照，其他路由的错误只记录并忽略无效的引用
+            save: 是否保存到配置文件
             
-            # 校验查询参数
-            if "query_params" in route_config and route_config["query_params"]:
-                for param_name, param_value in route_config["query_params"].items():
-                    if param_name not in request.query_params:
-                        raise HTTPException(status_code=400, detail=f"缺少必要的查询参数: {param_name}")
-                    
-                    # 如果配置了值，则需要精确匹配
-                    if param_value and request.query_params.get(param_name) != param_value:
-                        raise HTTPException(status_code=400, detail=f"查询参数 {param_name} 的值不匹配")
+        Returns:
+            新的配置快照
             
-            # 通过验证
-            return True
+        Raises:
+            ConfigError: 配置的整体结构无效时
+            RouteConfigError: strict_route 的配置无效时
+        """
+        previous = self.snapshot
+        snapshot = build_snapshot(config, previous.version + 1, previous)
+        if strict_route is not None and strict_route in snapshot.route_errors:
+            raise RouteConfigError(strict_route, snapshot.route_errors[strict_route])
+        self._log_route_errors(snapshot, previous)
+        
+        self.snapshot = snapshot
+        self._apply_runtime_config(config)
+        compiled = snapshot.compiled
+        logger.info(
+            f"配置已更新到版本 {snapshot.version}，重新编译 {compiled['targets']} 个目标、"
+            f"{compiled['templates']} 个模板、{compiled['routes']} 个路由"
+        )
+        
+        if save:
+            self._save_config()
+        return snapshot
+    
+    def _apply_runtime_config(self, config: dict):
+        """把新配置中可在运行时调整的部分应用到各组件，并记录需要重启才能生效的修改
+        
+        Args:
+            config: 新配置
+        """
+        self.default_dedup = DedupPolicy.from_config(config.get("dedup"), None)
+        self.connection_pool.update_config(config.get("connection_pool"), config.get("targets", []))
+        self.fanout.update_config(config.get("fanout"))
+        self.delivery_queue.update_config(config.get("delivery_queue"))
+        self.retry.update_config(config.get("retry"))
+        self.dead_letters.resize(config.get("dead_letter_max_size", 1000))
+        self.breakers.update_config(config.get("circuit_breaker"))
+        self.rate_limiter.update_groups(config.get("rate_groups"))
+        self.payload_preview = PayloadPreview(config.get("logging"))
+        
+        restart_required = [
+            path for path in RESTART_ONLY_SETTINGS
+            if _config_value(config, path) != _config_value(self._startup_config, path)
+        ]
+        for path in restart_required:
+            if path not in self.restart_required:
+                logger.warning(f"配置项 {path} 已修改，需要重启服务才能生效")
+        self.restart_required = restart_required
+    
+    def _reload_config(self, config: dict):
+        """配置文件被修改后重新加载，配置无效时抛出异常并保留当前快照"""
+        logger.info(f"检测到配置文件变化，重新加载: {self.config_path}")
+        self._install_config(config, save=False)
+    
+    async def _handle_webhook(self, request: Request):
+        """接收快速通道之外的webhook请求（表单请求等），在当前配置快照的路由表中查找路由后处理"""
+        path = request.scope["path"]
+        matched = self.snapshot.route_table.match(path)
+        if matched is None:
+            raise HTTPException(status_code=404, detail=f"未找到路由: {path}")
+        route, params = matched
+        if request.method not in route.methods:
+            raise HTTPException(status_code=405, detail=f"路由 {route.path} 不支持 {request.method} 方法")
+        
+        content_type = request.headers.get("content-type", "").lower()
+        if "application/x-www-form-urlencoded" in content_type or "multipart/form-data" in content_type:
+            status, content = await self._process_webhook(
+                route, params, path, request.method, request.headers, request.query_params,
+                functools.partial(self._read_form, request)
+            )
+        else:
+            status, content = await self._ingest_stream(
+                route, params, path, request.method, request.headers, request.query_params,
+                request.stream(), content_type
+            )
+        return JSONResponse(status_code=status, content=content)
+    
+    async def _handle_stream(self, websocket: WebSocket):
+        """webhook路由的 WebSocket 接收：握手时校验请求头和查询参数，之后持续接收消息并逐条确认"""
+        settings = dict(DEFAULT_STREAM_SETTINGS)
+        settings.update((self.config.get("ingest") or {}).get("websocket") or {})
+        path = websocket.scope["path"]
+        matched = self.snapshot.route_table.match(path) if settings["enabled"] else None
+        if matched is None:
+            await websocket.close(code=1008, reason=f"未找到路由: {path}")
+            return
+        route, params = matched
+        try:
+            targets = self._check_request(route, params, path, websocket.headers, websocket.query_params)
+        except HTTPException as e:
+            logger.warning(f"拒绝 WebSocket 连接 {path}: {e.detail}")
+            await websocket.close(code=1008, reason=str(e.detail))
+            return
         
-        # 创建处理函数
-        async def webhook_handler(request: Request, _: bool = Depends(request_filter)):
+        snapshot = self.snapshot
+        
+        async def handle(payload: Any) -> dict:
+            nonlocal snapshot, route, params, targets
+            # 连接期间配置被替换时重新查找路由和目标，握手时的校验不再重复
+            if self.snapshot is not snapshot:
+                snapshot = self.snapshot
+                matched = snapshot.route_table.match(path)
+                if matched is None:
+                    return {"status": "error", "error": f"路由 {route.path} 已删除"}
+                route, params = matched
+                targets = route.resolve_targets(params) if route.resolve_targets is not None else None
+                if route.resolve_targets is not None and not targets:
+                    return {"status": "error", "error": f"路径 {path} 没有对应的转发目标"}
+            return await self._ingest_item(route, targets, params, path, "WEBSOCKET", websocket.headers, payload)
+        
+        await websocket.accept()
+        session = StreamSession(
+            websocket, handle, settings, ordered=route.delivery_mode == "async",
+            loads=self.codec.loads, dumps=self.codec.dumps
+        )
+        logger.info(f"WebSocket 接收连接已建立: {path}")
+        await session.run(route.path)
+        logger.info(f"WebSocket 接收连接已关闭 ({path}): 接收 {session.received} 条，失败 {session.failed} 条")
+    
+    async def _read_form(self, request: Request) -> dict:
+        """读取表单请求体"""
+        form_data = await request.form()
+        return dict(form_data)
+    
+    def _parse_body(self, body: bytes, content_type: str) -> Any:
+        """按 Content-Type 解析请求体"""
+        if "application/json" in content_type:
+            return self.codec.loads(body)
+        if "text/plain" in content_type:
+            return {"text": body.decode('utf-8')}
+        # 尝试作为JSON解析
+        try:
+            return self.codec.loads(body)
+        except:
+            # 作为文本处理
+            return {"text": body.decode('utf-8', errors='ignore')}
+    
+    def _match_fast_lane(self, path: str, method: str) -> Optional[Tuple[CompiledRoute, Dict[str, str]]]:
+        """快速通道的路由匹配，未匹配或方法不受支持时返回 None，交给 FastAPI 处理"""
+        matched = self.snapshot.route_table.match(path)
+        if matched is None or method not in matched[0].methods:
+            return None
+        return matched
+    
+    async def _ingest_stream(self, route: CompiledRoute, params: Dict[str, str], path: str, method: str,
+                             headers: Mapping[str, str], query_params: Mapping[str, str],
+                             stream: AsyncIterator[bytes], content_type: str) -> Tuple[int, dict]:
+        """接收请求体：NDJSON 和顶层 JSON 数组按批量消息处理，其余按单条消息处理"""
+        settings = dict(DEFAULT_BATCH_SETTINGS)
+        settings.update((self.config.get("ingest") or {}).get("batch") or {})
+        
+        if is_ndjson(content_type):
+            items = iter_ndjson(stream, self.codec.loads, int(settings["max_item_bytes"]))
+            return await self._process_batch(route, params, path, method, headers, query_params, items, settings)
+        
+        first, stream = await peek_stream(stream)
+        if first == b"[" and "text/plain" not in content_type:
+            items = iter_json_array(stream, int(settings["max_item_bytes"]))
+            return await self._process_batch(route, params, path, method, headers, query_params, items, settings)
+        
+        async def load_payload() -> Any:
+            return self._parse_body(b"".join([chunk async for chunk in stream]), content_type)
+        
+        return await self._process_webhook(route, params, path, method, headers, query_params, load_payload)
+    
+    def _check_request(self, route: CompiledRoute, params: Dict[str, str], path: str,
+                       headers: Mapping[str, str], query_params: Mapping[str, str]) -> Optional[Sequence[dict]]:
+        """校验请求头和查询参数，并按路径参数解析目标
+        
+        Returns:
+            按路径参数解析的目标，路由的目标不依赖路径参数时返回 None
+            
+        Raises:
+            HTTPException: 路径参数没有对应的目标或请求不符合路由条件时
+        """
+        # 目标ID引用路径参数时按参数值解析目标
+        targets = None
+        if route.resolve_targets is not None:
+            targets = route.resolve_targets(params)
+            if not targets:
+                raise HTTPException(status_code=404, detail=f"路径 {path} 没有对应的转发目标")
+        
+        # 校验请求头和查询参数
+        error = route.check(headers, query_params)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        return targets
+    
+    def _prepare_message(self, route: CompiledRoute, params: Dict[str, str], path: str, method: str,
+                         headers: Mapping[str, str], payload: Any) -> Any:
+        """对接收到的消息执行预处理和模板，并添加消息ID和路由信息"""
+        # 消息预处理
+        if route.preprocess:
             try:
-                # 获取请求体
-                content_type = request.headers.get("content-type", "").lower()
-                
-                if "application/json" in content_type:
-                    payload = await request.json()
-                elif "application/x-www-form-urlencoded" in content_type:
-                    form_data = await request.form()
-                    payload = dict(form_data)
-                elif "multipart/form-data" in content_type:
-                    form_data = await request.form()
-                    payload = dict(form_data)
-                elif "text/plain" in content_type:
-                    text = await request.body()
-                    payload = {"text": text.decode('utf-8')}
-                else:
-                    # 尝试作为JSON解析
-                    try:
-                        payload = await request.json()
-                    except:
-                        # 作为文本处理
-                        text = await request.body()
-                        payload = {"text": text.decode('utf-8', errors='ignore')}
-                
-                # 消息预处理
-                if route_config.get("preprocess"):
-                    try:
-                        payload = self._preprocess_message(payload, route_config["preprocess"])
-                    except Exception as e:
-                        logger.error(f"消息预处理失败: {e}")
-                
-                # 应用消息模板
-                if route_config.get("template"):
-                    try:
-                        payload = self._apply_template(payload, route_config["template"])
-                    except Exception as e:
-                        logger.error(f"应用消息模板失败: {e}")
-                
-                # 增强消息内容
-                if isinstance(payload, dict):
-                    # 添加路由信息
-                    payload.setdefault("_route", {
-                        "path": route_path,
-                        "method": request.method,
-                        "timestamp": int(time.time() * 1000)
-                    })
-                
-                # 记录接收路径
-                logger.info(f"从路径 {route_path} 接收到消息")
-                
-                # 处理消息，使用路由特定的目标
-                result = await self.process_message(
-                    payload, 
-                    target_ids=route_config.get("target_ids", [])
-                )
-                
-                return {
-                    "status": "success",
-                    "message": f"消息已接收并通过路由 {route_path} 处理",
-                    "results": result
-                }
+                payload = route.preprocess(payload)
             except Exception as e:
-                logger.error(f"处理webhook消息失败 ({route_path}): {e}")
-                raise HTTPException(status_code=500, detail=str(e))
-        
-        # 为每个HTTP方法注册路由
-        for method in methods:
-            method = method.upper()
-            if method == "GET":
-                self.app.get(route_path, dependencies=[Depends(request_filter)])(webhook_handler)
-            elif method == "POST":
-                self.app.post(route_path, dependencies=[Depends(request_filter)])(webhook_handler)
-            elif method == "PUT":
-                self.app.put(route_path, dependencies=[Depends(request_filter)])(webhook_handler)
-            elif method == "DELETE":
-                self.app.delete(route_path, dependencies=[Depends(request_filter)])(webhook_handler)
-            elif method == "PATCH":
-                self.app.patch(route_path, dependencies=[Depends(request_filter)])(webhook_handler)
-            else:
-                logger.warning(f"不支持的HTTP方法: {method}")
-                continue
+                logger.error(f"消息预处理失败: {e}")
+        
+        # 应用消息模板
+        if route.template:
+            try:
+                payload = route.template(payload)
+            except Exception as e:
+                logger.error(f"应用消息模板失败: {e}")
+        
+        # 增强消息内容
+        if isinstance(payload, dict):
+            # 按路由的去重策略计算消息ID
+            payload["_id"] = route.dedup.message_id(payload, headers)
             
-            logger.info(f"已注册webhook路由: {method} {route_path}")
+            # 添加路由信息
+            route_info = {
+                "path": route.path if not params else path,
+                "method": method,
+                "timestamp": int(time.time() * 1000)
+            }
+            if params:
+                route_info["params"] = params
+            payload.setdefault("_route", route_info)
+        
+        return payload
+    
+    async def _deliver(self, payload: Any, route: CompiledRoute, targets: Optional[Sequence[dict]]) -> List[dict]:
+        """按路由的投递模式投递消息
+        
+        Raises:
+            HTTPException: 异步投递时所有目标的投递队列都已满
+        """
+        # 异步投递模式：入队后立即返回
+        if route.delivery_mode == "async":
+            result = await self.enqueue_message(payload, route=route, targets=targets)
+            if result and not any(r["queued"] for r in result):
+                raise HTTPException(status_code=503, detail="所有目标的投递队列已满")
+            return result
+        
+        # 处理消息，使用路由特定的目标
+        return await self.process_message(payload, route=route, targets=targets)
     
-    def _preprocess_message(self, message: dict, preprocess_config: dict) -> dict:
-        """根据预处理配置处理消息
+    async def _process_webhook(self, route: CompiledRoute, params: Dict[str, str], path: str, method: str,
+                               headers: Mapping[str, str], query_params: Mapping[str, str],
+                               load_payload: Callable[[], Awaitable[Any]]) -> Tuple[int, dict]:
+        """校验、预处理并投递单条webhook消息
         
         Args:
-            message: 原始消息
-            preprocess_config: 预处理配置
+            route: 匹配到的路由
+            params: 路径参数
+            path: 请求路径
+            method: HTTP方法
+            headers: 请求头
+            query_params: 查询参数
+            load_payload: 读取并解析请求体
             
         Returns:
-            处理后的消息
+            (状态码, 响应内容)
+            
+        Raises:
+            HTTPException: 请求无效或处理失败时
         """
-        if not preprocess_config:
-            return message
-        
-        result = message
+        route_path = route.path
+        targets = self._check_request(route, params, path, headers, query_params)
         
-        # 字段映射
-        if "field_mapping" in preprocess_config:
-            mappings = preprocess_config["field_mapping"]
+        try:
+            # 获取请求体
+            payload = self._prepare_message(route, params, path, method, headers, await load_payload())
             
-            # 创建新的字典存储映射后的值
-            mapped_message = {}
+            # 记录接收路径
+            logger.info(f"从路径 {route_path} 接收到消息")
             
-            # 处理字段映射
-            for target_field, source_path in mappings.items():
-                value = self._get_nested_value(message, source_path)
-                if value is not None:
-                    # 支持嵌套字段路径
-                    parts = target_field.split('.')
-                    current = mapped_message
-                    for i, part in enumerate(parts):
-                        if i == len(parts) - 1:
-                            current[part] = value
-                        else:
-                            if part not in current:
-                                current[part] = {}
-                            current = current[part]
+            result = await self._deliver(payload, route, targets)
+            if route.delivery_mode == "async":
+                return 202, {
+                    "status": "accepted",
+                    "message": f"消息已接收并通过路由 {route_path} 排队投递",
+                    "message_id": payload.get("_id") if isinstance(payload, dict) else None,
+                    "results": result
+                }
             
-            # 合并映射后的字段
-            if preprocess_config.get("merge_mapped", True):
-                result = {**result, **mapped_message}
-            else:
-                result = mapped_message
+            return 200, {
+                "status": "success",
+                "message": f"消息已接收并通过路由 {route_path} 处理",
+                "results": result
+            }
+        except (HTTPException, ClientDisconnect):
+            # 请求体读完前客户端断开时不处理不完整的消息
+            raise
+        except DedupStoreError as e:
+            logger.error(f"去重存储不可用，拒收消息 ({route_path}): {e}")
+            raise HTTPException(status_code=503, detail="去重存储不可用")
+        except Exception as e:
+            logger.error(f"处理webhook消息失败 ({route_path}): {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    async def _ingest_item(self, route: CompiledRoute, targets: Optional[Sequence[dict]], params: Dict[str, str],
+                           path: str, method: str, headers: Mapping[str, str], payload: Any) -> dict:
+        """处理批量或流式接收中的一条消息，失败时返回错误而不抛出异常
         
-        # 字段过滤
-        if "include_fields" in preprocess_config:
-            include_fields = preprocess_config["include_fields"]
-            filtered = {}
+        Returns:
+            处理结果：status 为 success（已处理）、accepted（已入队）或 error
+        """
+        try:
+            payload = self._prepare_message(route, params, path, method, headers, payload)
+            result = await self._deliver(payload, route, targets)
+            return {
+                "status": "accepted" if route.delivery_mode == "async" else "success",
+                "message_id": payload.get("_id") if isinstance(payload, dict) else None,
+                "results": result
+            }
+        except HTTPException as e:
+            return {"status": "error", "error": e.detail}
+        except DedupStoreError as e:
+            logger.error(f"去重存储不可用，拒收消息 ({route.path}): {e}")
+            return {"status": "error", "error": "去重存储不可用"}
+        except Exception as e:
+            logger.error(f"处理webhook消息失败 ({route.path}): {e}")
+            return {"status": "error", "error": str(e)}
+    
+    async def _process_batch(self, route: CompiledRoute, params: Dict[str, str], path: str, method: str,
+                             headers: Mapping[str, str], query_params: Mapping[str, str],
+                             items: AsyncIterator[BatchItem], settings: dict) -> Tuple[int, dict]:
+        """边解析边处理批量消息，每条消息单独预处理、去重和投递，单条失败不影响其他消息
+        
+        异步投递模式按顺序入队；同步投递时最多并发处理 concurrency 条，
+        配置了消息合并的目标会把同一时间窗口内的消息合并发送。
+        
+        Args:
+            route: 匹配到的路由
+            params: 路径参数
+            path: 请求路径
+            method: HTTP方法
+            headers: 请求头
+            query_params: 查询参数
+            items: 解析出的 (消息, 错误)
+            settings: 批量接收参数
             
-            for field in include_fields:
-                value = self._get_nested_value(result, field)
-                if value is not None:
-                    # 设置嵌套字段
-                    parts = field.split('.')
-                    current = filtered
-                    for i, part in enumerate(parts):
-                        if i == len(parts) - 1:
-                            current[part] = value
-                        else:
-                            if part not in current:
-                                current[part] = {}
-                            current = current[part]
+        Returns:
+            (状态码, 响应内容)，响应中的 results 按消息顺序给出每条消息的处理结果
             
-            result = filtered
-        
-        # 字段变换
-        if "transformations" in preprocess_config:
-            transformations = preprocess_config["transformations"]
+        Raises:
+            HTTPException: 请求无效，或请求体格式错误且没有解析出任何消息时
+        """
+        route_path = route.path
+        targets = self._check_request(route, params, path, headers, query_params)
+        asynchronous = route.delivery_mode == "async"
+        window = asyncio.Semaphore(1 if asynchronous else max(1, int(settings["concurrency"])))
+        max_items = int(settings["max_items"])
+        results: List[Optional[dict]] = []
+        tasks = set()
+        
+        async def handle(index: int, payload: Any):
+            released = False
             
-            for field, transform_type in transformations.items():
-                value = self._get_nested_value(result, field)
-                
-                if value is not None:
-                    if transform_type == "to_string":
-                        transformed = str(value)
-                    elif transform_type == "to_int":
-                        try:
-                            transformed = int(value)
-                        except (ValueError, TypeError):
-                            transformed = 0
-                    elif transform_type == "to_float":
-                        try:
-                            transformed = float(value)
-                        except (ValueError, TypeError):
-                            transformed = 0.0
-                    elif transform_type == "to_bool":
-                        if isinstance(value, str):
-                            transformed = value.lower() in ("true", "yes", "1", "y")
-                        else:
-                            transformed = bool(value)
-                    elif transform_type.startswith("format:"):
-                        # 格式化字符串
-                        format_str = transform_type[7:]
-                        try:
-                            transformed = format_str.format(value=value)
-                        except:
-                            transformed = value
-                    else:
-                        transformed = value
-                    
-                    # 设置转换后的值
-                    parts = field.split('.')
-                    current = result
-                    for i, part in enumerate(parts):
-                        if i == len(parts) - 1:
-                            current[part] = transformed
-                        else:
-                            if part not in current:
-                                current[part] = {}
-                            current = current[part]
-        
-        # 添加固定字段
-        if "add_fields" in preprocess_config:
-            for field, value in preprocess_config["add_fields"].items():
-                # 支持嵌套字段路径
-                parts = field.split('.')
-                current = result
-                for i, part in enumerate(parts):
-                    if i == len(parts) - 1:
-                        current[part] = value
-                    else:
-                        if part not in current:
-                            current[part] = {}
-                        current = current[part]
+            def release():
+                nonlocal released
+                if not released:
+                    released = True
+                    window.release()
+            
+            # 消息只剩等待合并批次时提前释放名额，合并窗口内能收集到整批消息
+            settled_callback.set(release)
+            try:
+                result = await self._ingest_item(route, targets, params, path, method, headers, payload)
+                results[index] = {"index": index, **result}
+            finally:
+                release()
         
-        return result
+        error = None
+        try:
+            async for payload, item_error in items:
+                if len(results) >= max_items:
+                    error = f"批量消息超过 {max_items} 条，其余消息未处理"
+                    break
+                index = len(results)
+                results.append(None)
+                if item_error is not None:
+                    results[index] = {"index": index, "status": "error", "error": item_error}
+                    continue
+                await window.acquire()
+                task = asyncio.create_task(handle(index, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except BatchFormatError as e:
+            error = str(e)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks)
+        
+        if error and not results:
+            raise HTTPException(status_code=400, detail=error)
+        
+        failed = sum(1 for result in results if result["status"] == "error")
+        logger.info(f"从路径 {route_path} 接收到批量消息 {len(results)} 条，失败 {failed} 条")
+        content = {
+            "status": "accepted" if asynchronous else "success",
+            "message": f"批量消息已通过路由 {route_path} {'排队投递' if asynchronous else '处理'}",
+            "count": len(results),
+            "failed": failed,
+            "results": results
+        }
+        if error:
+            content["error"] = error
+        return (202 if asynchronous else 200), content
     
     def _apply_template(self, message: dict, template_name: str) -> dict:
         """应用消息模板
@@ -617,123 +1104,155 @@ class WebhookForwarder:
         Returns:
             应用模板后的消息
         """
-        if not template_name or template_name not in self.config.get("templates", {}):
+        template = self.snapshot.templates.get(template_name) if template_name else None
+        if template is None:
             return message
         
-        template = self.config["templates"][template_name]
-        
-        # 创建模板消息
-        result = {}
-        
-        # 替换变量
-        def replace_variables(template_value, data):
-            if isinstance(template_value, dict):
-                return {k: replace_variables(v, data) for k, v in template_value.items()}
-            elif isinstance(template_value, list):
-                return [replace_variables(item, data) for item in template_value]
-            elif isinstance(template_value, str) and "{" in template_value:
-                try:
-                    return template_value.format(**data)
-                except KeyError:
-                    return template_value
-            else:
-                return template_value
-        
-        # 准备数据
-        format_data = {}
-        self._flatten_dict(message, format_data)
-        
-        # 应用模板
-        for key, value in template.items():
-            result[key] = replace_variables(value, format_data)
-        
-        return result
+        return template(message)
     
-    def _get_nested_value(self, data: dict, path: str, default=None):
-        """获取嵌套字典中的值
+    async def process_message(self, message: dict, target_ids: List[str] = None,
+                              route: Optional[CompiledRoute] = None,
+                              targets: Optional[Sequence[dict]] = None) -> List[dict]:
+        """处理并转发消息
         
         Args:
-            data: 字典数据
-            path: 点分隔的路径
-            default: 默认值
+            message: 接收到的消息
+            target_ids: 目标ID列表，如果为空则发送到所有符合条件的目标
+            route: 接收消息的路由，提供去重策略和预先解析的目标
+            targets: 可选，已按路径参数解析的目标
             
         Returns:
-            路径对应的值
+            转发结果列表
         """
-        keys = path.split('.')
-        current = data
+        encoded = await self._accept_message(message, route.dedup if route else None)
+        if encoded is None:
+            return []
         
-        for key in keys:
-            if isinstance(current, dict) and key in current:
-                current = current[key]
-            else:
-                return default
+        # 并发转发到所有符合条件的目标
+        targets = self._route_targets(message, route, target_ids, targets)
+        self._track_history(message, targets)
+        
+        # 先持久化再投递，投递过程中重启也能在启动时重放
+        journal_id = None
+        if self.journal.enabled:
+            journal_id = await self.journal.record(message, [t.get("id") for t in targets], encoded)
         
-        return current
+        # 同一次扇出中格式相同的目标共享渲染结果
+        send = functools.partial(self._attempt_delivery, ticket=journal_id, render_cache=new_render_cache(encoded))
+        return await self.fanout.dispatch(message, targets, send)
     
-    def _flatten_dict(self, data: dict, result: dict, prefix: str = ""):
-        """将嵌套字典扁平化
+    async def _accept_message(self, message: dict, dedup: Optional[DedupPolicy] = None) -> Optional[bytes]:
+        """为消息分配ID、去重并记录历史
         
         Args:
-            data: 源字典
-            result: 结果字典
-            prefix: 前缀
+            message: 接收到的消息
+            dedup: 去重策略，为空时使用默认策略
+            
+        Returns:
+            新消息编码后的JSON字节，供历史、日志、投递日志和透传发送共享；重复消息返回None
         """
-        if not data or not isinstance(data, dict):
-            return
+        dedup = dedup or self.default_dedup
+        
+        # 添加消息ID（稳定指纹），用于去重
+        msg_id = message.get("_id") or dedup.message_id(message)
+        message["_id"] = msg_id
+        
+        # 检查是否是去重窗口内的重复消息，不是则记录到缓存
+        if dedup.enabled and await self.dedup_store.check_and_add(msg_id, dedup.window):
+            logger.warning(f"跳过重复消息 ID:{msg_id}")
+            return None
         
-        for key, value in data.items():
-            new_key = f"{prefix}.{key}" if prefix else key
+        # 消息内容已确定，只编码一次
+        encoded = self.codec.dumps(message)
             
-            if isinstance(value, dict):
-                # 递归处理嵌套字典
-                self._flatten_dict(value, result, new_key)
-                
-                # 同时保留完整对象
-                result[new_key] = value
-            else:
-                result[new_key] = value
+        # 添加到历史记录
+        self.history.add(message, encoded)
+        if self.history_store.enabled:
+            self.history_store.add(message, encoded)
+        
+        # 记录消息
+        logger.bind(message_id=msg_id, payload=self.payload_preview(encoded)).info("接收到消息")
+        
+        return encoded
     
-    async def process_message(self, message: dict, target_ids: List[str] = None) -> List[dict]:
-        """处理并转发消息
+    async def enqueue_message(self, message: dict, target_ids: List[str] = None,
+                              route: Optional[CompiledRoute] = None,
+                              targets: Optional[Sequence[dict]] = None) -> List[dict]:
+        """接收消息并放入目标投递队列，由后台工作协程投递
         
         Args:
             message: 接收到的消息
             target_ids: 目标ID列表，如果为空则发送到所有符合条件的目标
+            route: 接收消息的路由，提供去重策略和预先解析的目标
+            targets: 可选，已按路径参数解析的目标
             
         Returns:
-            转发结果列表
+            入队结果列表；所有目标的队列都已满时 queued 均为 False，消息不会记入去重、历史和投递日志，可以重发
         """
-        # 添加消息ID，用于去重
-        msg_id = message.get("_id") or str(hash(json.dumps(message, sort_keys=True)))
-        message["_id"] = msg_id
-        
-        # 检查该消息是否已经处理过（最近5分钟内）
-        current_time = time.time()
+        targets = self._route_targets(message, route, target_ids, targets)
         
-        # 清理过期的消息ID缓存
-        self._clean_message_id_cache(current_time)
+        # 先预留队列空位：全部已满时直接拒收，不留下去重记录，调用方重发时不会被当作重复消息
+        reserved = self.delivery_queue.reserve(targets)
+        if targets and not any(reserved):
+            return [
+                {"target_id": t.get("id"), "target_name": t.get("name"), "queued": False} for t in targets
+            ]
         
-        # 检查是否是重复消息
-        if hasattr(self, "_message_id_cache") and msg_id in self._message_id_cache:
-            logger.warning(f"跳过重复消息 ID:{msg_id}")
-            return []
-        
-        # 将消息ID添加到缓存
-        if not hasattr(self, "_message_id_cache"):
-            self._message_id_cache = {}
-        self._message_id_cache[msg_id] = current_time
+        try:
+            encoded = await self._accept_message(message, route.dedup if route else None)
+            if encoded is None:
+                self.delivery_queue.release(targets, reserved)
+                return []
             
-        # 添加到历史记录
-        self._add_to_history(message)
-        
-        # 记录消息
-        logger.info(f"接收到消息: {json.dumps(message, ensure_ascii=False)}")
+            self._track_history(message, targets)
+            
+            # 先持久化再入队，入队失败的目标直接标记为失败
+            journal_id = None
+            if self.journal.enabled:
+                journal_id = await self.journal.record(message, [t.get("id") for t in targets], encoded)
+        except BaseException:
+            self.delivery_queue.release(targets, reserved)
+            raise
+        
+        results = self.delivery_queue.enqueue(
+            message, targets, ticket=journal_id, context=new_render_cache(encoded), reserved=reserved
+        )
+        for result in results:
+            if not result["queued"]:
+                self._mark_delivery(message, journal_id, {"id": result["target_id"]}, STATE_FAILED)
+        return results
+    
+    def _route_targets(self, message: dict, route: Optional[CompiledRoute],
+                       target_ids: List[str] = None, targets: Optional[Sequence[dict]] = None) -> Sequence[dict]:
+        """获取消息需要转发的目标，路由指定了目标时直接使用编译时（或按路径参数）解析的结果"""
+        if targets is not None:
+            return targets
+        if route is not None:
+            if route.targets is not None:
+                return route.targets
+            target_ids = None
+        return self._select_targets(message, target_ids)
+    
+    def _track_history(self, message: dict, targets: List[dict]):
+        """在消息历史中记录消息需要投递的目标"""
+        target_ids = [t.get("id") for t in targets]
+        self.history.track(message["_id"], target_ids, STATE_PENDING)
+        if self.history_store.enabled:
+            self.history_store.track(message["_id"], target_ids, STATE_PENDING)
+    
+    def _select_targets(self, message: dict, target_ids: List[str] = None) -> List[dict]:
+        """选出消息需要转发的目标
         
-        # 转发结果
-        results = []
+        Args:
+            message: 消息内容
+            target_ids: 目标ID列表，如果为空则选出所有符合条件的目标
+            
+        Returns:
+            目标配置列表
+        """
+        selected = []
         
-        # 创建一个已发送目标的集合，避免重复发送
+        # 创建一个已选目标的集合，避免重复发送
         sent_targets = set()
         
         # 如果指定了目标ID，则只转发到这些目标
@@ -741,56 +1260,27 @@ class WebhookForwarder:
             logger.info(f"将消息转发到指定目标: {target_ids}")
             for target in self.config.get("targets", []):
                 target_id = target.get("id")
-                # 跳过已发送的目标
+                # 跳过已选的目标
                 if target_id in sent_targets:
                     continue
                     
                 if target_id in target_ids and target.get("enabled", True):
-                    result = await self.forward_to_target(message, target)
-                    results.append({
-                        "target_id": target_id,
-                        "target_name": target.get("name"),
-                        "success": result
-                    })
+                    selected.append(target)
                     sent_targets.add(target_id)
         else:
             # 转发到所有启用的目标
             logger.info("将消息转发到所有符合条件的目标")
             for target in self.config.get("targets", []):
                 target_id = target.get("id")
-                # 跳过已发送的目标
+                # 跳过已选的目标
                 if target_id in sent_targets:
                     continue
                     
                 if target.get("enabled", True) and self._should_forward(message, target):
-                    result = await self.forward_to_target(message, target)
-                    results.append({
-                        "target_id": target_id,
-                        "target_name": target.get("name"),
-                        "success": result
-                    })
+                    selected.append(target)
                     sent_targets.add(target_id)
         
-        return results
-    
-    def _clean_message_id_cache(self, current_time: float, max_age: int = 300):
-        """清理过期的消息ID缓存
-        
-        Args:
-            current_time: 当前时间戳
-            max_age: 最大缓存时间（秒）
-        """
-        if not hasattr(self, "_message_id_cache"):
-            self._message_id_cache = {}
-            return
-            
-        expired_ids = []
-        for msg_id, timestamp in self._message_id_cache.items():
-            if current_time - timestamp > max_age:
-                expired_ids.append(msg_id)
-                
-        for msg_id in expired_ids:
-            del self._message_id_cache[msg_id]
+        return selected
     
     def _should_forward(self, message: dict, target: dict) -> bool:
         """判断消息是否应该转发到目标
@@ -820,7 +1310,7 @@ class WebhookForwarder:
         return True
     
     async def forward_to_target(self, message: dict, target: dict) -> bool:
-        """转发消息到目标
+        """转发消息到目标（单次发送，不重试）
         
         Args:
             message: 消息内容
@@ -829,231 +1319,203 @@ class WebhookForwarder:
         Returns:
             是否成功
         """
-        try:
-            # 获取目标URL
-            url = target.get("url")
-            if not url:
-                logger.warning(f"目标 {target.get('name')} 没有URL配置")
-                return False
+        return (await self._send_to_target(message, target)).success
+    
+    async def _attempt_delivery(self, message: dict, target: dict, ticket: Optional[int] = None,
+                                render_cache: Optional[RenderCache] = None,
+                                wait: bool = True) -> Union[dict, "asyncio.Future"]:
+        """投递消息到目标，失败时按重试策略交给后台重试
+        
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递日志ID
+            render_cache: 同一次扇出共享的渲染缓存
+            wait: 目标启用消息合并时是否需要所在批次的发送结果
             
-            # 转换消息格式
-            payload = self._format_message(message, target)
+        Returns:
+            投递结果，success 为首次发送是否成功，short_circuited 表示被熔断器短路，
+            retry_scheduled 表示已安排后台重试，coalesced 表示已合并发送；
+            目标启用消息合并且 wait 为真时返回所在批次发送完成后得到结果的 Future
+        """
+        # 启用合并的文本类目标先进入合并窗口
+        coalesce_settings = self.coalescer.settings_for(target)
+        if coalesce_settings:
+            text = self._formatter(target).render_text(message)
+            if text is not None:
+                future = self.coalescer.add(target, coalesce_settings, text, (message, ticket))
+                if not wait:
+                    # 后台投递不等待批次，结果由批次发送时统一处理
+                    return {"success": True, "coalesced": True}
+                # 由扇出引擎释放并发名额后再等待，否则合并窗口内最多只能收集到目标并发上限条消息
+                return future
+        
+        result = await self._send_to_target(message, target, render_cache)
+        if result.success:
+            self._mark_delivery(message, ticket, target, STATE_DELIVERED)
+            return {"success": True}
+        
+        return self._handle_send_failure(message, target, ticket, result)
+    
+    def _handle_send_failure(self, message: dict, target: dict, ticket: Optional[int], result: SendResult) -> dict:
+        """处理首次发送失败：可重试则安排后台重试，否则转入死信
+        
+        Args:
+            message: 消息内容
+            target: 目标配置
+            ticket: 投递日志ID
+            result: 发送结果
             
-            # 获取请求头
-            headers = {
-                "Content-Type": "application/json",
-                **(target.get("headers") or {})
-            }
+        Returns:
+            投递结果
+        """
+        outcome = {"success": False, "status": result.status, "error": result.error}
+        if result.short_circuited:
+            outcome["short_circuited"] = True
+        if self.retry.handle_failure(message, target, ticket, 1, result):
+            outcome["retry_scheduled"] = True
+        return outcome
+    
+    async def _send_coalesced(self, target: dict, chunks: List[tuple], items: List[tuple]) -> List[dict]:
+        """发送合并后的批次并处理每条消息的结果
+        
+        Args:
+            target: 目标配置
+            chunks: (合并后的文本, 包含的条目下标) 列表
+            items: (消息, 投递日志ID) 列表
             
-            # 发送请求
-            logger.debug(f"发送消息到 {target.get('name')}: {json.dumps(payload, ensure_ascii=False)}")
+        Returns:
+            与 items 一一对应的投递结果
+        """
+        # 按顺序发送每一段，记录每条消息遇到的第一个失败
+        failures = {}
+        formatter = self._formatter(target)
+        for text, members in chunks:
+            result = await self._send_payload(formatter.encode_text(text), target)
+            if not result.success:
+                for index in members:
+                    failures.setdefault(index, result)
+        
+        outcomes = []
+        for index, (message, ticket) in enumerate(items):
+            result = failures.get(index)
+            if result is None:
+                self._mark_delivery(message, ticket, target, STATE_DELIVERED)
+                outcomes.append({"success": True})
+            else:
+                outcomes.append(self._handle_send_failure(message, target, ticket, result))
+        return outcomes
+    
+    async def _send_to_target(self, message: dict, target: dict,
+                              render_cache: Optional[RenderCache] = None) -> SendResult:
+        """格式化并发送一次消息到目标
+        
+        Args:
+            message: 消息内容
+            target: 目标配置
+            render_cache: 同一次扇出共享的渲染缓存
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    json=payload,
-                    headers=headers,
-                    timeout=target.get("timeout", 10)
-                ) as response:
-                    if 200 <= response.status < 300:
-                        logger.info(f"消息已成功发送到 {target.get('name')}")
-                        return True
-                    else:
-                        response_text = await response.text()
-                        logger.error(f"发送到 {target.get('name')} 失败: [{response.status}] {response_text}")
-                        return False
+        Returns:
+            发送结果
+        """
+        try:
+            # 转换消息格式并编码，格式相同的目标只渲染一次
+            body = self._formatter(target).encode(message, render_cache)
         except Exception as e:
-            logger.error(f"转发消息到 {target.get('name')} 时出错: {e}")
-            return False
+            logger.error(f"格式化发送到 {target.get('name')} 的消息时出错: {e}")
+            return SendResult(False, error=str(e))
+        
+        return await self._send_payload(body, target)
     
-    def _format_message(self, message: dict, target: dict) -> dict:
-        """根据目标配置格式化消息
+    async def _send_payload(self, body: bytes, target: dict) -> SendResult:
+        """经过目标熔断器和限流发送一次消息体
         
         Args:
-            message: 原始消息
+            body: 已编码的消息体
             target: 目标配置
             
         Returns:
-            格式化后的消息
+            发送结果
         """
-        # 检查是否有自定义格式
-        if "format" in target:
-            format_type = target.get("format_type", "default")
-            
-            if format_type == "template":
-                # 使用模板格式
-                template = target["format"]
-                
-                # 替换变量
-                def replace_vars(template, data):
-                    if isinstance(template, dict):
-                        return {k: replace_vars(v, data) for k, v in template.items()}
-                    elif isinstance(template, list):
-                        return [replace_vars(item, data) for item in template]
-                    elif isinstance(template, str) and "$" in template:
-                        # 替换变量
-                        for key, value in data.items():
-                            template = template.replace(f"${key}", str(value))
-                        return template
-                    else:
-                        return template
-                
-                # 准备数据
-                data = {}
-                # 添加顶级字段
-                for key, value in message.items():
-                    if isinstance(value, (str, int, float, bool)) or value is None:
-                        data[key] = value
-                
-                # 添加嵌套数据字段
-                if "data" in message and isinstance(message["data"], dict):
-                    for key, value in message["data"].items():
-                        if isinstance(value, (str, int, float, bool)) or value is None:
-                            data[key] = value
-                
-                return replace_vars(template, data)
+        # 熔断器打开时直接短路，不再等待超时，也不消耗令牌
+        breaker = self.breakers.get(target)
+        probe = breaker.allow()
+        if probe is None:
+            logger.debug(f"目标 {target.get('name')} 熔断器已打开，跳过发送")
+            return SendResult(False, retry_after=breaker.retry_after(), error="熔断器已打开", short_circuited=True)
+        
+        try:
+            # 确实要发出的请求才获取令牌，超出速率时排队等待，平滑发送而不是失败
+            await self.rate_limiter.acquire(target)
+            started = time.monotonic()
+            result = await self._post_to_target(body, target)
+        except asyncio.CancelledError:
+            breaker.release(probe)
+            raise
+        breaker.record(result.success, time.monotonic() - started, probe)
+        return result
+    
+    async def _post_to_target(self, body: bytes, target: dict) -> SendResult:
+        """发送一次消息体到目标
+        
+        Args:
+            body: 已编码的消息体
+            target: 目标配置
             
-            elif format_type == "text":
-                # 使用文本格式
-                event_type = message.get("event_type", "unknown")
-                
-                # 获取格式化模板
-                format_template = target["format"].get(event_type)
-                if not format_template:
-                    format_template = target["format"].get("default", "{description}")
-                
-                # 准备格式化数据
-                format_data = {}
-                
-                # 添加顶级字段
-                for key, value in message.items():
-                    if isinstance(value, (str, int, float, bool)) or value is None:
-                        format_data[key] = value
-                
-                # 添加嵌套数据字段
-                if "data" in message and isinstance(message["data"], dict):
-                    for key, value in message["data"].items():
-                        if isinstance(value, (str, int, float, bool)) or value is None:
-                            format_data[key] = value
-                
-                # 格式化文本
-                try:
-                    text = format_template.format(**format_data)
-                    
-                    # 根据目标类型应用正确的格式包装
-                    target_type = target.get("type", "")
-                    if target_type == "feishu" or "feishu" in target.get("url", "").lower():
-                        return {
-                            "msg_type": "text",
-                            "content": {
-                                "text": text
-                            }
-                        }
-                    elif target_type == "wechat" or "wechat" in target.get("url", "").lower():
-                        return {
-                            "msgtype": "text",
-                            "text": {
-                                "content": text
-                            }
-                        }
-                    elif target_type == "dingtalk" or "dingtalk" in target.get("url", "").lower():
-                        return {
-                            "msgtype": "text",
-                            "text": {
-                                "content": text
-                            }
-                        }
-                    elif target_type == "wechat_personal":
-                        wxid = target.get("wxid", "")
-                        if not wxid:
-                            logger.warning(f"目标 {target.get('name')} 缺少wxid参数")
-                            return {}
-                        return {
-                            "type": "sendText",
-                            "data": {
-                                "wxid": wxid,
-                                "msg": text
-                            }
-                        }
-                    else:
-                        # 默认返回通用格式
-                        return {"text": text}
-                        
-                except KeyError as e:
-                    logger.warning(f"格式化文本时缺少字段 {e}")
-                    fallback_text = message.get("description", str(message))
-                    
-                    # 同样应用正确的格式包装
-                    target_type = target.get("type", "")
-                    if target_type == "feishu" or "feishu" in target.get("url", "").lower():
-                        return {
-                            "msg_type": "text",
-                            "content": {
-                                "text": fallback_text
-                            }
-                        }
-                    else:
-                        return {"text": fallback_text}
-        
-        # 微信/企业微信格式
-        if target.get("type") == "wechat" or "wechat" in target.get("url", "").lower():
-            return {
-                "msgtype": "text",
-                "text": {
-                    "content": message.get("description", str(message))
-                }
-            }
+        Returns:
+            发送结果
+        """
+        try:
+            # 获取目标URL
+            url = target.get("url")
+            if not url:
+                logger.warning(f"目标 {target.get('name')} 没有URL配置")
+                return SendResult(False, error="目标没有URL配置")
             
-        # 普通微信个人号格式
-        if target.get("type") == "wechat_personal":
-            wxid = target.get("wxid", "")
-            if not wxid:
-                logger.warning(f"目标 {target.get('name')} 缺少wxid参数")
-                return {}
+            # 发送请求
+            logger.opt(lazy=True).debug("发送消息到 {}: {}", lambda: target.get("name"), lambda: body.decode("utf-8"))
             
-            return {
-                "type": "sendText",
-                "data": {
-                    "wxid": wxid,
-                    "msg": message.get("description", str(message))
-                }
-            }
-        
-        # 飞书格式
-        if target.get("type") == "feishu" or "feishu" in target.get("url", "").lower():
-            return {
-                "msg_type": "text",
-                "content": {
-                    "text": message.get("description", str(message))
-                }
-            }
-        
-        # 钉钉格式
-        if target.get("type") == "dingtalk" or "dingtalk" in target.get("url", "").lower():
-            return {
-                "msgtype": "text",
-                "text": {
-                    "content": message.get("description", str(message))
-                }
-            }
-        
-        # 默认情况下，直接返回原始消息
-        return message
+            # 使用长期存活的连接池会话，复用TCP/TLS连接
+            session = self.connection_pool.get_session(target)
+            async with session.post(
+                url,
+                data=body,
+                headers=self._formatter(target).headers,
+                timeout=target.get("timeout", 10)
+            ) as response:
+                if 200 <= response.status < 300:
+                    logger.info(f"消息已成功发送到 {target.get('name')}")
+                    return SendResult(True, status=response.status)
+                else:
+                    response_text = await response.text()
+                    logger.error(f"发送到 {target.get('name')} 失败: [{response.status}] {response_text}")
+                    return SendResult(
+                        False,
+                        status=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                        error=response_text[:200]
+                    )
+        except asyncio.TimeoutError:
+            logger.error(f"转发消息到 {target.get('name')} 超时")
+            return SendResult(False, error="请求超时")
+        except Exception as e:
+            logger.error(f"转发消息到 {target.get('name')} 时出错: {e}")
+            return SendResult(False, error=str(e))
     
-    def _add_to_history(self, message: dict):
-        """添加消息到历史记录
+    def _formatter(self, target: dict) -> TargetFormatter:
+        """获取目标编译后的格式化器
         
         Args:
-            message: 消息内容
+            target: 目标配置
+            
+        Returns:
+            格式化器
         """
-        self.message_history.insert(0, {
-            "timestamp": datetime.now().isoformat(),
-            "message": message
-        })
-        
-        # 限制历史记录大小
-        if len(self.message_history) > self.max_history_size:
-            self.message_history = self.message_history[:self.max_history_size]
+        formatter = self.snapshot.formatters.get(target.get("id"))
+        if formatter is None or formatter.target is not target:
+            # 目标来自之前的快照（处理中的消息、重试或死信重新投递），按其自身的配置编译
+            formatter = TargetFormatter(target)
+        return formatter
 
 def create_app(config_path: str = "config/webhook_config.json"):
     """创建FastAPI应用
@@ -1062,10 +1524,10 @@ def create_app(config_path: str = "config/webhook_config.json"):
         config_path: 配置文件路径
         
     Returns:
-        FastAPI应用实例
+        ASGI应用实例，启用快速通道时为包在 FastAPI 应用外层的快速通道
     """
     forwarder = WebhookForwarder(config_path)
-    return forwarder.app
+    return forwarder.asgi_app
 
 async def run_server(host: str, port: int, config_path: str):
     """运行服务器
@@ -1099,10 +1561,14 @@ def main():
     
     args = parser.parse_args()
     
-    # 配置日志
-    logger.remove()
-    logger.add(sys.stderr, level=args.log_level)
-    logger.add("logs/webhook_server.log", level="INFO", rotation="10 MB", compression="zip")
+    # 配置日志：写文件、轮转和压缩都在后台线程中进行
+    log_config = None
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            log_config = json.load(f).get("logging")
+    except Exception:
+        pass
+    log_pipeline = configure_logging(log_config, console_level=args.log_level)
     
     # 输出配置信息
     logger.info("启动Webhook转发服务器:")
@@ -1118,7 +1584,9 @@ def main():
         logger.info("服务器已停止")
     except Exception as e:
         logger.error(f"服务器运行出错: {e}")
+        log_pipeline.close()
         sys.exit(1)
+    log_pipeline.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file